@@ -3,6 +3,8 @@ from flask import Blueprint, render_template_string, redirect, url_for, request,
 from flask_login import login_required, current_user
 from app import db
 from app.models import User, Level, UserLevelProgress, GameSession, UserActivity, AdminUser, GameText, LandingVisit, LandingStatsShare
+from app.utils.cache import invalidate_texts
+from app.utils.encryption import compute_hash, decrypt_many, encrypted_raw
 
 bp = Blueprint('custom_admin', __name__)
 
@@ -265,14 +267,15 @@ def users_list():
 
     query = User.query
     if search:
-        query = query.filter(
-            (User.username.ilike(f'%{search}%')) |
-            (User.email.ilike(f'%{search}%'))
-        )
+        # email is encrypted: match through the blind indexes, not ILIKE
+        query = query.filter(User.search_filter(search))
     if city_filter:
         query = query.filter(User.city == city_filter)
 
-    pagination = query.order_by(User.created_at.desc()).paginate(page=page, per_page=25, error_out=False)
+    # Only email is shown: leave verification codes encrypted
+    pagination = query.options(db.defer(User.verification_code)).order_by(
+        User.created_at.desc()
+    ).paginate(page=page, per_page=25, error_out=False)
 
     # Count users by city
     moscow_count = User.query.filter(User.city == 'moscow').count()
@@ -415,6 +418,7 @@ def user_edit(id):
     if request.method == 'POST':
         user.username = request.form.get('username', user.username)
         user.email = request.form.get('email', user.email)
+        user.email_hash = compute_hash(user.email)
         user.city = request.form.get('city', user.city)
         user.is_verified = request.form.get('is_verified') == '1'
         user.total_score = int(request.form.get('total_score', 0))
@@ -1053,6 +1057,7 @@ def text_edit(id):
     if request.method == 'POST':
         t.value = request.form.get('value', t.value)
         db.session.commit()
+        invalidate_texts()
         flash(f'Текст "{t.label}" обновлён', 'success')
         return redirect(url_for('custom_admin.texts_list', section=t.section))
 
@@ -1648,7 +1653,7 @@ def analytics():
     completion_rate = round(quest_completed_users / quest_participants * 100, 1) if quest_participants > 0 else 0
 
     # Promo stats
-    promo_pools = PromoCodePool.query.order_by(PromoCodePool.min_score.desc()).all()
+    promo_pools = PromoCodePool.load_used_codes(PromoCodePool.query.order_by(PromoCodePool.min_score.desc()).all())
     total_promos_issued = sum(p.used_codes for p in promo_pools)
 
     # Registration source breakdown
@@ -3021,6 +3026,24 @@ def public_landing_stats(token):
     return render_public_landing_page(token)
 
 
+def _landing_visitors():
+    """All landing visits, newest first, as (row, ip_address, user_agent).
+
+    Reads the ciphertext columns directly and decrypts them in bulk instead of
+    loading a LandingVisit object (and decrypting) per row.
+    """
+    visits = db.session.execute(
+        db.select(
+            encrypted_raw(LandingVisit.ip_address),
+            encrypted_raw(LandingVisit.user_agent),
+            LandingVisit.city, LandingVisit.region, LandingVisit.country, LandingVisit.created_at
+        ).order_by(LandingVisit.created_at.desc())
+    ).all()
+    ip_addresses = decrypt_many(v.ip_address for v in visits)
+    user_agents = decrypt_many(v.user_agent for v in visits)
+    return list(zip(visits, ip_addresses, user_agents))
+
+
 @bp.route('/public/landing/<token>/export/xlsx')
 def public_landing_export_xlsx(token):
     from flask import Response
@@ -3120,14 +3143,13 @@ def public_landing_export_xlsx(token):
         cell.font = header_text
         cell.fill = header_fill
 
-    all_visits = LandingVisit.query.order_by(LandingVisit.created_at.desc()).all()
-    for i, v in enumerate(all_visits, 2):
+    for i, (v, ip_address, user_agent) in enumerate(_landing_visitors(), 2):
         ws_visitors.cell(row=i, column=1, value=i - 1)
-        ws_visitors.cell(row=i, column=2, value=v.ip_address or '')
+        ws_visitors.cell(row=i, column=2, value=ip_address or '')
         ws_visitors.cell(row=i, column=3, value=v.city or '')
         ws_visitors.cell(row=i, column=4, value=v.region or '')
         ws_visitors.cell(row=i, column=5, value=v.country or '')
-        ws_visitors.cell(row=i, column=6, value=v.user_agent or '')
+        ws_visitors.cell(row=i, column=6, value=user_agent or '')
         ws_visitors.cell(row=i, column=7, value=v.created_at.strftime('%d.%m.%Y %H:%M') if v.created_at else '')
 
     # Auto-width columns
@@ -3329,18 +3351,17 @@ def render_public_landing_page(token):
         </tr>'''
 
     # Detailed visitors table (all visits, no referrer, no seed badge)
-    all_visits = LandingVisit.query.order_by(LandingVisit.created_at.desc()).all()
     visitor_rows = ''
-    for i, v in enumerate(all_visits):
+    for i, (v, ip_address, user_agent) in enumerate(_landing_visitors()):
         city_text = escape(v.city) if v.city else '<span class="dim">—</span>'
         country_text = escape(v.country) if v.country else '<span class="dim">—</span>'
         region_text = escape(v.region) if v.region else '<span class="dim">—</span>'
-        ua_short = escape((v.user_agent or '—')[:80])
-        ua_full = escape(v.user_agent or '')
+        ua_short = escape((user_agent or '—')[:80])
+        ua_full = escape(user_agent or '')
         date_str = v.created_at.strftime('%d.%m.%Y %H:%M') if v.created_at else '—'
         visitor_rows += f'''<tr>
             <td class="row-num">{i + 1}</td>
-            <td><code class="ip-code">{escape(v.ip_address or "—")}</code></td>
+            <td><code class="ip-code">{escape(ip_address or "—")}</code></td>
             <td>{city_text}</td>
             <td>{region_text}</td>
             <td>{country_text}</td>
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template_string, redirect, url_for, request,
 from flask_login import login_required
 from app import db
 from app.models import Level
+from app.utils.cache import invalidate_level_catalog
 
 bp = Blueprint('level_editor', __name__)
 
@@ -764,6 +765,7 @@ def editor(level_id=None):
             level.obstacles = []
 
         db.session.commit()
+        invalidate_level_catalog()
         flash('Уровень сохранён!', 'success')
         return redirect(url_for('level_editor.editor', level_id=level.id))
 
@@ -776,5 +778,6 @@ def delete_level(level_id):
     level = Level.query.get_or_404(level_id)
     db.session.delete(level)
     db.session.commit()
+    invalidate_level_catalog()
     flash('Уровень удалён!', 'success')
     return redirect(url_for('level_editor.editor'))
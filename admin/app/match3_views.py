@@ -67,12 +67,16 @@ def _assign_region_tier(rank: int) -> str:
 
 
 def _get_leaderboard(city: str, limit: int = 100):
-    """Return [(rank, user), ...] for the given city filter."""
+    """Return [(rank, user), ...] for the given city filter.
+
+    Ordered by (total_score, id) like the public leaderboard, so tied players
+    get the same rank here as in the game (ix_users_city_leaderboard).
+    """
     users = User.query.filter(
         User.is_verified == True,
         User.city == city,
         User.total_score > 0,
-    ).order_by(User.total_score.desc()).limit(limit).all()
+    ).order_by(User.total_score.desc(), User.id.desc()).limit(limit).all()
     return list(enumerate(users, start=1))
 
 
@@ -97,17 +101,18 @@ def _claim_code_for_tier(tier: str) -> str | None:
     if not pool:
         return None
 
+    # SKIP LOCKED: don't queue behind game claims locking codes of the same pool.
+    # pool.used_codes is recounted where it's shown, not bumped here.
     code_obj = PromoCode.query.filter(
         PromoCode.pool_id == pool.id,
-        PromoCode.is_used != True,
-    ).with_for_update().first()
+        PromoCode.is_used.is_not(True),
+    ).order_by(PromoCode.id).with_for_update(skip_locked=True).first()
 
     if not code_obj:
         return None
 
     code_obj.is_used = True
     code_obj.used_at = datetime.utcnow()
-    pool.used_codes = (pool.used_codes or 0) + 1
     return code_obj.code
 
 
@@ -346,7 +351,7 @@ def prizes_list():
     total = len(rows)
 
     # Pool status
-    pools = PromoCodePool.query.filter_by(category='match3', is_active=True).all()
+    pools = PromoCodePool.load_used_codes(PromoCodePool.query.filter_by(category='match3', is_active=True).all())
     pool_info = {p.tier: {'name': p.name, 'remaining': p.total_codes - p.used_codes} for p in pools}
 
     def rank_cls(rank):
@@ -606,7 +611,9 @@ def send_all_prizes():
 @require_admin
 def pools_list():
     """Show match3 promo code pools."""
-    pools = PromoCodePool.query.filter_by(category='match3').order_by(PromoCodePool.id).all()
+    pools = PromoCodePool.load_used_codes(
+        PromoCodePool.query.filter_by(category='match3').order_by(PromoCodePool.id).all()
+    )
 
     rows_html = ''
     for p in pools:
@@ -3,7 +3,9 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm.attributes import set_committed_value
 from app.utils.encryption import EncryptedString, compute_hash
+from app.utils.search_index import SEARCH_NGRAM, search_tokens, query_tokens
 
 
 class AdminUser(UserMixin, db.Model):
@@ -43,6 +45,8 @@ class User(db.Model):
     verification_code = db.Column(EncryptedString())
     verification_expires_at = db.Column(db.DateTime)
     total_score = db.Column(db.Integer, default=0)
+    completed_levels = db.Column(db.Integer, default=0)
+    total_stars = db.Column(db.Integer, default=0)
     registration_source = db.Column(db.String(20), default='game')
     quest_score = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -55,6 +59,48 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    @staticmethod
+    def search_filter(query):
+        """Filter for admin search: exact email via email_hash, else substring of email/username.
+
+        Looks up the user_search_tokens blind index instead of decrypting emails;
+        trigram matches can rarely include a row where the trigrams aren't adjacent.
+        The index only holds 1-2 char prefixes, so shorter queries match emails by
+        prefix and usernames (not encrypted) by plain ILIKE.
+        """
+        tokens = query_tokens(query)
+        matches = db.select(UserSearchToken.user_id).where(
+            UserSearchToken.token.in_(tokens)
+        ).group_by(UserSearchToken.user_id).having(
+            db.func.count() == len(tokens)
+        )
+        conditions = [User.email_hash == compute_hash(query), User.id.in_(matches)]
+        if len(query.strip()) < SEARCH_NGRAM:
+            conditions.append(User.username.ilike(f'%{query.strip()}%'))
+        return db.or_(*conditions)
+
+
+class UserSearchToken(db.Model):
+    """Blind search index over users' email and username (kept by the hooks below)"""
+    __tablename__ = 'user_search_tokens'
+
+    token = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'),
+                        primary_key=True, autoincrement=False, index=True)
+
+
+@db.event.listens_for(User, 'after_insert')
+@db.event.listens_for(User, 'after_update')
+def _reindex_user_search(mapper, connection, user):
+    attrs = db.inspect(user).attrs
+    if not (attrs.email.history.has_changes() or attrs.username.history.has_changes()):
+        return
+    table = UserSearchToken.__table__
+    connection.execute(table.delete().where(table.c.user_id == user.id))
+    tokens = search_tokens(user.email, user.username)
+    if tokens:
+        connection.execute(table.insert(), [{'token': token, 'user_id': user.id} for token in tokens])
+
 
 class Level(db.Model):
     """Game levels"""
@@ -225,6 +271,36 @@ class PromoCodePool(db.Model):
     def is_low(self):
         return self.remaining_codes < self.alert_threshold
 
+    @classmethod
+    def reconcile_used_codes(cls, pool_ids=None):
+        """Recount used_codes from promo_codes and commit (after admin edits to codes)."""
+        used = db.select(db.func.count(PromoCode.id)).where(
+            PromoCode.pool_id == cls.id,
+            PromoCode.is_used == True,
+        ).correlate(cls).scalar_subquery()
+        stmt = db.update(cls).values(used_codes=used)
+        if pool_ids is not None:
+            stmt = stmt.where(cls.id.in_(pool_ids))
+        db.session.execute(stmt)
+        db.session.commit()
+
+    @classmethod
+    def load_used_codes(cls, pools):
+        """Set used_codes of loaded pools from promo_codes, without writing anything.
+
+        Game claims don't bump the stored counter (the backend recounts it every
+        few seconds), so pages showing it count the codes themselves.
+        """
+        if not pools:
+            return pools
+        counts = dict(db.session.query(PromoCode.pool_id, db.func.count(PromoCode.id)).filter(
+            PromoCode.pool_id.in_([pool.id for pool in pools]),
+            PromoCode.is_used == True,
+        ).group_by(PromoCode.pool_id).all())
+        for pool in pools:
+            set_committed_value(pool, 'used_codes', counts.get(pool.id, 0))
+        return pools
+
     def __repr__(self):
         return f'<PromoCodePool {self.name}>'
 
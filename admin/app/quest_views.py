@@ -8,7 +8,8 @@ from functools import wraps
 from datetime import datetime
 from app import db, mail
 from app.models import QuestPage, QuestProgress, PromoCodePool, PromoCode, User
-from app.utils.encryption import compute_hash
+from app.utils.cache import invalidate_quest_catalog, invalidate_quest_progress
+from app.utils.encryption import compute_hash, decrypt_many, encrypted_raw
 from sqlalchemy import func, distinct
 import segno
 import base64
@@ -440,6 +441,7 @@ def quest_pages_create():
 
             db.session.add(page)
             db.session.commit()
+            invalidate_quest_catalog()
 
             flash('Страница квеста создана!', 'success')
             return redirect(url_for('quest_admin.quest_pages_list'))
@@ -555,6 +557,7 @@ def quest_pages_edit(id):
             page.updated_at = datetime.utcnow()
 
             db.session.commit()
+            invalidate_quest_catalog()
 
             flash('Страница квеста обновлена!', 'success')
             return redirect(url_for('quest_admin.quest_pages_list'))
@@ -632,6 +635,7 @@ def quest_pages_delete(id):
     try:
         db.session.delete(page)
         db.session.commit()
+        invalidate_quest_catalog()
         flash('Страница квеста удалена!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -645,7 +649,7 @@ def quest_pages_delete(id):
 @require_role('quest_admin', 'superadmin')
 def promo_pools_list():
     """List all promo code pools with stats"""
-    pools = PromoCodePool.query.order_by(PromoCodePool.min_score).all()
+    pools = PromoCodePool.load_used_codes(PromoCodePool.query.order_by(PromoCodePool.min_score).all())
 
     content = '''
     <div class="page-header">
@@ -746,9 +750,13 @@ def promo_pools_list():
 def promo_codes_view(pool_id):
     """View codes in a specific pool"""
     pool = PromoCodePool.query.get_or_404(pool_id)
+    PromoCodePool.load_used_codes([pool])
     page = request.args.get('page', 1, type=int)
 
-    pagination = PromoCode.query.filter_by(pool_id=pool_id).order_by(
+    # Load the page's users in the same query, decrypting only their email
+    pagination = PromoCode.query.filter_by(pool_id=pool_id).options(
+        db.joinedload(PromoCode.used_by).load_only(User.id, User.email)
+    ).order_by(
         PromoCode.is_used.asc(),
         PromoCode.created_at.desc()
     ).paginate(page=page, per_page=25, error_out=False)
@@ -1044,6 +1052,14 @@ def quest_progress_list():
         User.quest_score.desc()
     ).paginate(page=page, per_page=25, error_out=False)
 
+    # Claimed promo codes for the whole page in one query, decrypted together
+    claimed = db.session.execute(
+        db.select(PromoCode.used_by_user_id, encrypted_raw(PromoCode.code))
+        .where(PromoCode.used_by_user_id.in_([row.id for row in pagination.items]))
+        .order_by(PromoCode.id.desc())
+    ).all()
+    promo_codes = dict(zip((c.used_by_user_id for c in claimed), decrypt_many(c.code for c in claimed)))
+
     # Total stats
     total_participants = db.session.query(func.count(func.distinct(QuestProgress.user_id))).scalar() or 0
     total_answers = QuestProgress.query.count()
@@ -1117,9 +1133,9 @@ def quest_progress_list():
         correct = row.correct_count or 0
         skipped = row.skipped_count or 0
 
-        # Get promo code if claimed
-        promo = PromoCode.query.filter_by(used_by_user_id=user_id).first()
-        promo_display = f'<span class="badge badge-success">{promo.code}</span>' if promo else '<span class="text-muted">—</span>'
+        # Promo code if claimed
+        promo_code = promo_codes.get(user_id)
+        promo_display = f'<span class="badge badge-success">{promo_code}</span>' if promo_code else '<span class="text-muted">—</span>'
 
         source_badge = 'badge-info' if source == 'quest' else 'badge-warning'
 
@@ -1181,15 +1197,16 @@ def quest_progress_reset(user_id):
 
         # Release any claimed promo codes
         claimed_codes = PromoCode.query.filter_by(used_by_user_id=user_id).all()
+        pool_ids = {code.pool_id for code in claimed_codes}
         for code in claimed_codes:
-            pool = PromoCodePool.query.get(code.pool_id)
             code.is_used = False
             code.used_by_user_id = None
             code.used_at = None
-            if pool and pool.used_codes > 0:
-                pool.used_codes -= 1
 
         db.session.commit()
+        invalidate_quest_progress(user_id)
+        if pool_ids:
+            PromoCodePool.reconcile_used_codes(pool_ids)
 
         flash(f'Прогресс квеста для {user.username or user.email} сброшен!', 'success')
     except Exception as e:
@@ -0,0 +1,68 @@
+"""
+Cache invalidation for the game backend.
+
+The backend keeps some rarely changing data (level and quest page catalogs,
+UI texts) in each worker's memory and reloads it when a version key in Redis
+moves.
+The admin bumps those keys after committing an edit.
+"""
+import os
+
+try:
+    import redis
+except ImportError:  # without Redis the backend caches just expire on their own
+    redis = None
+
+LEVEL_CATALOG_VERSION_KEY = "levels:version"
+TEXTS_VERSION_KEY = "texts:version"
+QUEST_CATALOG_VERSION_KEY = "quest_pages:version"
+QUEST_PROGRESS_PREFIX = "quest_progress:"
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None and redis is not None and os.environ.get('REDIS_URL'):
+        _client = redis.from_url(os.environ['REDIS_URL'], socket_timeout=2)
+    return _client
+
+
+def bump_version(key: str) -> bool:
+    client = _get_client()
+    if not client:
+        return False
+    try:
+        client.incr(key)
+        return True
+    except Exception as e:
+        print(f"Redis error bumping {key}: {e}")
+        return False
+
+
+def invalidate_level_catalog() -> bool:
+    """Make backend workers reload levels (call after the change is committed)"""
+    return bump_version(LEVEL_CATALOG_VERSION_KEY)
+
+
+def invalidate_texts() -> bool:
+    """Make backend workers re-serve /api/texts (call after the change is committed)"""
+    return bump_version(TEXTS_VERSION_KEY)
+
+
+def invalidate_quest_catalog() -> bool:
+    """Make backend workers reload quest pages (call after the change is committed)"""
+    return bump_version(QUEST_CATALOG_VERSION_KEY)
+
+
+def invalidate_quest_progress(user_id: int) -> bool:
+    """Drop a user's quest progress bitmap after editing their quest_progress rows"""
+    client = _get_client()
+    if not client:
+        return False
+    try:
+        client.delete(f"{QUEST_PROGRESS_PREFIX}{user_id}")
+        return True
+    except Exception as e:
+        print(f"Redis error dropping quest progress: {e}")
+        return False
@@ -4,17 +4,25 @@ Mirror of backend/app/utils/encryption.py for admin panel.
 """
 import hashlib
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
-from cryptography.fernet import Fernet, InvalidToken
-from sqlalchemy import Text
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import Text, type_coerce
 from sqlalchemy.types import TypeDecorator
 
 
+@lru_cache(maxsize=8)
+def _build_fernet(key: str, old_keys: str = ''):
+    fernets = [Fernet(k.strip().encode()) for k in [key, *old_keys.split(',')] if k.strip()]
+    return MultiFernet(fernets) if len(fernets) > 1 else fernets[0]
+
+
 def _get_fernet():
     key = os.environ.get('ENCRYPTION_KEY')
     if not key:
         return None
-    return Fernet(key.encode() if isinstance(key, str) else key)
+    return _build_fernet(key, os.environ.get('ENCRYPTION_OLD_KEYS', ''))
 
 
 def encrypt(value: str) -> str:
@@ -26,18 +34,50 @@ def encrypt(value: str) -> str:
     return f.encrypt(value.encode('utf-8')).decode('utf-8')
 
 
-def decrypt(value: str) -> str:
+def _decrypt_with(f, value: str) -> str:
     if not value:
         return value
-    f = _get_fernet()
-    if not f:
-        return value
     try:
         return f.decrypt(value.encode('utf-8')).decode('utf-8')
     except InvalidToken:
         return value
 
 
+def decrypt(value: str) -> str:
+    f = _get_fernet()
+    if not f:
+        return value
+    return _decrypt_with(f, value)
+
+
+# Bulk decryption for list pages and exports
+DECRYPT_PARALLEL_MIN = 2000   # below this, decrypt on the request thread
+DECRYPT_CHUNK = 500
+DECRYPT_WORKERS = int(os.environ.get('DECRYPT_WORKERS', 4))
+
+
+def encrypted_raw(column):
+    """Select an EncryptedString column as stored, skipping per-row decryption (see decrypt_many)."""
+    return type_coerce(column, Text).label(column.key)
+
+
+def decrypt_many(values) -> list:
+    """Decrypt a column's worth of values with one cipher, in a worker pool for large exports."""
+    values = list(values)
+    f = _get_fernet()
+    if not f:
+        return values
+
+    def run(chunk):
+        return [_decrypt_with(f, value) for value in chunk]
+
+    if len(values) < DECRYPT_PARALLEL_MIN or DECRYPT_WORKERS < 2:
+        return run(values)
+    chunks = [values[i:i + DECRYPT_CHUNK] for i in range(0, len(values), DECRYPT_CHUNK)]
+    with ThreadPoolExecutor(max_workers=DECRYPT_WORKERS) as pool:
+        return [value for chunk in pool.map(run, chunks) for value in chunk]
+
+
 def compute_hash(value: str) -> str:
     if not value:
         return ''
@@ -4,6 +4,7 @@ from flask import redirect, url_for
 from markupsafe import Markup
 from wtforms import TextAreaField
 from wtforms.widgets import TextArea
+from app.utils.cache import invalidate_level_catalog
 import json
 
 
@@ -102,6 +103,12 @@ class LevelModelView(SecureModelView):
         'is_active': 'Активен'
     }
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_level_catalog()
+
+    def after_model_delete(self, model):
+        invalidate_level_catalog()
+
 
 class UserProgressView(SecureModelView):
     """View for user progress"""
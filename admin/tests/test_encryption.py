@@ -0,0 +1,23 @@
+import pytest
+from cryptography.fernet import Fernet
+from app.utils import encryption
+from app.utils.encryption import decrypt_many, encrypt
+
+
+class TestDecryptMany:
+    """Tests for bulk decryption used by list pages and exports"""
+
+    @pytest.fixture(autouse=True)
+    def key(self, monkeypatch):
+        monkeypatch.setenv('ENCRYPTION_KEY', Fernet.generate_key().decode())
+
+    def test_small_batch(self):
+        """Test that values, legacy plaintext and empties come back in order"""
+        assert decrypt_many([encrypt('1.2.3.4'), 'plain', None, '']) == ['1.2.3.4', 'plain', None, '']
+
+    def test_worker_pool_keeps_order(self, monkeypatch):
+        """Test that a batch split across workers is reassembled in order"""
+        monkeypatch.setattr(encryption, 'DECRYPT_PARALLEL_MIN', 10)
+        monkeypatch.setattr(encryption, 'DECRYPT_CHUNK', 3)
+        values = [f'agent-{i}' for i in range(25)]
+        assert decrypt_many(encrypt(v) for v in values) == values
@@ -8,6 +8,7 @@ from flask_mail import Mail
 from flask_jwt_extended import JWTManager
 from werkzeug.middleware.proxy_fix import ProxyFix
 from prometheus_flask_exporter import PrometheusMetrics
+import click
 import redis
 import os
 
@@ -52,6 +53,11 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER')
 
+    # Activity log rows are written in batches by a background thread
+    app.config['ACTIVITY_LOG_BUFFERED'] = os.environ.get('ACTIVITY_LOG_BUFFERED', 'true').lower() == 'true'
+    # Monthly user_activities partitions older than this are dropped (0 = keep forever)
+    app.config['ACTIVITY_RETENTION_MONTHS'] = int(os.environ.get('ACTIVITY_RETENTION_MONTHS', 12))
+
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
@@ -80,7 +86,8 @@ def create_app():
     redis_url = os.environ.get('REDIS_URL')
     if redis_url:
         try:
-            redis_client = redis.from_url(redis_url)
+            # Short timeouts: a hung Redis should trip the circuit breaker, not stall requests
+            redis_client = redis.from_url(redis_url, socket_connect_timeout=1, socket_timeout=2)
             redis_client.ping()
             print("Redis connected successfully")
 
@@ -101,6 +108,41 @@ def create_app():
     app.register_blueprint(texts.bp, url_prefix='/api/texts')
     app.register_blueprint(landing.bp, url_prefix='/api/landing')
 
+    @app.cli.command('activity-partitions')
+    def activity_partitions():
+        """Create upcoming user_activities partitions and drop expired ones."""
+        from app.services.activity_log import maintain_activity_partitions
+        result = maintain_activity_partitions()
+        print(f"Activity partitions created: {result['created']}, dropped: {result['dropped']}")
+
+    @app.cli.command('reencrypt')
+    @click.option('--batch-size', default=1000, show_default=True)
+    @click.option('--restart', is_flag=True, help='Ignore saved progress and scan every row again.')
+    def reencrypt_command(batch_size, restart):
+        """Re-encrypt stored values under the current ENCRYPTION_KEY (after key rotation)."""
+        from app.services.reencryption import reencrypt_all
+        reencrypt_all(batch_size=batch_size, restart=restart)
+
+    @app.cli.command('search-index')
+    @click.option('--rebuild', is_flag=True, help='Re-index every user (e.g. after changing HASH_PEPPER).')
+    def search_index_command(rebuild):
+        """Fill the admin user search index for users not indexed yet."""
+        from app.services.user_search import backfill_user_search
+        print(f"User search index: {backfill_user_search(rebuild=rebuild)} users indexed")
+
+    @app.cli.command('jwt-blocklist-backfill')
+    def jwt_blocklist_backfill_command():
+        """Add revocations stored only as per-token keys to the JWT blocklist log."""
+        from app.utils.redis_cache import backfill_blocklist_log
+        print(f"JWT blocklist: {backfill_blocklist_log()} revocations added to the log")
+
+    @app.cli.command('promo-reconcile')
+    def promo_reconcile_command():
+        """Recount promo_code_pools.used_codes from the codes themselves."""
+        from app.services.promo_dispenser import reconcile_pool_counters
+        reconcile_pool_counters()
+        print("Promo pool counters reconciled")
+
     # Health check
     @app.route('/api/health')
     def health():
@@ -8,7 +8,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 
 from app import db
-from app.models.user import User
+from app.models.user import User, ANONYMIZED_PASSWORD_HASH
 from app.models.user_activity import log_activity
 from app.services.email import send_verification_email
 from app.utils.encryption import compute_hash
@@ -302,26 +302,29 @@ def delete_account():
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    # Log before anonymization
-    log_activity(user_id, 'account_delete_request', request=request)
+    # Log before anonymization (no IP/user agent: they are wiped right below anyway)
+    log_activity(user_id, 'account_delete_request')
 
     # Anonymize user PII
     anonymous_email = f'deleted_{user_id}@anonymized.local'
     user.set_email(anonymous_email)
     user.username = f'deleted_{user_id}'
-    user.password_hash = 'DELETED'
+    user.password_hash = ANONYMIZED_PASSWORD_HASH
     user.city_name = None
     user.verification_code = None
     user.verification_expires_at = None
     user.is_verified = False
 
-    # Anonymize activity logs for this user
+    db.session.commit()
+
+    # Anonymize activity logs for this user. Only after the commit above: events
+    # still queued in any worker are scrubbed by the writer once it sees the
+    # anonymized account (activity_log._scrub_anonymized)
     from app.models.user_activity import UserActivity
     UserActivity.query.filter_by(user_id=user_id).update({
         'ip_address': None,
         'user_agent': None,
     })
-
     db.session.commit()
 
     # Revoke current token so deleted account can't keep accessing API
@@ -329,4 +332,8 @@ def delete_account():
     jti = get_jwt()['jti']
     blocklist_token(jti)
 
+    # Anonymized accounts are no longer ranked
+    from app.services.leaderboard import remove_user
+    remove_user(user_id)
+
     return jsonify({'message': 'Account data has been anonymized'})
@@ -1,17 +1,17 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models.level import Level
 from app.models.game_session import GameSession
 from app.models.user_progress import UserLevelProgress
 from app.models.user import User
 from app.models.user_activity import log_activity
 from app.utils.timezone import now_moscow
 from app.utils.redis_cache import (
-    store_game_session, get_game_session, delete_game_session,
-    validate_game_session, get_active_sessions_count,
-    rate_limit, invalidate_leaderboard
+    store_game_session, consume_game_session, get_active_sessions_count,
+    rate_limit, bump_leaderboard_version
 )
+from app.services.leaderboard import update_user_score, record_weekly_score
+from app.services.level_catalog import get_level
 
 bp = Blueprint('game', __name__)
 
@@ -28,7 +28,7 @@ def start_game():
     if not level_id:
         return jsonify({'error': 'level_id is required'}), 400
 
-    level = Level.query.get(level_id)
+    level = get_level(level_id)
     if not level or not level.is_active:
         return jsonify({'error': 'Level not found'}), 404
 
@@ -56,7 +56,7 @@ def start_game():
 
     return jsonify({
         'session_id': session.id,
-        'level': level.to_dict()
+        'level': level.data
     })
 
 
@@ -83,19 +83,16 @@ def complete_game():
     if not session_id:
         return jsonify({'error': 'session_id is required'}), 400
 
-    # Validate session in Redis (anti-cheat) — FAIL CLOSED
-    is_valid, error_msg = validate_game_session(session_id, user_id)
-    if not is_valid:
+    # Validate and consume the session in Redis in one step (anti-cheat).
+    # Only one complete per session gets past this, however many arrive at once;
+    # without Redis the session row is checked and the update below consumes it.
+    session_state, error_msg = consume_game_session(session_id, user_id)
+    if not session_state:
         return jsonify({'error': error_msg}), 400
 
-    session = GameSession.query.get(session_id)
-    if not session or session.user_id != user_id:
-        return jsonify({'error': 'Session not found'}), 404
-
-    if session.is_completed:
-        return jsonify({'error': 'Session already completed'}), 400
-
-    level = Level.query.get(session.level_id)
+    level = get_level(session_state['level_id'])
+    if not level:
+        return jsonify({'error': 'Level not found'}), 404
 
     # === ANTI-CHEAT: Server-side validation of all client-submitted values ===
 
@@ -120,13 +117,8 @@ def complete_game():
         sanitized_targets['collect'] = sanitized_collect
     targets_met = sanitized_targets
 
-    # 4. Enforce maximum score per level
-    # Max score formula: min_score * 3 (generous cap covering 3-star + bonuses)
-    min_score_target = level.targets.get('min_score', 1000) if level.targets else 1000
-    max_allowed_score = min_score_target * 3
-    # Also cap based on grid: max theoretical = grid_cells * max_moves * 100
-    grid_cap = level.grid_width * level.grid_height * level.max_moves * 100
-    max_allowed_score = min(max_allowed_score, grid_cap)
+    # 4. Enforce maximum score per level (precomputed in the level catalog)
+    max_allowed_score = level.max_score
 
     score = max(0, min(int(raw_score), max_allowed_score))
 
@@ -144,60 +136,64 @@ def complete_game():
     # Calculate stars
     stars = calculate_stars(level.targets, score, targets_met) if is_won else 0
 
-    # Update session
-    session.score = score
-    session.moves_used = moves_used
-    session.targets_met = targets_met
-    session.duration_seconds = duration_seconds
-    session.is_completed = True
-    session.is_won = is_won
-
-    # Always update user progress (track attempts and best score even for losses)
-    progress = UserLevelProgress.query.filter_by(
-        user_id=user_id,
-        level_id=level.id
-    ).first()
-
-    if not progress:
-        progress = UserLevelProgress(
-            user_id=user_id,
-            level_id=level.id,
-            attempts_count=0,
-            best_score=0,
-            stars=0
-        )
-        db.session.add(progress)
-
-    progress.attempts_count += 1
+    # Record the result (the is_completed guard consumes sessions checked without Redis)
+    session = db.session.execute(
+        db.update(GameSession).where(
+            GameSession.id == session_id,
+            GameSession.user_id == user_id,
+            GameSession.is_completed == False
+        ).values(
+            score=score,
+            moves_used=moves_used,
+            targets_met=targets_met,
+            duration_seconds=duration_seconds,
+            is_completed=True,
+            is_won=is_won
+        ).returning(GameSession)
+    ).scalar_one_or_none()
+    if not session:
+        return jsonify({'error': 'Session already completed'}), 400
 
-    # Cap best_score at max_allowed_score
-    if score > progress.best_score:
-        progress.best_score = min(score, max_allowed_score)
+    # Lock the user row (serializes this user's completes) and read the level's old progress
+    row = db.session.query(
+        User,
+        UserLevelProgress.best_score,
+        UserLevelProgress.stars,
+        UserLevelProgress.completed_at
+    ).outerjoin(
+        UserLevelProgress,
+        db.and_(UserLevelProgress.user_id == User.id, UserLevelProgress.level_id == level.id)
+    ).filter(
+        User.id == user_id
+    ).with_for_update(of=User).populate_existing().one_or_none()
+    if row is None:
+        db.session.rollback()
+        return jsonify({'error': 'User not found'}), 404
+    user, old_best, old_stars, old_completed_at = row
 
-    if is_won:
-        if stars > progress.stars:
-            progress.stars = stars
-
-        if not progress.completed_at:
-            progress.completed_at = now_moscow()
-
-    # Update user's total score
-    user = User.query.get(user_id)
-    if user:
-        total = db.session.query(
-            db.func.sum(UserLevelProgress.best_score)
-        ).filter(
-            UserLevelProgress.user_id == user_id
-        ).scalar() or 0
-        user.total_score = total
+    # Always update user progress (track attempts and best score even for losses)
+    db.session.execute(_progress_upsert(
+        user_id, level.id, score, stars, now_moscow() if is_won else None
+    ))
+
+    # Apply only what changed to the user's totals (and the row fields shown on the leaderboard)
+    score_delta = max(score - (old_best or 0), 0)
+    stars_delta = max(stars - (old_stars or 0), 0)
+    newly_completed = 1 if is_won and not old_completed_at else 0
+    if score_delta or stars_delta or newly_completed:
+        user.total_score = User.total_score + score_delta
+        user.completed_levels = User.completed_levels + newly_completed
+        user.total_stars = User.total_stars + stars_delta
 
     db.session.commit()
 
-    # Clean up Redis session
-    delete_game_session(session_id)
+    # Push the new total into the live leaderboard
+    update_user_score(user)
+    if is_won:
+        record_weekly_score(user_id, level.id, score, session.created_at)
 
-    # Invalidate leaderboard cache (score may have changed)
-    invalidate_leaderboard()
+    # Start a new leaderboard cache generation (coalesced, score may have changed)
+    bump_leaderboard_version()
 
     # Log activity
     log_activity(user_id, 'complete_game', {
@@ -224,6 +220,39 @@ def complete_game():
     })
 
 
+def _progress_upsert(user_id: int, level_id: int, score: int, stars: int, completed_at):
+    """INSERT ... ON CONFLICT DO UPDATE for one attempt at a level.
+
+    Counts the attempt and keeps the best score/stars and the first completion
+    time in a single statement, whichever worker gets there first.
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        greatest = db.func.greatest
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+        greatest = db.func.max  # SQLite's multi-argument max() is GREATEST
+
+    table = UserLevelProgress.__table__
+    stmt = insert(table).values(
+        user_id=user_id,
+        level_id=level_id,
+        attempts_count=1,
+        best_score=score,
+        stars=stars,
+        completed_at=completed_at
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.level_id],
+        set_={
+            'attempts_count': table.c.attempts_count + 1,
+            'best_score': greatest(table.c.best_score, stmt.excluded.best_score),
+            'stars': greatest(table.c.stars, stmt.excluded.stars),
+            'completed_at': db.func.coalesce(table.c.completed_at, stmt.excluded.completed_at),
+        }
+    )
+
+
 def calculate_completion(targets: dict, met: dict, score: int) -> dict:
     """
     Calculate completion percentage for each category and overall.
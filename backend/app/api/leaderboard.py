@@ -1,39 +1,91 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import and_, or_
 from app import db
 from app.models.user import User
-from app.models.user_progress import UserLevelProgress
-from app.utils.timezone import now_moscow
-from app.utils.redis_cache import get_cached_leaderboard, cache_leaderboard, rate_limit
-from datetime import timedelta
+from app.utils.redis_cache import get_or_build_leaderboard, rate_limit
+from app.services import leaderboard as live_leaderboard
 
 bp = Blueprint('leaderboard', __name__)
 
+# Exactly what ix_users_leaderboard / ix_users_city_leaderboard hold, so board
+# pages are index-only scans (a full User would also read the encrypted email)
+BOARD_COLUMNS = (User.id, User.username, User.total_score, User.completed_levels, User.total_stars, User.city)
+
 
 @bp.route('', methods=['GET'])
 @rate_limit(60, 60)  # 60 requests per minute
 def get_global_leaderboard():
-    """Get global leaderboard by total score (cached for 60 seconds)
+    """Get global leaderboard by total score
+
+    Served from the live Redis sorted sets; falls back to SQL (cached for
+    60 seconds) when Redis is unavailable.
 
     Query params:
     - limit: max number of results (default 100)
     - city: filter by region - 'moscow' or 'region' (optional, returns all if not specified)
+    - cursor: `next_cursor` from the previous page (optional)
     """
     limit = min(request.args.get('limit', 100, type=int), 500)
     city = request.args.get('city', None)
+    try:
+        after = _parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
 
     # Validate city filter
     if city and city not in ('moscow', 'region'):
         city = None
 
-    # Try cache first
-    cache_key = f"global:{limit}:{city or 'all'}"
-    cached = get_cached_leaderboard(cache_key)
+    # Live sorted-set boards first
+    rows = live_leaderboard.get_top(city or 'global', limit, after)
+    if rows is not None:
+        return jsonify({'leaderboard': rows, 'next_cursor': _next_cursor(rows, limit, 'total_score')})
+
+    # Deeper pages are a keyset seek on the covering index — no caching needed
+    if after:
+        result = _build_global_rows(limit, city, after)
+        return jsonify({'leaderboard': result, 'next_cursor': _next_cursor(result, limit, 'total_score')})
+
+    # SQL fallback — cached, one worker rebuilds at a time
+    result, cached = get_or_build_leaderboard(
+        f"global:{limit}:{city or 'all'}",
+        lambda: _build_global_rows(limit, city),
+        soft_ttl=60
+    )
+    next_cursor = _next_cursor(result, limit, 'total_score')
     if cached:
-        return jsonify({'leaderboard': cached, 'cached': True})
+        return jsonify({'leaderboard': result, 'next_cursor': next_cursor, 'cached': True})
+
+    return jsonify({'leaderboard': result, 'next_cursor': next_cursor})
+
+
+def _parse_cursor(raw: str | None) -> tuple[int, int, int] | None:
+    """Decode a 'score:user_id:rank' page cursor; raises ValueError if malformed"""
+    if not raw:
+        return None
+    score, user_id, rank = (int(part) for part in raw.split(':'))
+    if user_id <= 0 or rank <= 0:
+        raise ValueError(raw)
+    return score, user_id, rank
+
+
+def _next_cursor(rows: list, limit: int, score_field: str) -> str | None:
+    """Cursor for the page after `rows` — None once a short page shows the end"""
+    if len(rows) < limit or not rows:
+        return None
+    last = rows[-1]
+    return f"{last[score_field]}:{last['user_id']}:{last['rank']}"
+
+
+def _build_global_rows(limit: int, city: str = None, after: tuple = None) -> list:
+    """Global leaderboard rows straight from Postgres
 
-    # Build query
-    query = User.query.filter(
+    Ordered by (total_score, id) descending, so `after` — the cursor of the
+    previous page — turns into a keyset seek on ix_users_leaderboard instead
+    of an OFFSET scan.
+    """
+    query = db.session.query(*BOARD_COLUMNS).filter(
         User.is_verified == True,
         User.total_score > 0
     )
@@ -42,57 +94,80 @@ def get_global_leaderboard():
     if city:
         query = query.filter(User.city == city)
 
+    first_rank = 1
+    if after:
+        score, user_id, rank = after
+        query = query.filter(or_(
+            User.total_score < score,
+            and_(User.total_score == score, User.id < user_id)
+        ))
+        first_rank = rank + 1
+
     users = query.order_by(
-        User.total_score.desc()
+        User.total_score.desc(),
+        User.id.desc()
     ).limit(limit).all()
 
-    result = []
-    for idx, user in enumerate(users, 1):
-        # Get completed levels count
-        completed_levels = UserLevelProgress.query.filter(
-            UserLevelProgress.user_id == user.id,
-            UserLevelProgress.completed_at.isnot(None)
-        ).count()
-
-        # Get total stars
-        total_stars = db.session.query(
-            db.func.sum(UserLevelProgress.stars)
-        ).filter(
-            UserLevelProgress.user_id == user.id
-        ).scalar() or 0
-
-        result.append({
-            'rank': idx,
-            'user_id': user.id,
-            'username': user.username,
-            'total_score': user.total_score,
-            'completed_levels': completed_levels,
-            'total_stars': total_stars,
-            'city': user.city
-        })
+    # completed_levels / total_stars are denormalized on User — one query per build
+    return [_user_row(idx, user) for idx, user in enumerate(users, first_rank)]
 
-    # Cache result for 60 seconds
-    cache_leaderboard(cache_key, result, ttl=60)
 
-    return jsonify({'leaderboard': result})
+def _user_row(rank: int, user) -> dict:
+    """Board row from a User or a BOARD_COLUMNS row"""
+    return {
+        'rank': rank,
+        'user_id': user.id,
+        'username': user.username,
+        'total_score': user.total_score,
+        'completed_levels': user.completed_levels or 0,
+        'total_stars': user.total_stars or 0,
+        'city': user.city
+    }
 
 
 @bp.route('/weekly', methods=['GET'])
 @rate_limit(60, 60)  # 60 requests per minute
 def get_weekly_leaderboard():
-    """Get weekly leaderboard based on scores earned this week (cached for 2 minutes)"""
-    limit = min(request.args.get('limit', 100, type=int), 500)
+    """Get weekly leaderboard based on scores earned this week
 
-    # Try cache first
-    cache_key = f"weekly:{limit}"
-    cached = get_cached_leaderboard(cache_key)
+    Served from the week's Redis sorted set (kept up to date by complete_game);
+    falls back to SQL (cached for 2 minutes) when Redis is unavailable.
+
+    Query params:
+    - limit: max number of results (default 100)
+    - cursor: `next_cursor` from the previous page (optional)
+    """
+    limit = min(request.args.get('limit', 100, type=int), 500)
+    try:
+        after = _parse_cursor(request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    rows = live_leaderboard.get_weekly_top(limit, after)
+    if rows is not None:
+        return jsonify({'leaderboard': rows, 'next_cursor': _next_cursor(rows, limit, 'weekly_score')})
+
+    if after:
+        result = _build_weekly_rows(limit, after)
+        return jsonify({'leaderboard': result, 'next_cursor': _next_cursor(result, limit, 'weekly_score')})
+
+    # SQL fallback — cached, one worker rebuilds at a time
+    result, cached = get_or_build_leaderboard(
+        f"weekly:{limit}",
+        lambda: _build_weekly_rows(limit),
+        soft_ttl=120
+    )
+    next_cursor = _next_cursor(result, limit, 'weekly_score')
     if cached:
-        return jsonify({'leaderboard': cached, 'cached': True})
+        return jsonify({'leaderboard': result, 'next_cursor': next_cursor, 'cached': True})
+
+    return jsonify({'leaderboard': result, 'next_cursor': next_cursor})
 
-    # Calculate start of current week (Monday)
-    today = now_moscow()
-    start_of_week = today - timedelta(days=today.weekday())
-    start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def _build_weekly_rows(limit: int, after: tuple = None) -> list:
+    """Weekly leaderboard rows straight from game_sessions"""
+    # Start of current week (Monday 00:00 Moscow)
+    start_of_week = live_leaderboard.week_start()
 
     # Get best score per level per user this week (prevents farming via repeated plays)
     from app.models.game_session import GameSession
@@ -110,72 +185,182 @@ def get_weekly_leaderboard():
         GameSession.level_id
     ).subquery()
 
-    # Sum of best scores across levels per user
-    weekly_scores = db.session.query(
+    # Sum of best scores across levels per verified user, ordered by (weekly_score, user_id)
+    weekly_score = db.func.sum(best_per_level.c.best_score)
+    query = db.session.query(
         best_per_level.c.user_id,
-        db.func.sum(best_per_level.c.best_score).label('weekly_score')
+        User.username,
+        weekly_score.label('weekly_score')
+    ).join(
+        User, User.id == best_per_level.c.user_id
+    ).filter(
+        User.is_verified == True
     ).group_by(
-        best_per_level.c.user_id
-    ).order_by(
-        db.desc('weekly_score')
-    ).limit(limit).all()
+        best_per_level.c.user_id,
+        User.username
+    )
 
-    result = []
-    for idx, (user_id, weekly_score) in enumerate(weekly_scores, 1):
-        user = User.query.get(user_id)
-        if user and user.is_verified:
-            result.append({
-                'rank': idx,
-                'user_id': user_id,
-                'username': user.username,
-                'weekly_score': weekly_score
-            })
+    first_rank = 1
+    if after:
+        score, user_id, rank = after
+        query = query.having(or_(
+            weekly_score < score,
+            and_(weekly_score == score, best_per_level.c.user_id < user_id)
+        ))
+        first_rank = rank + 1
+
+    weekly_scores = query.order_by(
+        db.desc('weekly_score'),
+        best_per_level.c.user_id.desc()
+    ).limit(limit).all()
 
-    # Cache result for 2 minutes
-    cache_leaderboard(cache_key, result, ttl=120)
+    return [
+        {
+            'rank': idx,
+            'user_id': user_id,
+            'username': username,
+            'weekly_score': weekly_score
+        }
+        for idx, (user_id, username, weekly_score) in enumerate(weekly_scores, first_rank)
+    ]
+
+
+def _sql_rank(user, city: str = None) -> tuple[int, int]:
+    """Rank and player count via COUNT queries (fallback when Redis is down)"""
+    score = user.total_score or 0
+    query = User.query.filter(User.is_verified == True)
+    if city:
+        query = query.filter(User.city == city)
 
-    return jsonify({'leaderboard': result})
+    # Rank - the user's position on the board (ties by id, as in the pages and
+    # /around-me), or 1 + the players above for a user who is not on it
+    on_board = user.is_verified and score > 0 and (not city or user.city == city)
+    ahead = User.total_score > score
+    if on_board:
+        ahead = or_(ahead, and_(User.total_score == score, User.id > user.id))
+    rank = query.filter(ahead).count() + 1
+    total_players = query.filter(User.total_score > 0).count()
+    return rank, total_players
 
 
 @bp.route('/my-rank', methods=['GET'])
 @jwt_required()
 def get_my_rank():
-    """Get current user's rank in leaderboard (global and regional)"""
+    """Get current user's rank in leaderboard (global and regional)
+
+    Query params:
+    - city: also return the user's rank among 'moscow' or 'region' players (optional)
+    """
     user_id = get_jwt_identity()
     user = User.query.get(user_id)
 
     if not user:
         return jsonify({'error': 'User not found'}), 404
 
-    # Global rank - count users with higher score
-    global_rank = User.query.filter(
-        User.is_verified == True,
-        User.total_score > user.total_score
-    ).count() + 1
+    city = request.args.get('city', None)
+    if city and city not in ('moscow', 'region'):
+        city = None
 
-    global_total_players = User.query.filter(
-        User.is_verified == True,
-        User.total_score > 0
-    ).count()
+    score = user.total_score or 0
+    boards = ['global', user.city] + ([city] if city else [])
 
-    # Regional rank - count users in same region with higher score
-    regional_rank = User.query.filter(
-        User.is_verified == True,
-        User.city == user.city,
-        User.total_score > user.total_score
-    ).count() + 1
+    # Rank index (sorted sets) first, COUNT queries as fallback
+    ranks = live_leaderboard.get_ranks(user.id, score, boards)
+    if ranks is None:
+        ranks = {'global': _sql_rank(user)}
+        for board in boards[1:]:
+            if board not in ranks:
+                ranks[board] = _sql_rank(user, board)
 
-    regional_total_players = User.query.filter(
-        User.is_verified == True,
-        User.city == user.city,
-        User.total_score > 0
-    ).count()
+    global_rank, global_total_players = ranks['global']
+    regional_rank, regional_total_players = ranks[user.city]
 
-    return jsonify({
+    result = {
         'rank': global_rank,
         'total_score': user.total_score,
         'total_players': global_total_players,
         'city': user.city,
         'regional_rank': regional_rank,
         'regional_total_players': regional_total_players
+    }
+
+    if city:
+        city_rank, city_total_players = ranks[city]
+        result['city_rank'] = {
+            'city': city,
+            'rank': city_rank,
+            'total_players': city_total_players
+        }
+
+    return jsonify(result)
+
+
+def _sql_around(user, radius: int, city: str = None) -> tuple[int | None, list]:
+    """Neighbours of a user via keyset queries on (total_score, id) (fallback when Redis is down)"""
+    score = user.total_score or 0
+    if not user.is_verified or score <= 0:
+        return None, []
+
+    query = db.session.query(*BOARD_COLUMNS).filter(
+        User.is_verified == True,
+        User.total_score > 0
+    )
+    if city:
+        query = query.filter(User.city == city)
+
+    # Board order is total_score DESC, id DESC
+    ahead = or_(User.total_score > score, and_(User.total_score == score, User.id > user.id))
+    behind = or_(User.total_score < score, and_(User.total_score == score, User.id < user.id))
+
+    above = query.filter(ahead).order_by(
+        User.total_score.asc(), User.id.asc()
+    ).limit(radius).all()
+    below = query.filter(behind).order_by(
+        User.total_score.desc(), User.id.desc()
+    ).limit(radius).all()
+    rank = query.filter(ahead).count() + 1
+
+    window = list(reversed(above)) + [user] + below
+    first_rank = rank - len(above)
+    return rank, [_user_row(first_rank + i, u) for i, u in enumerate(window)]
+
+
+@bp.route('/around-me', methods=['GET'])
+@jwt_required()
+@rate_limit(60, 60)  # 60 requests per minute
+def get_around_me():
+    """Get the players just above and below the current user (global and regional)
+
+    Query params:
+    - radius: neighbours on each side (default 5, max 50)
+    """
+    user_id = get_jwt_identity()
+    user = User.query.get(user_id)
+
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    radius = max(0, min(request.args.get('radius', 5, type=int), 50))
+
+    # Rank index (sorted sets) first, keyset queries as fallback
+    windows = live_leaderboard.get_around(user.id, ['global', user.city], radius)
+    if windows is None:
+        windows = {
+            'global': _sql_around(user, radius),
+            user.city: _sql_around(user, radius, user.city),
+        }
+
+    global_rank, global_rows = windows['global']
+    regional_rank, regional_rows = windows[user.city]
+
+    return jsonify({
+        'global': {
+            'rank': global_rank,
+            'leaderboard': global_rows
+        },
+        'regional': {
+            'city': user.city,
+            'rank': regional_rank,
+            'leaderboard': regional_rows
+        }
     })
@@ -1,57 +1,74 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, abort, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
-from app.models.level import Level
 from app.models.user_progress import UserLevelProgress
+from app.models.user import User
+from app.services.level_catalog import get_catalog, get_level as get_cached_level
+from app.utils.http_cache import cached_json_response
+from app.utils.redis_cache import get_or_build_leaderboard
 
 bp = Blueprint('levels', __name__)
 
 
 @bp.route('', methods=['GET'])
 def get_levels():
-    """Get all active levels"""
-    levels = Level.query.filter_by(is_active=True).order_by(Level.order).all()
-    return jsonify({'levels': [level.to_dict() for level in levels]})
+    """Get all active levels (pre-serialized by the level catalog, ETag-aware)"""
+    catalog = get_catalog()
+    return cached_json_response(catalog.active_json, catalog.active_etag)
 
 
 @bp.route('/<int:level_id>', methods=['GET'])
 def get_level(level_id):
     """Get single level by ID"""
-    level = Level.query.get_or_404(level_id)
-    return jsonify({'level': level.to_dict()})
+    level = get_cached_level(level_id)
+    if not level:
+        abort(404)
+    return cached_json_response(level.json, level.etag)
 
 
 @bp.route('/<int:level_id>/leaderboard', methods=['GET'])
 def get_level_leaderboard(level_id):
-    """Get leaderboard for a specific level"""
+    """Get leaderboard for a specific level (cached, one worker rebuilds at a time)"""
     limit = min(request.args.get('limit', 100, type=int), 500)
 
+    result, cached = get_or_build_leaderboard(
+        f"level:{level_id}:{limit}",
+        lambda: _build_level_rows(level_id, limit)
+    )
+    if cached:
+        return jsonify({'leaderboard': result, 'cached': True})
+
+    return jsonify({'leaderboard': result})
+
+
+def _build_level_rows(level_id: int, limit: int) -> list:
+    """Level leaderboard rows — one query joined with users"""
     leaderboard = db.session.query(
         UserLevelProgress.user_id,
+        User.username,
         UserLevelProgress.best_score,
         UserLevelProgress.stars
+    ).join(
+        User, User.id == UserLevelProgress.user_id
     ).filter(
         UserLevelProgress.level_id == level_id,
-        UserLevelProgress.best_score > 0
+        UserLevelProgress.best_score > 0,
+        User.is_verified == True
     ).order_by(
         UserLevelProgress.best_score.desc()
     ).limit(limit).all()
 
-    # Get user details
-    from app.models.user import User
-    result = []
-    for idx, (user_id, score, stars) in enumerate(leaderboard, 1):
-        user = User.query.get(user_id)
-        if user and user.is_verified:
-            result.append({
-                'rank': idx,
-                'user_id': user_id,
-                'username': user.username,
-                'score': score,
-                'stars': stars
-            })
-
-    return jsonify({'leaderboard': result})
+    # Ranks are assigned after filtering, so unverified users leave no gaps
+    return [
+        {
+            'rank': idx,
+            'user_id': user_id,
+            'username': username,
+            'score': score,
+            'stars': stars
+        }
+        for idx, (user_id, username, score, stars) in enumerate(leaderboard, 1)
+    ]
 
 
 @bp.route('/user/progress', methods=['GET'])
@@ -63,10 +80,8 @@ def get_user_progress():
     progress = UserLevelProgress.query.filter_by(user_id=user_id).all()
     progress_dict = {p.level_id: p.to_dict() for p in progress}
 
-    levels = Level.query.filter_by(is_active=True).order_by(Level.order).all()
-
     result = []
-    for level in levels:
+    for level in get_catalog().active:
         level_data = level.to_dict()
         level_data['progress'] = progress_dict.get(level.id)
         result.append(level_data)
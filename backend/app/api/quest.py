@@ -1,15 +1,17 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models.user import User
-from app.models.quest_page import QuestPage
 from app.models.quest_progress import QuestProgress
 from app.models.promo_code import PromoCodePool, PromoCode
 from app.models.user_activity import log_activity
 from app.utils.encryption import compute_hash
-from app.utils.timezone import now_moscow
 from app.utils.redis_cache import get_redis, rate_limit
 from app.services.email import send_promo_email
+from app.services.promo_dispenser import take_promo_code, record_claim
+from app.services.quest_catalog import get_quest_catalog
+from app.services.quest_progress import load_quest_state, mark_answered, invalidate_quest_state
 
 bp = Blueprint('quest', __name__)
 
@@ -39,20 +41,11 @@ def _auto_claim_promo(user):
     if not pool:
         return None
 
-    # Grab unused code with row-level lock
-    code = PromoCode.query.filter(
-        PromoCode.pool_id == pool.id,
-        PromoCode.is_used != True,
-    ).with_for_update().first()
-
+    code = take_promo_code(pool, user.id)
     if not code:
         return None
-
-    code.is_used = True
-    code.used_by_user_id = user.id
-    code.used_at = now_moscow()
-    pool.used_codes = (pool.used_codes or 0) + 1
     db.session.commit()
+    record_claim(pool.id)
 
     log_activity(user.id, 'quest_claim_promo', {
         'code_hash': compute_hash(code.code),
@@ -76,19 +69,33 @@ def _auto_claim_promo(user):
     return (code.code, pool.tier, pool.discount_label)
 
 
+def _answered_page_ids(user_id) -> set:
+    """Ids of the quest pages the user has answered or skipped"""
+    return set(db.session.scalars(
+        db.select(QuestProgress.quest_page_id).where(QuestProgress.user_id == user_id)
+    ))
+
+
+def _already_scanned(page):
+    return jsonify({
+        'error': 'Already scanned',
+        'already_completed': True,
+        'page_slug': page.slug,
+    }), 400
+
+
 @bp.route('/pages', methods=['GET'])
 def list_pages():
     """List all active quest pages (public, no qr_token exposed)."""
-    pages = QuestPage.query.filter_by(is_active=True).order_by(QuestPage.order).all()
     return jsonify({
-        'pages': [p.to_dict(include_answer=False) for p in pages]
+        'pages': [p.to_dict(include_answer=False) for p in get_quest_catalog().pages]
     })
 
 
 @bp.route('/pages/<slug>', methods=['GET'])
 def get_page(slug):
     """Get a single quest page by slug (public, no qr_token exposed)."""
-    page = QuestPage.query.filter_by(slug=slug, is_active=True).first()
+    page = get_quest_catalog().by_slug.get(slug)
     if not page:
         return jsonify({'error': 'Page not found'}), 404
     return jsonify({'page': page.to_dict(include_answer=False)})
@@ -116,7 +123,8 @@ def scan_qr():
         return jsonify({'error': 'qr_token is required'}), 400
 
     # Find the page matching this QR token
-    scanned_page = QuestPage.query.filter_by(qr_token=qr_token, is_active=True).first()
+    catalog = get_quest_catalog()
+    scanned_page = catalog.by_qr_token.get(qr_token)
     if not scanned_page:
         return jsonify({'error': 'Invalid QR code', 'is_correct': False}), 400
 
@@ -132,31 +140,16 @@ def scan_qr():
         })
 
     # --- Authenticated mode: full validation + save ---
-    user = User.query.get(user_id)
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
+    # Pages come from the catalog and answered pages from the progress bitmap:
+    # a rejected scan needs no query (one if the bitmap has to be rebuilt)
+    state = load_quest_state(user_id, catalog)
 
     # Check if already answered this page
-    existing = QuestProgress.query.filter_by(user_id=user_id, quest_page_id=scanned_page.id).first()
-    if existing:
-        return jsonify({
-            'error': 'Already scanned',
-            'already_completed': True,
-            'page_slug': scanned_page.slug,
-        }), 400
+    if state.is_answered(scanned_page):
+        return _already_scanned(scanned_page)
 
     # Get user's current step: first unanswered active page by order
-    all_pages = QuestPage.query.filter_by(is_active=True).order_by(QuestPage.order).all()
-    answered_page_ids = set(
-        p.quest_page_id for p in
-        QuestProgress.query.filter_by(user_id=user_id).all()
-    )
-
-    current_page = None
-    for page in all_pages:
-        if page.id not in answered_page_ids:
-            current_page = page
-            break
+    current_page = state.current_page()
 
     if not current_page:
         return jsonify({'error': 'Quest already completed'}), 400
@@ -170,6 +163,10 @@ def scan_qr():
             'scanned_order': scanned_page.order,
         }), 400
 
+    user = User.query.get(user_id)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
     # Correct scan — award points
     points = scanned_page.points or 10
     progress = QuestProgress(
@@ -187,7 +184,14 @@ def scan_qr():
     if user.registration_source == 'game':
         user.registration_source = 'transferred'
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Row already there (concurrent scan, or a stale bitmap): resync from quest_progress
+        db.session.rollback()
+        invalidate_quest_state(user_id)
+        return _already_scanned(scanned_page)
+    mark_answered(user_id, catalog, scanned_page)
 
     log_activity(user_id, 'quest_scan', {
         'page_slug': scanned_page.slug,
@@ -195,11 +199,7 @@ def scan_qr():
     }, request)
 
     # Find next page
-    next_page = None
-    for page in all_pages:
-        if page.id not in answered_page_ids and page.id != scanned_page.id:
-            next_page = page
-            break
+    next_page = state.current_page(answered=scanned_page)
 
     response = {
         'is_correct': True,
@@ -242,12 +242,10 @@ def sync_guest_progress():
         return jsonify({'synced': 0, 'total_score': user.quest_score or 0})
 
     # Build page lookup
-    all_pages = {p.slug: p for p in QuestPage.query.filter_by(is_active=True).all()}
+    all_pages = get_quest_catalog().by_slug
 
     # Get existing progress to avoid duplicates
-    existing_page_ids = set(
-        p.quest_page_id for p in QuestProgress.query.filter_by(user_id=user_id).all()
-    )
+    existing_page_ids = _answered_page_ids(user_id)
 
     total_points = 0
     synced = 0
@@ -261,7 +259,7 @@ def sync_guest_progress():
         is_correct = entry.get('is_correct', False)
         is_skipped = entry.get('is_skipped', False)
         # SECURITY: Always use server-side point value, never trust client
-        points = (page.points or 0) if is_correct and not is_skipped else 0
+        points = page.points if is_correct and not is_skipped else 0
 
         progress = QuestProgress(
             user_id=user_id,
@@ -282,6 +280,7 @@ def sync_guest_progress():
             user.registration_source = 'transferred'
 
         db.session.commit()
+        invalidate_quest_state(user_id)
 
         log_activity(user_id, 'quest_sync_guest', {
             'synced_pages': synced,
@@ -314,17 +313,9 @@ def skip_question():
         return jsonify({'error': 'User not found'}), 404
 
     # Get current step
-    all_pages = QuestPage.query.filter_by(is_active=True).order_by(QuestPage.order).all()
-    answered_page_ids = set(
-        p.quest_page_id for p in
-        QuestProgress.query.filter_by(user_id=user_id).all()
-    )
-
-    current_page = None
-    for page in all_pages:
-        if page.id not in answered_page_ids:
-            current_page = page
-            break
+    catalog = get_quest_catalog()
+    state = load_quest_state(user_id, catalog)
+    current_page = state.current_page()
 
     if not current_page:
         return jsonify({'error': 'Quest already completed'}), 400
@@ -343,19 +334,20 @@ def skip_question():
     if user.registration_source == 'game':
         user.registration_source = 'transferred'
 
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        invalidate_quest_state(user_id)
+        return jsonify({'error': 'Already answered, please retry'}), 409
+    mark_answered(user_id, catalog, current_page)
 
     log_activity(user_id, 'quest_skip', {
         'page_slug': current_page.slug,
     }, request)
 
     # Find next page
-    answered_page_ids.add(current_page.id)
-    next_page = None
-    for page in all_pages:
-        if page.id not in answered_page_ids:
-            next_page = page
-            break
+    next_page = state.current_page(answered=current_page)
 
     return jsonify({
         'skipped_page': current_page.slug,
@@ -371,7 +363,7 @@ def get_progress():
     """Get user's full quest progress."""
     user_id = get_jwt_identity()
 
-    all_pages = QuestPage.query.filter_by(is_active=True).order_by(QuestPage.order).all()
+    all_pages = get_quest_catalog().pages
     progress_entries = QuestProgress.query.filter_by(user_id=user_id).all()
     progress_map = {p.quest_page_id: p for p in progress_entries}
 
@@ -419,7 +411,7 @@ def get_result():
     score = user.quest_score or 0
 
     progress_entries = QuestProgress.query.filter_by(user_id=user_id).all()
-    total_pages = QuestPage.query.filter_by(is_active=True).count()
+    total_pages = len(get_quest_catalog().pages)
     correct_count = sum(1 for p in progress_entries if p.is_correct)
     skipped_count = sum(1 for p in progress_entries if p.is_skipped)
 
@@ -476,22 +468,12 @@ def claim_promo():
     if not eligible_pool:
         return jsonify({'error': 'Score too low for any promo'}), 400
 
-    # Grab an unused code with row-level lock (PostgreSQL)
-    # Use `is_used != True` to also match NULL values from bulk imports
-    code = PromoCode.query.filter(
-        PromoCode.pool_id == eligible_pool.id,
-        PromoCode.is_used != True
-    ).with_for_update().first()
-
+    code = take_promo_code(eligible_pool, user_id)
     if not code:
         return jsonify({'error': 'No promo codes available. Please try again later.'}), 503
 
-    code.is_used = True
-    code.used_by_user_id = user_id
-    code.used_at = now_moscow()
-    eligible_pool.used_codes = (eligible_pool.used_codes or 0) + 1
-
     db.session.commit()
+    record_claim(eligible_pool.id)
 
     log_activity(user_id, 'quest_claim_promo', {
         'code_hash': compute_hash(code.code),
@@ -581,13 +563,14 @@ def guest_promo():
 
     score = 0
     seen_slugs = set()
+    pages = get_quest_catalog().by_slug
     for entry in entries[:50]:  # cap iterations
         slug = (entry.get('page_slug') or '').strip()
         qr_token = (entry.get('qr_token') or '').strip()
         if not slug or slug in seen_slugs:
             continue
         seen_slugs.add(slug)
-        page = QuestPage.query.filter_by(slug=slug, is_active=True).first()
+        page = pages.get(slug)
         # SECURITY: Validate via qr_token (cryptographic proof of scan),
         # not client-supplied is_correct flag
         if page and qr_token and page.qr_token == qr_token:
@@ -606,19 +589,12 @@ def guest_promo():
     if not eligible_pool:
         return jsonify({'error': 'Промокоды временно недоступны'}), 503
 
-    code = PromoCode.query.filter(
-        PromoCode.pool_id == eligible_pool.id,
-        PromoCode.is_used != True,
-    ).with_for_update().first()
-
+    code = take_promo_code(eligible_pool)  # used_by_user_id stays NULL — guest claim
     if not code:
         return jsonify({'error': 'Промокоды временно недоступны'}), 503
 
-    code.is_used = True
-    code.used_at = now_moscow()
-    # used_by_user_id stays NULL — guest claim
-    eligible_pool.used_codes = (eligible_pool.used_codes or 0) + 1
     db.session.commit()
+    record_claim(eligible_pool.id)
 
     # Mark email in Redis so it can't claim again
     if redis:
@@ -1,19 +1,39 @@
-from flask import Blueprint, jsonify, request
-from app import db
+from flask import Blueprint, current_app, jsonify, request
 from app.models.game_text import GameText
+from app.utils.http_cache import cached_json_response, etag_for
+from app.utils.redis_cache import get_versioned
 
 bp = Blueprint('texts', __name__)
 
+# Bumped by the admin after a text edit
+TEXTS_VERSION_KEY = "texts:version"
+
 
 @bp.route('', methods=['GET'])
 def get_texts():
-    """Get all texts, optionally filtered by section"""
+    """Get all texts, optionally filtered by section
+
+    Served from per-worker serialized bytes with an ETag; clients revalidate
+    with If-None-Match and get a 304.
+    """
     section = request.args.get('section')
 
-    query = GameText.query
-    if section:
-        query = query.filter_by(section=section)
+    payloads = get_versioned('game_texts', TEXTS_VERSION_KEY, _serialize_texts)
+    if (section or None) not in payloads:
+        return jsonify({})  # unknown section
+    body, etag = payloads[section or None]
+    return cached_json_response(body, etag)
+
+
+def _serialize_texts() -> dict:
+    """{section: (body, etag)} for each section; None holds all texts"""
+    groups = {None: {}}
+    for t in GameText.query.all():
+        groups[None][t.key] = t.value
+        groups.setdefault(t.section, {})[t.key] = t.value
 
-    texts = query.all()
-    result = {t.key: t.value for t in texts}
-    return jsonify(result)
+    payloads = {}
+    for section, values in groups.items():
+        body = current_app.json.dumps(values).encode()
+        payloads[section] = (body, etag_for(body))
+    return payloads
@@ -9,9 +9,10 @@ from app.models.promo_code import PromoCodePool, PromoCode
 from app.models.game_text import GameText
 from app.models.landing_visit import LandingVisit
 from app.models.match3_prize import Match3Prize
+from app.models.user_search_token import UserSearchToken
 
 __all__ = [
     'User', 'Level', 'UserLevelProgress', 'GameSession', 'UserActivity',
     'QuestPage', 'QuestProgress', 'PromoCodePool', 'PromoCode', 'GameText',
-    'LandingVisit', 'Match3Prize',
+    'LandingVisit', 'Match3Prize', 'UserSearchToken',
 ]
@@ -60,6 +60,12 @@ class PromoCode(db.Model):
 
     used_by = db.relationship('User', backref=db.backref('promo_codes_received', lazy='dynamic'))
 
+    __table_args__ = (
+        # Free codes of a pool in claim order (see take_promo_code)
+        db.Index('ix_promo_codes_free', 'pool_id', 'id',
+                 postgresql_where=db.text('is_used IS NOT TRUE')),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
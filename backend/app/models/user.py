@@ -3,9 +3,26 @@ from app.utils.timezone import now_moscow
 from app.utils.encryption import EncryptedString, compute_hash
 import bcrypt
 
+# password_hash of accounts anonymized by /api/auth/delete-account
+ANONYMIZED_PASSWORD_HASH = 'DELETED'
+
 
 class User(db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Covering indexes for leaderboard pages: (total_score, id) keyset seeks
+        # read each page straight off the index, at any depth
+        db.Index(
+            'ix_users_leaderboard', 'total_score', 'id',
+            postgresql_include=['username', 'city', 'completed_levels', 'total_stars'],
+            postgresql_where=db.text('is_verified AND total_score > 0')
+        ),
+        db.Index(
+            'ix_users_city_leaderboard', 'city', 'total_score', 'id',
+            postgresql_include=['username', 'completed_levels', 'total_stars'],
+            postgresql_where=db.text('is_verified AND total_score > 0')
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(EncryptedString(), nullable=False)
@@ -20,6 +37,9 @@ class User(db.Model):
     verification_code = db.Column(EncryptedString())
     verification_expires_at = db.Column(db.DateTime)
     total_score = db.Column(db.Integer, default=0)
+    # Denormalized from user_level_progress, maintained by complete_game (leaderboard rows)
+    completed_levels = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    total_stars = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     registration_source = db.Column(db.String(20), default='game', index=True)
     quest_score = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=now_moscow)
@@ -1,6 +1,8 @@
+from flask import current_app
 from app import db
 from app.utils.timezone import now_moscow
 from app.utils.encryption import EncryptedString
+from app.services import activity_log
 
 
 class UserActivity(db.Model):
@@ -14,7 +16,7 @@ class UserActivity(db.Model):
     activity_data = db.Column('metadata', db.JSON)  # Additional data about the action (column name 'metadata' in DB)
     ip_address = db.Column(EncryptedString())  # Encrypted, IPv6 compatible
     user_agent = db.Column(EncryptedString())  # Encrypted
-    created_at = db.Column(db.DateTime, default=now_moscow, index=True)
+    created_at = db.Column(db.DateTime, default=now_moscow, nullable=False, index=True)  # Partition key on PostgreSQL
 
     def to_dict(self):
         return {
@@ -30,14 +32,24 @@ class UserActivity(db.Model):
 
 
 def log_activity(user_id, action, data=None, request=None):
-    """Helper function to log user activity"""
-    activity = UserActivity(
-        user_id=user_id,
-        action=action,
-        activity_data=data,
-        ip_address=request.remote_addr if request else None,
-        user_agent=request.headers.get('User-Agent') if request else None,
-    )
-    db.session.add(activity)
+    """Helper function to log user activity
+
+    Queued for the background bulk writer (app.services.activity_log) unless
+    ACTIVITY_LOG_BUFFERED is off, in which case the row is committed here.
+    """
+    event = {
+        'user_id': user_id,
+        'action': action,
+        'activity_data': data,
+        'ip_address': request.remote_addr if request else None,
+        'user_agent': request.headers.get('User-Agent') if request else None,
+        'created_at': now_moscow(),
+    }
+
+    app = current_app._get_current_object()
+    if app.config.get('ACTIVITY_LOG_BUFFERED'):
+        activity_log.enqueue(app, event)
+        return
+
+    db.session.add(UserActivity(**event))
     db.session.commit()
-    return activity
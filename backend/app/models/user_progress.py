@@ -15,6 +15,8 @@ class UserLevelProgress(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint('user_id', 'level_id', name='unique_user_level'),
+        # Per-level leaderboard: top-N by best_score without a sort
+        db.Index('ix_user_level_progress_level_best_score', 'level_id', db.text('best_score DESC')),
     )
 
     def to_dict(self):
@@ -0,0 +1,37 @@
+from app import db
+from app.models.user import User
+from app.utils.search_index import search_tokens
+
+
+class UserSearchToken(db.Model):
+    """Blind search index over users' email and username (admin user search).
+
+    One row per hashed prefix/trigram (see search_tokens()); the primary key
+    (token, user_id) is the lookup index. Rewritten whenever email or
+    username changes.
+    """
+    __tablename__ = 'user_search_tokens'
+
+    token = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'),
+                        primary_key=True, autoincrement=False, index=True)
+
+    def __repr__(self):
+        return f'<UserSearchToken user={self.user_id}>'
+
+
+def index_user_search(connection, user_id: int, email: str, username: str) -> None:
+    """Replace a user's search tokens."""
+    table = UserSearchToken.__table__
+    connection.execute(table.delete().where(table.c.user_id == user_id))
+    tokens = search_tokens(email, username)
+    if tokens:
+        connection.execute(table.insert(), [{'token': token, 'user_id': user_id} for token in tokens])
+
+
+@db.event.listens_for(User, 'after_insert')
+@db.event.listens_for(User, 'after_update')
+def _reindex_user_search(mapper, connection, user):
+    attrs = db.inspect(user).attrs
+    if attrs.email.history.has_changes() or attrs.username.history.has_changes():
+        index_user_search(connection, user.id, user.email, user.username)
@@ -0,0 +1,282 @@
+"""
+Buffered activity log writer.
+
+log_activity() used to add a UserActivity row and commit it inside the
+request — usually a second commit per request. Events are now queued in a
+bounded per-worker buffer and written by a background thread in multi-row
+INSERTs (ORM bulk insert, so ip/user agent still go through EncryptedString).
+
+The buffer is flushed every ACTIVITY_FLUSH_INTERVAL seconds, as soon as it
+holds ACTIVITY_FLUSH_BATCH events, and on interpreter shutdown. When it is
+full, new events are dropped and counted rather than blocking requests.
+Events of accounts anonymized while they were queued lose their IP and user
+agent right after being written (see _scrub_anonymized).
+
+On PostgreSQL user_activities is partitioned by month (migration 017):
+maintain_activity_partitions() creates the coming months' partitions and
+drops those older than ACTIVITY_RETENTION_MONTHS. The flusher thread runs it
+once a day; the entrypoint runs it on deploy (flask activity-partitions).
+"""
+import atexit
+import threading
+import time
+from collections import deque
+from datetime import date
+
+from flask import current_app
+from prometheus_client import Counter, Gauge
+from sqlalchemy.exc import DataError, IntegrityError, InterfaceError, OperationalError
+
+from app import db
+from app.utils.timezone import now_moscow
+
+ACTIVITY_BUFFER_MAX = 10000
+ACTIVITY_FLUSH_BATCH = 500
+ACTIVITY_FLUSH_INTERVAL = 1.0
+ACTIVITY_FLUSH_RETRIES = 5    # attempts for a batch refused by a transient database error
+ACTIVITY_RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled each time
+
+ACTIVITY_PARTITIONS_AHEAD = 3          # months of empty partitions kept ready
+ACTIVITY_MAINTENANCE_INTERVAL = 86400  # seconds between partition maintenance runs
+
+_buffer = deque()
+_buffer_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wakeup = threading.Event()
+_flusher = None
+_retry = {'attempts': 0, 'not_before': 0.0}
+
+ACTIVITY_QUEUE_DEPTH = Gauge('activity_log_queue_depth', 'Activity events waiting to be written')
+ACTIVITY_QUEUE_DEPTH.set_function(lambda: len(_buffer))
+ACTIVITY_WRITTEN = Counter('activity_log_written_total', 'Activity events written to the database')
+ACTIVITY_DROPPED = Counter('activity_log_dropped_total', 'Activity events dropped (buffer full or write failed)')
+
+
+def enqueue(app, event: dict) -> bool:
+    """Queue one user_activities row (attribute name -> value). False if dropped."""
+    with _buffer_lock:
+        if len(_buffer) >= ACTIVITY_BUFFER_MAX:
+            ACTIVITY_DROPPED.inc()
+            return False
+        _buffer.append(event)
+        backlog = len(_buffer)
+
+    _ensure_flusher(app)
+    if backlog >= ACTIVITY_FLUSH_BATCH:
+        _wakeup.set()
+    return True
+
+
+def flush_activity_log() -> int:
+    """Write everything queued so far; needs an app context. Returns rows written.
+
+    A batch the database refuses for a transient reason (connection lost,
+    failover) goes back to the head of the queue and is retried with backoff,
+    up to ACTIVITY_FLUSH_RETRIES times. A batch with a bad row is written row
+    by row, so only that row is lost.
+    """
+    from app.models.user_activity import UserActivity
+
+    written = 0
+    with _flush_lock:
+        while time.monotonic() >= _retry['not_before']:
+            with _buffer_lock:
+                batch = [_buffer.popleft() for _ in range(min(ACTIVITY_FLUSH_BATCH, len(_buffer)))]
+            if not batch:
+                return written
+
+            try:
+                _write(UserActivity, batch)
+            except (OperationalError, InterfaceError) as e:
+                db.session.rollback()
+                if _retry['attempts'] < ACTIVITY_FLUSH_RETRIES:
+                    with _buffer_lock:
+                        _buffer.extendleft(reversed(batch))
+                    _retry['not_before'] = time.monotonic() + ACTIVITY_RETRY_BACKOFF * 2 ** _retry['attempts']
+                    _retry['attempts'] += 1
+                    print(f"Activity log flush error, {len(batch)} events requeued: {e}")
+                    return written
+                print(f"Activity log flush error, {len(batch)} events dropped after retries: {e}")
+                ACTIVITY_DROPPED.inc(len(batch))
+                _retry['attempts'] = 0
+                continue
+            except (IntegrityError, DataError) as e:
+                db.session.rollback()
+                print(f"Activity log flush error, writing {len(batch)} events one by one: {e}")
+                batch = _write_rows(UserActivity, batch)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Activity log flush error, {len(batch)} events dropped: {e}")
+                ACTIVITY_DROPPED.inc(len(batch))
+                continue
+
+            _retry['attempts'] = 0
+            written += len(batch)
+            ACTIVITY_WRITTEN.inc(len(batch))
+            try:
+                _scrub_anonymized(batch)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Activity log scrub error: {e}")
+    return written
+
+
+def _write(model, batch: list) -> None:
+    db.session.execute(db.insert(model), batch)
+    db.session.commit()
+
+
+def _write_rows(model, batch: list) -> list:
+    """Write a batch one row per transaction; returns the rows written"""
+    written = []
+    for event in batch:
+        try:
+            _write(model, [event])
+            written.append(event)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Activity log event dropped ({event.get('action')}): {e}")
+            ACTIVITY_DROPPED.inc()
+    return written
+
+
+def _scrub_anonymized(batch: list) -> None:
+    """Clear IP/user agent just written for accounts anonymized in the meantime.
+
+    delete-account commits the anonymization and then clears the user's
+    existing rows. Checking only after our insert is committed means each row
+    is seen by one side or the other, whichever worker queued it.
+    """
+    from app.models.user import User, ANONYMIZED_PASSWORD_HASH
+    from app.models.user_activity import UserActivity
+
+    user_ids = {e['user_id'] for e in batch if e['user_id'] and (e['ip_address'] or e['user_agent'])}
+    if not user_ids:
+        return
+    anonymized = db.session.scalars(db.select(User.id).where(
+        User.id.in_(user_ids), User.password_hash == ANONYMIZED_PASSWORD_HASH
+    )).all()
+    if anonymized:
+        UserActivity.query.filter(UserActivity.user_id.in_(anonymized)).update(
+            {'ip_address': None, 'user_agent': None}, synchronize_session=False
+        )
+    db.session.commit()
+
+
+def _add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def maintain_activity_partitions(retention_months: int = None, today: date = None) -> dict:
+    """Create upcoming monthly partitions and drop expired ones; needs an app context.
+
+    No-op unless user_activities is a partitioned PostgreSQL table. Guarded by
+    an advisory lock so several workers starting at once don't collide. Also
+    adds the users foreign key a fresh database's table was created without.
+    Returns {'created': [...], 'dropped': [...]} partition names.
+    """
+    result = {'created': [], 'dropped': []}
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return result
+
+    text = db.text
+    partitioned = db.session.execute(text(
+        "SELECT EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = to_regclass('user_activities'))"
+    )).scalar()
+    if not partitioned:
+        return result
+
+    locked = db.session.execute(text(
+        "SELECT pg_try_advisory_xact_lock(hashtext('user_activities_partitions'))"
+    )).scalar()
+    if not locked:
+        db.session.rollback()
+        return result
+
+    # On a fresh database migration 017 creates the table before db.create_all()
+    # creates users, so its foreign key is added here once users exists
+    missing_fk = db.session.execute(text("""
+        SELECT to_regclass('users') IS NOT NULL AND NOT EXISTS (
+            SELECT FROM pg_constraint WHERE conrelid = 'user_activities'::regclass AND contype = 'f'
+        )
+    """)).scalar()
+    if missing_fk:
+        db.session.execute(text(
+            "ALTER TABLE user_activities ADD FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE"
+        ))
+
+    if retention_months is None:
+        retention_months = current_app.config.get('ACTIVITY_RETENTION_MONTHS', 12)
+    this_month = (today or now_moscow().date()).replace(day=1)
+
+    existing = set(db.session.execute(text("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'user_activities'::regclass
+    """)).scalars())
+
+    for n in range(ACTIVITY_PARTITIONS_AHEAD + 1):
+        month = _add_months(this_month, n)
+        name = f'user_activities_p{month:%Y%m}'
+        if name in existing:
+            continue
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF user_activities "
+            f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+        ))
+        result['created'].append(name)
+
+    # Whole months only: a partition goes once its last day is past the retention window
+    if retention_months and retention_months > 0:
+        oldest_kept = f'user_activities_p{_add_months(this_month, -retention_months):%Y%m}'
+        for name in sorted(existing):
+            suffix = name.rpartition('_p')[2]
+            if name.startswith('user_activities_p') and suffix.isdigit() and name < oldest_kept:
+                db.session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+                result['dropped'].append(name)
+
+    db.session.commit()
+    return result
+
+
+def _run_maintenance():
+    try:
+        result = maintain_activity_partitions()
+        if result['created'] or result['dropped']:
+            print(f"Activity partitions created: {result['created']}, dropped: {result['dropped']}")
+    except Exception as e:
+        db.session.rollback()
+        print(f"Activity partition maintenance error: {e}")
+
+
+def _run_flusher(app):
+    next_maintenance = time.monotonic() + ACTIVITY_MAINTENANCE_INTERVAL
+    while True:
+        _wakeup.wait(ACTIVITY_FLUSH_INTERVAL)
+        _wakeup.clear()
+        with app.app_context():
+            try:
+                flush_activity_log()
+                if time.monotonic() >= next_maintenance:
+                    next_maintenance = time.monotonic() + ACTIVITY_MAINTENANCE_INTERVAL
+                    _run_maintenance()
+            finally:
+                db.session.remove()
+
+
+def _flush_at_exit(app):
+    _retry['not_before'] = 0.0  # one last attempt, backoff or not
+    with app.app_context():
+        flush_activity_log()
+
+
+def _ensure_flusher(app):
+    global _flusher
+    if _flusher is not None:
+        return
+    with _buffer_lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_run_flusher, args=(app,), name='activity-log-flusher', daemon=True)
+        _flusher.start()
+    atexit.register(_flush_at_exit, app)
@@ -0,0 +1,747 @@
+"""
+Live leaderboard engine on Redis sorted sets.
+
+Each board (global, moscow, region) is a sorted set of user ids scored by
+total_score; a side hash keeps the fields a leaderboard row renders. The game
+pushes score changes with ZADD, so top-N reads are a ZREVRANGE + HMGET and
+never touch Postgres.
+
+Members are user ids zero-padded to a fixed width: Redis orders tied scores
+by member bytes, so ZREVRANGE then lists ties by id descending, exactly like
+the SQL fallback's ORDER BY total_score DESC, id DESC.
+
+All read helpers return None when Redis is unavailable or the boards are not
+built yet — callers then fall back to SQL.
+
+Rebuilds write a snapshot into :rebuild keys and RENAME them over the live
+ones. While LB_REBUILDING_KEY is set, score updates are applied to the
+:rebuild keys as well and their members marked dirty, and the snapshot
+skips dirty members, so an update landing mid-rebuild is never replaced by
+the older snapshot row. The ready flag lists the keys the rebuild produced;
+if any of them is evicted the boards are rebuilt.
+"""
+import json
+import threading
+from datetime import timedelta
+
+from flask import current_app
+
+from app import db
+from app.models.game_session import GameSession
+from app.models.user import User
+from app.utils.redis_cache import get_redis
+from app.utils.timezone import now_moscow
+
+LEADERBOARD_BOARDS = ('global', 'moscow', 'region')
+LB_PREFIX = "lb:v2:"  # v2: zero-padded members
+LB_MEMBER_WIDTH = 10  # digits of the largest users.id (int4)
+LB_META_KEY = f"{LB_PREFIX}meta"
+LB_READY_KEY = f"{LB_PREFIX}ready"
+LB_REBUILD_LOCK_KEY = f"{LB_PREFIX}rebuild_lock"
+LB_REBUILDING_KEY = f"{LB_PREFIX}rebuilding"
+LB_REBUILD_DIRTY_KEY = f"{LB_PREFIX}rebuild:dirty"
+# Admin edits bypass complete_game, so boards are reconciled with Postgres hourly
+LB_REBUILD_INTERVAL = 3600
+LB_REBUILD_LOCK_TTL = 600
+LB_REBUILD_BATCH = 1000
+# Weekly boards live one extra week so late reads of last week still work
+LB_WEEKLY_TTL = 14 * 86400
+
+
+def _board_key(board: str) -> str:
+    return f"{LB_PREFIX}{board}"
+
+
+def _member(user_id) -> str:
+    """Board member for a user id; fixed width so byte order is id order"""
+    return f"{int(user_id):0{LB_MEMBER_WIDTH}d}"
+
+
+def _is_ranked(user) -> bool:
+    """Only verified players with points appear on the boards."""
+    return bool(user.is_verified) and (user.total_score or 0) > 0
+
+
+def _meta(user) -> dict:
+    return {
+        'username': user.username,
+        'city': user.city,
+        'completed_levels': user.completed_levels or 0,
+        'total_stars': user.total_stars or 0,
+    }
+
+
+def _tmp_key(key: str) -> str:
+    return f"{key}:rebuild"
+
+
+# Live keys, then their :rebuild counterparts, in this order in every script
+LB_DATA_KEYS = tuple(_board_key(board) for board in LEADERBOARD_BOARDS) + (LB_META_KEY,)
+LB_TMP_KEYS = tuple(_tmp_key(key) for key in LB_DATA_KEYS)
+
+# KEYS: global, moscow, region, meta, the same four :rebuild keys, rebuilding flag, dirty set
+# ARGV: member, score ('' to remove), city, meta json
+UPDATE_SCRIPT = """
+local function apply(global, moscow, region, meta)
+    if ARGV[2] == '' then
+        redis.call('ZREM', global, ARGV[1])
+        redis.call('ZREM', moscow, ARGV[1])
+        redis.call('ZREM', region, ARGV[1])
+        redis.call('HDEL', meta, ARGV[1])
+        return
+    end
+    redis.call('ZADD', global, ARGV[2], ARGV[1])
+    if ARGV[3] == 'moscow' then
+        redis.call('ZADD', moscow, ARGV[2], ARGV[1])
+        redis.call('ZREM', region, ARGV[1])
+    elseif ARGV[3] == 'region' then
+        redis.call('ZADD', region, ARGV[2], ARGV[1])
+        redis.call('ZREM', moscow, ARGV[1])
+    else
+        redis.call('ZREM', moscow, ARGV[1])
+        redis.call('ZREM', region, ARGV[1])
+    end
+    redis.call('HSET', meta, ARGV[1], ARGV[4])
+end
+apply(KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+if redis.call('EXISTS', KEYS[9]) == 1 then
+    apply(KEYS[5], KEYS[6], KEYS[7], KEYS[8])
+    redis.call('SADD', KEYS[10], ARGV[1])
+end
+return 1
+"""
+
+# KEYS: the four :rebuild keys, dirty set, rebuilding flag
+# ARGV: flag ttl, then member, score, city, meta json per row
+# Rows whose member was updated during the rebuild are skipped. Returns 0 if the
+# flag expired (updates may have missed the :rebuild keys), 1 otherwise.
+REBUILD_BATCH_SCRIPT = """
+for i = 2, #ARGV, 4 do
+    local member = ARGV[i]
+    if redis.call('SISMEMBER', KEYS[5], member) == 0 then
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], member)
+        if ARGV[i + 2] == 'moscow' then
+            redis.call('ZADD', KEYS[2], ARGV[i + 1], member)
+        elseif ARGV[i + 2] == 'region' then
+            redis.call('ZADD', KEYS[3], ARGV[i + 1], member)
+        end
+        redis.call('HSET', KEYS[4], member, ARGV[i + 3])
+    end
+end
+return redis.call('EXPIRE', KEYS[6], ARGV[1])
+"""
+
+# KEYS: the four :rebuild keys, the four live keys, rebuilding flag, dirty set, ready flag
+# ARGV: ready ttl
+# Renames every :rebuild key that exists over its live key (deleting the others)
+# and records the produced keys in the ready flag. Returns -1 without swapping if
+# the rebuilding flag expired.
+SWAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[9]) == 0 then
+    return -1
+end
+local present = {}
+for i = 1, 4 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 4])
+        table.insert(present, KEYS[i + 4])
+    else
+        redis.call('DEL', KEYS[i + 4])
+    end
+end
+redis.call('DEL', KEYS[9], KEYS[10])
+redis.call('SET', KEYS[11], table.concat(present, ' '), 'EX', ARGV[1])
+return #present
+"""
+
+_update_script = None
+_rebuild_batch_script = None
+_swap_script = None
+
+
+def _apply_update(redis_client, member: str, score='', city='', meta='') -> None:
+    global _update_script
+    if _update_script is None:
+        _update_script = redis_client.register_script(UPDATE_SCRIPT)
+    _update_script(
+        keys=[*LB_DATA_KEYS, *LB_TMP_KEYS, LB_REBUILDING_KEY, LB_REBUILD_DIRTY_KEY],
+        args=[member, score, city or '', meta],
+        client=redis_client,
+    )
+
+
+def update_user_score(user) -> bool:
+    """Push a user's current total_score and row fields into the live boards."""
+    redis_client = get_redis()
+    if not redis_client:
+        return False
+
+    try:
+        if _is_ranked(user):
+            _apply_update(redis_client, _member(user.id), user.total_score, user.city, json.dumps(_meta(user)))
+        else:
+            _apply_update(redis_client, _member(user.id))
+        return True
+    except Exception as e:
+        print(f"Redis error updating leaderboard: {e}")
+        return False
+
+
+def remove_user(user_id: int) -> bool:
+    """Drop a user from every board (account deletion)."""
+    redis_client = get_redis()
+    if not redis_client:
+        return False
+
+    try:
+        _apply_update(redis_client, _member(user_id))
+        return True
+    except Exception as e:
+        print(f"Redis error removing user from leaderboard: {e}")
+        return False
+
+
+def _ranked_users_query():
+    """Verified users with points — everything a row needs lives on User."""
+    return User.query.filter(
+        User.is_verified == True,
+        User.total_score > 0
+    )
+
+
+def rebuild_leaderboards() -> int:
+    """Rebuild every board from Postgres and swap it in atomically.
+
+    Returns the number of ranked users written.
+    """
+    global _rebuild_batch_script, _swap_script
+    redis_client = get_redis()
+    if not redis_client:
+        return 0
+    if _rebuild_batch_script is None:
+        _rebuild_batch_script = redis_client.register_script(REBUILD_BATCH_SCRIPT)
+        _swap_script = redis_client.register_script(SWAP_SCRIPT)
+
+    # Raise the flag before reading Postgres: an update committed after the
+    # snapshot was taken is then guaranteed to reach the :rebuild keys too
+    pipe = redis_client.pipeline()
+    pipe.delete(LB_REBUILD_DIRTY_KEY, *LB_TMP_KEYS)
+    pipe.set(LB_REBUILDING_KEY, '1', ex=LB_REBUILD_LOCK_TTL)
+    pipe.execute()
+
+    def write_batch(args):
+        if not _rebuild_batch_script(
+            keys=[*LB_TMP_KEYS, LB_REBUILD_DIRTY_KEY, LB_REBUILDING_KEY],
+            args=[LB_REBUILD_LOCK_TTL, *args],
+            client=redis_client,
+        ):
+            raise RuntimeError("leaderboard rebuild outlived its flag")
+
+    written = 0
+    args = []
+    for user in _ranked_users_query().order_by(User.id).yield_per(LB_REBUILD_BATCH):
+        args.extend((_member(user.id), user.total_score, user.city or '', json.dumps(_meta(user))))
+        written += 1
+        if written % LB_REBUILD_BATCH == 0:
+            write_batch(args)
+            args = []
+    write_batch(args)
+
+    swapped = _swap_script(
+        keys=[*LB_TMP_KEYS, *LB_DATA_KEYS, LB_REBUILDING_KEY, LB_REBUILD_DIRTY_KEY, LB_READY_KEY],
+        args=[LB_REBUILD_INTERVAL],
+        client=redis_client,
+    )
+    if swapped < 0:
+        raise RuntimeError("leaderboard rebuild outlived its flag")
+    return written
+
+
+def _rebuild_locked(redis_client):
+    try:
+        rebuild_leaderboards()
+    except Exception as e:
+        print(f"Leaderboard rebuild failed: {e}")
+    finally:
+        try:
+            redis_client.delete(LB_REBUILD_LOCK_KEY)
+        except Exception:
+            pass
+
+
+def _rebuild_in_background(app, redis_client):
+    with app.app_context():
+        _rebuild_locked(redis_client)
+        db.session.remove()
+
+
+def _boards_ready(redis_client) -> bool:
+    """Ready flag set and none of the keys it lists evicted since (one round trip)"""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(LB_READY_KEY)
+    for key in LB_DATA_KEYS:
+        pipe.exists(key)
+    ready, *exists = pipe.execute()
+    if ready is None:
+        return False
+    expected = set(_decode(ready).split())
+    return all(found for key, found in zip(LB_DATA_KEYS, exists) if key in expected)
+
+
+def _ensure_built(redis_client) -> bool:
+    """Check the boards are usable, rebuilding them when missing, evicted or stale."""
+    if _boards_ready(redis_client):
+        return True
+
+    if not redis_client.set(LB_REBUILD_LOCK_KEY, '1', nx=True, ex=LB_REBUILD_LOCK_TTL):
+        # Another worker is rebuilding — keep serving the previous build if any
+        return bool(redis_client.exists(_board_key('global')))
+
+    if redis_client.exists(_board_key('global')):
+        # Previous build still answers reads; reconcile without blocking this request
+        app = current_app._get_current_object()
+        threading.Thread(target=_rebuild_in_background, args=(app, redis_client), daemon=True).start()
+        return True
+
+    _rebuild_locked(redis_client)
+    return _boards_ready(redis_client)
+
+
+def _load_missing_meta(user_ids: list) -> dict:
+    """Fetch row fields from Postgres for members whose meta hash entry is gone."""
+    users = _ranked_users_query().filter(User.id.in_(user_ids)).all()
+    return {_member(user.id): _meta(user) for user in users}
+
+
+def _decode(member) -> str:
+    return member.decode('utf-8') if isinstance(member, bytes) else member
+
+
+def _fetch_meta(redis_client, members: list) -> dict:
+    """Row fields for board members: one HMGET, Postgres only for gaps."""
+    raw_meta = redis_client.hmget(LB_META_KEY, members)
+    meta = {}
+    missing = []
+    for member, raw in zip(members, raw_meta):
+        if raw:
+            meta[member] = json.loads(raw)
+        else:
+            missing.append(int(member))
+    if missing:
+        meta.update(_load_missing_meta(missing))
+    return meta
+
+
+def _board_fields(info: dict, score) -> dict:
+    return {
+        'username': info['username'],
+        'total_score': int(score),
+        'completed_levels': info['completed_levels'],
+        'total_stars': info['total_stars'],
+        'city': info['city'],
+    }
+
+
+def _format_rows(entries: list, meta: dict, first_rank: int) -> list:
+    """Leaderboard rows from (member, score) pairs, numbered by board position."""
+    return [
+        {'rank': first_rank + position, 'user_id': int(member), **_board_fields(meta[member], score)}
+        for position, (member, score) in enumerate(entries)
+        if meta.get(member)
+    ]
+
+
+def _page_start(redis_client, key: str, after: tuple | None) -> int:
+    """ZREVRANGE start index for the page that follows cursor `after`.
+
+    The cursor is the (score, user_id, rank) of the previous page's last row.
+    If that member still holds the same score we resume right after it
+    (ZREVRANK); otherwise it moved since the last page, and we resume at the
+    first member not above its old score (ZCOUNT) — _scan_page() then skips
+    the ties already shown. Either way it is O(log N) at any depth.
+    """
+    if not after:
+        return 0
+
+    score, user_id, _ = after
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zscore(key, _member(user_id))
+    pipe.zrevrank(key, _member(user_id))
+    pipe.zcount(key, f"({score}", '+inf')
+    current, position, above = pipe.execute()
+    if current is not None and int(current) == score and position is not None:
+        return position + 1
+    return above
+
+
+def _scan_page(redis_client, key: str, limit: int, after: tuple | None, render) -> list:
+    """Up to `limit` rows of a board following cursor `after`.
+
+    render(entries) gets (member, score) pairs in board order and returns
+    {member: row fields} for the members it can show. The others (meta gone,
+    user no longer verified) are skipped and the scan goes on past them, so a
+    short page means the board has ended. Ranks count shown rows only,
+    continuing from the cursor's rank, as the SQL fallback numbers them.
+    """
+    position = _page_start(redis_client, key, after)
+    cursor = (after[0], _member(after[1])) if after else None
+    first_rank = after[2] + 1 if after else 1
+    rows = []
+    while len(rows) < limit:
+        batch = redis_client.zrevrange(key, position, position + limit - 1, withscores=True)
+        if not batch:
+            break
+        position += len(batch)
+        # Board order is (score, member) descending: keep what follows the cursor
+        entries = [
+            (member, int(score)) for member, score in ((_decode(m), s) for m, s in batch)
+            if not cursor or (int(score), member) < cursor
+        ]
+        shown = render(entries) if entries else {}
+        for member, score in entries:
+            if member in shown and len(rows) < limit:
+                rows.append({'rank': first_rank + len(rows), 'user_id': int(member), **shown[member]})
+    return rows
+
+
+def get_top(board: str, limit: int, after: tuple = None) -> list | None:
+    """A page of a board, or None if the caller should fall back to SQL.
+
+    Without `after` this is the top-N; with a (score, user_id, rank) cursor it
+    is the next N rows after it.
+    """
+    redis_client = get_redis()
+    if not redis_client or board not in LEADERBOARD_BOARDS:
+        return None
+
+    def render(entries):
+        meta = _fetch_meta(redis_client, [m for m, _ in entries])
+        return {m: _board_fields(meta[m], score) for m, score in entries if meta.get(m)}
+
+    try:
+        if not _ensure_built(redis_client):
+            return None
+        return _scan_page(redis_client, _board_key(board), limit, after, render)
+    except Exception as e:
+        print(f"Redis error reading leaderboard: {e}")
+        return None
+
+
+def get_around(user_id: int, boards: list, radius: int) -> dict | None:
+    """The ±radius neighbours of a user on each board.
+
+    ZREVRANK locates the user and ZREVRANGE slices the window, so each board
+    costs O(log N + radius). Returns {board: (rank, rows)} — rank is None and
+    rows empty when the user is not on that board — or None to fall back to SQL.
+    """
+    redis_client = get_redis()
+    if not redis_client or any(board not in LEADERBOARD_BOARDS for board in boards):
+        return None
+
+    boards = list(dict.fromkeys(boards))
+    member = _member(user_id)
+    try:
+        if not _ensure_built(redis_client):
+            return None
+
+        pipe = redis_client.pipeline(transaction=False)
+        for board in boards:
+            pipe.zrevrank(_board_key(board), member)
+        positions = dict(zip(boards, pipe.execute()))
+
+        ranked = [board for board in boards if positions[board] is not None]
+        pipe = redis_client.pipeline(transaction=False)
+        for board in ranked:
+            start = max(0, positions[board] - radius)
+            pipe.zrevrange(_board_key(board), start, positions[board] + radius, withscores=True)
+        windows = {
+            board: [(_decode(m), s) for m, s in entries]
+            for board, entries in zip(ranked, pipe.execute())
+        }
+
+        members = list({m for entries in windows.values() for m, _ in entries})
+        meta = _fetch_meta(redis_client, members) if members else {}
+    except Exception as e:
+        print(f"Redis error reading leaderboard window: {e}")
+        return None
+
+    result = {}
+    for board in boards:
+        if board not in windows:
+            result[board] = (None, [])
+            continue
+        start = max(0, positions[board] - radius)
+        result[board] = (positions[board] + 1, _format_rows(windows[board], meta, first_rank=start + 1))
+    return result
+
+
+def get_ranks(user_id: int, score: int, boards: list) -> dict | None:
+    """A user's rank and the player count on each board.
+
+    On a board the user is on, the rank is their position (ZREVRANK), the
+    same rank get_top() and get_around() show. Otherwise it is where the score
+    would enter: 1 + the players strictly above (ZCOUNT). The total is ZCARD,
+    all O(log N) and answered in one round trip. Returns
+    {board: (rank, total_players)} or None to fall back to SQL.
+    """
+    redis_client = get_redis()
+    if not redis_client or any(board not in LEADERBOARD_BOARDS for board in boards):
+        return None
+
+    boards = list(dict.fromkeys(boards))
+    try:
+        if not _ensure_built(redis_client):
+            return None
+
+        member = _member(user_id)
+        pipe = redis_client.pipeline(transaction=False)
+        for board in boards:
+            pipe.zrevrank(_board_key(board), member)
+            pipe.zcount(_board_key(board), f"({score}", '+inf')
+            pipe.zcard(_board_key(board))
+        replies = pipe.execute()
+    except Exception as e:
+        print(f"Redis error reading leaderboard rank: {e}")
+        return None
+
+    result = {}
+    for i, board in enumerate(boards):
+        position, above, total = replies[3 * i:3 * i + 3]
+        result[board] = ((position if position is not None else above) + 1, total)
+    return result
+
+
+# ==================== WEEKLY BOARD ====================
+
+# A week's board only ever moves by raising a (user, level) best to a higher
+# score and adding the difference to the user's total. Rebuilds write their
+# snapshot into :rebuild keys the same way, and while a week's rebuilding flag
+# is set new sessions are also raised into those keys: both orders end in the
+# same best-per-level maximum, so nothing recorded mid-rebuild is lost.
+WEEKLY_RAISE = """
+local function raise(board, best, field, member, score, ttl)
+    local old = tonumber(redis.call('HGET', best, field) or '0')
+    local delta = 0
+    if score > old then
+        delta = score - old
+        redis.call('HSET', best, field, score)
+        redis.call('ZINCRBY', board, delta, member)
+    end
+    redis.call('EXPIRE', board, ttl)
+    redis.call('EXPIRE', best, ttl)
+    return delta
+end
+"""
+
+# KEYS: weekly zset, per-(user, level) best hash, rebuilding flag, the two :rebuild keys, ready flag
+# ARGV: "user:level" field, user member, score, ttl
+# Adds only the improvement over this week's best for the (user, level) pair.
+WEEKLY_RECORD_SCRIPT = WEEKLY_RAISE + """
+local delta = raise(KEYS[1], KEYS[2], ARGV[1], ARGV[2], tonumber(ARGV[3]), ARGV[4])
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    raise(KEYS[4], KEYS[5], ARGV[1], ARGV[2], tonumber(ARGV[3]), ARGV[4])
+end
+if delta > 0 and redis.call('GET', KEYS[6]) == '0' then
+    redis.call('SET', KEYS[6], '1', 'KEEPTTL')  -- the board exists now
+end
+return delta
+"""
+
+# KEYS: the two :rebuild keys, rebuilding flag
+# ARGV: ttl, flag ttl, then field, member, best per row
+# Returns 0 if the flag expired (sessions may have missed the :rebuild keys)
+WEEKLY_REBUILD_BATCH_SCRIPT = WEEKLY_RAISE + """
+for i = 3, #ARGV, 3 do
+    raise(KEYS[1], KEYS[2], ARGV[i], ARGV[i + 1], tonumber(ARGV[i + 2]), ARGV[1])
+end
+return redis.call('EXPIRE', KEYS[3], ARGV[2])
+"""
+
+# KEYS: the two :rebuild keys, board, best hash, rebuilding flag, ready flag
+# ARGV: ttl
+# ready is '1' when the board exists, '0' for a week nobody has won yet.
+# Returns -1 without swapping if the rebuilding flag expired.
+WEEKLY_SWAP_SCRIPT = """
+if redis.call('EXISTS', KEYS[5]) == 0 then
+    return -1
+end
+local built = redis.call('EXISTS', KEYS[1])
+for i = 1, 2 do
+    if redis.call('EXISTS', KEYS[i]) == 1 then
+        redis.call('RENAME', KEYS[i], KEYS[i + 2])
+    else
+        redis.call('DEL', KEYS[i + 2])
+    end
+end
+redis.call('DEL', KEYS[5])
+redis.call('SET', KEYS[6], tostring(built), 'EX', ARGV[1])
+return built
+"""
+
+_weekly_record = None
+_weekly_rebuild_batch = None
+_weekly_swap = None
+
+
+def week_start(moment=None):
+    """Monday 00:00 (Moscow) of the week containing moment (default: now)."""
+    moment = moment or now_moscow()
+    start = moment - timedelta(days=moment.weekday())
+    return start.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _weekly_keys(start) -> tuple[str, str, str, str, str]:
+    """board, best-per-level hash, ready flag, rebuild lock, rebuilding flag"""
+    base = f"{LB_PREFIX}weekly:{start.date().isoformat()}"
+    return base, f"{base}:best", f"{base}:ready", f"{base}:lock", f"{base}:rebuilding"
+
+
+def record_weekly_score(user_id: int, level_id: int, score: int, played_at=None) -> bool:
+    """Fold a won session into its week's board (only the gain over that week's best)."""
+    global _weekly_record
+    redis_client = get_redis()
+    if not redis_client:
+        return False
+
+    board_key, best_key, ready_key, _, rebuilding_key = _weekly_keys(week_start(played_at))
+    try:
+        if _weekly_record is None:
+            _weekly_record = redis_client.register_script(WEEKLY_RECORD_SCRIPT)
+        _weekly_record(
+            keys=[board_key, best_key, rebuilding_key, _tmp_key(board_key), _tmp_key(best_key), ready_key],
+            args=[f"{user_id}:{level_id}", _member(user_id), int(score), LB_WEEKLY_TTL],
+            client=redis_client,
+        )
+        return True
+    except Exception as e:
+        print(f"Redis error recording weekly score: {e}")
+        return False
+
+
+def rebuild_weekly(start=None) -> int:
+    """Rebuild a week's board from game_sessions and swap it in atomically."""
+    global _weekly_rebuild_batch, _weekly_swap
+    redis_client = get_redis()
+    if not redis_client:
+        return 0
+    if _weekly_rebuild_batch is None:
+        _weekly_rebuild_batch = redis_client.register_script(WEEKLY_REBUILD_BATCH_SCRIPT)
+        _weekly_swap = redis_client.register_script(WEEKLY_SWAP_SCRIPT)
+
+    start = start or week_start()
+    board_key, best_key, ready_key, _, rebuilding_key = _weekly_keys(start)
+    tmp_board, tmp_best = _tmp_key(board_key), _tmp_key(best_key)
+
+    # Flag first, as for rebuild_leaderboards(): sessions recorded after the
+    # snapshot query starts are raised into the :rebuild keys as well
+    pipe = redis_client.pipeline()
+    pipe.delete(tmp_board, tmp_best)
+    pipe.set(rebuilding_key, '1', ex=LB_REBUILD_LOCK_TTL)
+    pipe.execute()
+
+    best_per_level = db.session.query(
+        GameSession.user_id,
+        GameSession.level_id,
+        db.func.max(GameSession.score)
+    ).filter(
+        GameSession.created_at >= start,
+        GameSession.created_at < start + timedelta(days=7),
+        GameSession.is_won == True
+    ).group_by(
+        GameSession.user_id,
+        GameSession.level_id
+    )
+
+    def write_batch(args):
+        if not _weekly_rebuild_batch(
+            keys=[tmp_board, tmp_best, rebuilding_key],
+            args=[LB_WEEKLY_TTL, LB_REBUILD_LOCK_TTL, *args],
+            client=redis_client,
+        ):
+            raise RuntimeError("weekly leaderboard rebuild outlived its flag")
+
+    users = set()
+    args = []
+    for count, (user_id, level_id, best) in enumerate(best_per_level.yield_per(LB_REBUILD_BATCH), 1):
+        args.extend((f"{user_id}:{level_id}", _member(user_id), best or 0))
+        users.add(user_id)
+        if count % LB_REBUILD_BATCH == 0:
+            write_batch(args)
+            args = []
+    write_batch(args)
+
+    if _weekly_swap(
+        keys=[tmp_board, tmp_best, board_key, best_key, rebuilding_key, ready_key],
+        args=[LB_WEEKLY_TTL],
+        client=redis_client,
+    ) < 0:
+        raise RuntimeError("weekly leaderboard rebuild outlived its flag")
+    return len(users)
+
+
+def _week_ready(redis_client, start) -> bool:
+    """Ready flag set and, if the week has a board, the board and its bests not evicted"""
+    board_key, best_key, ready_key, _, _ = _weekly_keys(start)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(ready_key)
+    pipe.exists(board_key, best_key)
+    ready, found = pipe.execute()
+    if ready is None:
+        return False
+    return _decode(ready) == '0' or found == 2
+
+
+def _ensure_week_built(redis_client, start) -> bool:
+    """Build the week's board from Postgres (new week, Redis flushed or the board evicted)."""
+    board_key, _, _, lock_key, _ = _weekly_keys(start)
+    if _week_ready(redis_client, start):
+        return True
+
+    if not redis_client.set(lock_key, '1', nx=True, ex=LB_REBUILD_LOCK_TTL):
+        return bool(redis_client.exists(board_key))
+
+    try:
+        rebuild_weekly(start)
+    except Exception as e:
+        print(f"Weekly leaderboard rebuild failed: {e}")
+    finally:
+        redis_client.delete(lock_key)
+    return _week_ready(redis_client, start)
+
+
+def get_weekly_top(limit: int, after: tuple = None) -> list | None:
+    """A page of the current week, or None if the caller should fall back to SQL.
+
+    `after` is a (weekly_score, user_id, rank) cursor, as for get_top().
+    """
+    redis_client = get_redis()
+    if not redis_client:
+        return None
+
+    start = week_start()
+    board_key = _weekly_keys(start)[0]
+
+    def render(entries):
+        members = [m for m, _ in entries]
+        usernames = {}
+        missing = []
+        for member, raw in zip(members, redis_client.hmget(LB_META_KEY, members)):
+            if raw:
+                usernames[member] = json.loads(raw)['username']
+            else:
+                missing.append(int(member))
+        if missing:
+            for user in User.query.filter(User.id.in_(missing), User.is_verified == True):
+                usernames[_member(user.id)] = user.username
+        return {
+            m: {'username': usernames[m], 'weekly_score': score}
+            for m, score in entries if m in usernames
+        }
+
+    try:
+        if not _ensure_week_built(redis_client, start):
+            return None
+        return _scan_page(redis_client, board_key, limit, after, render)
+    except Exception as e:
+        print(f"Redis error reading weekly leaderboard: {e}")
+        return None
@@ -0,0 +1,101 @@
+"""
+In-process level catalog.
+
+Levels only change through the admin level editor, yet every game request
+used to load them from Postgres and re-parse item_types. Each worker now
+keeps an immutable snapshot of all levels, with score caps and response JSON
+(plus its ETag) computed once per load.
+
+The admin bumps LEVEL_CATALOG_VERSION_KEY in Redis whenever a level is saved
+or deleted; see get_versioned() for how workers pick that up.
+"""
+from dataclasses import dataclass
+
+from flask import current_app
+
+from app.models.level import Level
+from app.utils.http_cache import etag_for
+from app.utils.redis_cache import get_versioned
+
+LEVEL_CATALOG_VERSION_KEY = "levels:version"
+
+
+@dataclass(frozen=True)
+class CachedLevel:
+    """Read-only snapshot of a Level row (do not mutate targets/obstacles)"""
+    id: int
+    name: str
+    order: int
+    grid_width: int
+    grid_height: int
+    max_moves: int
+    item_types: tuple
+    targets: dict
+    obstacles: list
+    is_active: bool
+    max_score: int
+    data: dict   # Level.to_dict()
+    json: bytes  # {"level": data}, serialized
+    etag: str
+
+    def to_dict(self) -> dict:
+        return dict(self.data)
+
+
+@dataclass(frozen=True)
+class LevelCatalog:
+    levels: dict         # id -> CachedLevel, inactive levels included
+    active: tuple        # active levels in play order
+    active_json: bytes   # {"levels": [...]} for GET /api/levels
+    active_etag: str
+
+
+def max_allowed_score(targets: dict, grid_width: int, grid_height: int, max_moves: int) -> int:
+    """Server-side score cap for a level (anti-cheat)"""
+    # Max score formula: min_score * 3 (generous cap covering 3-star + bonuses)
+    min_score_target = targets.get('min_score', 1000) if targets else 1000
+    # Also cap based on grid: max theoretical = grid_cells * max_moves * 100
+    grid_cap = grid_width * grid_height * max_moves * 100
+    return min(min_score_target * 3, grid_cap)
+
+
+def _snapshot(level: Level) -> CachedLevel:
+    data = level.to_dict()
+    body = current_app.json.dumps({'level': data}).encode()
+    return CachedLevel(
+        id=level.id,
+        name=level.name,
+        order=level.order,
+        grid_width=level.grid_width,
+        grid_height=level.grid_height,
+        max_moves=level.max_moves,
+        item_types=tuple(data['item_types']),
+        targets=level.targets,
+        obstacles=data['obstacles'],
+        is_active=bool(level.is_active),
+        max_score=max_allowed_score(level.targets, level.grid_width, level.grid_height, level.max_moves),
+        data=data,
+        json=body,
+        etag=etag_for(body),
+    )
+
+
+def _load() -> LevelCatalog:
+    levels = [_snapshot(level) for level in Level.query.order_by(Level.order, Level.id).all()]
+    active = tuple(level for level in levels if level.is_active)
+    body = current_app.json.dumps({'levels': [level.data for level in active]}).encode()
+    return LevelCatalog(
+        levels={level.id: level for level in levels},
+        active=active,
+        active_json=body,
+        active_etag=etag_for(body),
+    )
+
+
+def get_catalog() -> LevelCatalog:
+    """The current worker's level catalog, reloaded when the admin changed levels"""
+    return get_versioned('level_catalog', LEVEL_CATALOG_VERSION_KEY, _load)
+
+
+def get_level(level_id: int) -> CachedLevel | None:
+    return get_catalog().levels.get(level_id)
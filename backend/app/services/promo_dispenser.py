@@ -0,0 +1,158 @@
+"""
+Promo code dispensing.
+
+Claims used to SELECT the first free code of a pool FOR UPDATE, so a burst of
+claimers queued on the same row, and then all updated the pool's used_codes
+counter, a second hot row. Now:
+
+- take_promo_code() locks the first free code with FOR UPDATE SKIP LOCKED
+  (over the ix_promo_codes_free partial index): concurrent claimers each get
+  a different row instead of waiting on one.
+- Claims don't touch promo_code_pools. record_claim() only marks the pool
+  dirty (in Redis, or in this worker without it); a background thread
+  recounts used_codes of the dirty pools from promo_codes every
+  PROMO_RECONCILE_INTERVAL seconds, one worker at a time. `flask
+  promo-reconcile` recounts every pool.
+"""
+import threading
+import time
+
+from flask import current_app
+
+from app import db
+from app.models.promo_code import PromoCodePool, PromoCode
+from app.utils.redis_cache import get_redis
+from app.utils.timezone import now_moscow
+
+PROMO_DIRTY_POOLS_KEY = "promo_pools:dirty"
+PROMO_RECONCILE_LOCK_KEY = "promo_pools:reconcile_lock"
+PROMO_RECONCILE_INTERVAL = 5
+
+_local_dirty = set()
+_local_lock = threading.Lock()
+_reconciler = None
+
+
+def take_promo_code(pool: PromoCodePool, user_id: int = None) -> PromoCode | None:
+    """Mark a free code of the pool as used; the caller commits.
+
+    None when the pool is empty — or when every remaining code is being
+    claimed by another transaction right now.
+    """
+    code = PromoCode.query.filter(
+        PromoCode.pool_id == pool.id,
+        PromoCode.is_used.is_not(True),  # NULL from bulk imports counts as free
+    ).order_by(PromoCode.id).with_for_update(skip_locked=True).first()
+    if not code:
+        return None
+
+    code.is_used = True
+    code.used_by_user_id = user_id
+    code.used_at = now_moscow()
+    return code
+
+
+def reconcile_pool_counters(pool_ids=None) -> None:
+    """Set used_codes from the codes themselves (all pools when pool_ids is None)"""
+    used = db.select(db.func.count(PromoCode.id)).where(
+        PromoCode.pool_id == PromoCodePool.id,
+        PromoCode.is_used == True,
+    ).correlate(PromoCodePool).scalar_subquery()
+
+    stmt = db.update(PromoCodePool).values(used_codes=used)
+    if pool_ids is not None:
+        if not pool_ids:
+            return
+        stmt = stmt.where(PromoCodePool.id.in_(pool_ids))
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def record_claim(pool_id: int) -> None:
+    """Call after committing a claim: schedules the pool's used_codes recount"""
+    redis_client = get_redis()
+    try:
+        if redis_client:
+            redis_client.sadd(PROMO_DIRTY_POOLS_KEY, pool_id)
+        else:
+            _mark_local({pool_id})
+    except Exception as e:
+        print(f"Redis error scheduling promo counters: {e}")
+        _mark_local({pool_id})
+    _ensure_reconciler(current_app._get_current_object())
+
+
+def _mark_local(pool_ids) -> None:
+    with _local_lock:
+        _local_dirty.update(pool_ids)
+
+
+def _take_local() -> set:
+    with _local_lock:
+        pool_ids = set(_local_dirty)
+        _local_dirty.clear()
+    return pool_ids
+
+
+def reconcile_dirty_pools() -> int:
+    """Recount used_codes of the pools claimed from since the last run; needs an app context.
+
+    With Redis the dirty set is shared and one worker per interval recounts it.
+    Pools whose recount fails are marked dirty again. Returns pools recounted.
+    """
+    pool_ids = _take_local()
+    redis_client = get_redis()
+    from_redis = False
+    if redis_client:
+        try:
+            if pool_ids:
+                redis_client.sadd(PROMO_DIRTY_POOLS_KEY, *pool_ids)
+                pool_ids = set()
+            if redis_client.set(PROMO_RECONCILE_LOCK_KEY, 1, nx=True, ex=PROMO_RECONCILE_INTERVAL):
+                pool_ids = {int(p) for p in redis_client.spop(PROMO_DIRTY_POOLS_KEY, 1000) or []}
+                from_redis = True
+        except Exception as e:
+            print(f"Redis error reading dirty promo pools: {e}")
+
+    if not pool_ids:
+        return 0
+    try:
+        reconcile_pool_counters(sorted(pool_ids))
+        return len(pool_ids)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Promo counter reconcile error: {e}")
+        _requeue(redis_client if from_redis else None, pool_ids)
+        return 0
+
+
+def _requeue(redis_client, pool_ids: set) -> None:
+    """Mark pools dirty again after a failed recount"""
+    if redis_client:
+        try:
+            redis_client.sadd(PROMO_DIRTY_POOLS_KEY, *pool_ids)
+            return
+        except Exception as e:
+            print(f"Redis error requeueing promo pools: {e}")
+    _mark_local(pool_ids)
+
+
+def _run_reconciler(app):
+    while True:
+        time.sleep(PROMO_RECONCILE_INTERVAL)
+        with app.app_context():
+            try:
+                reconcile_dirty_pools()
+            finally:
+                db.session.remove()
+
+
+def _ensure_reconciler(app):
+    global _reconciler
+    if _reconciler is not None:
+        return
+    with _local_lock:
+        if _reconciler is not None:
+            return
+        _reconciler = threading.Thread(target=_run_reconciler, args=(app,), name='promo-reconciler', daemon=True)
+        _reconciler.start()
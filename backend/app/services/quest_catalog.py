@@ -0,0 +1,80 @@
+"""
+In-process quest page catalog.
+
+Every quest request used to load the active QuestPage rows again (guest_promo
+once per submitted entry). Each worker now keeps an immutable snapshot of the
+active pages in play order, indexed by id, slug and QR token, so a scan costs
+no page queries at all.
+
+The admin bumps QUEST_CATALOG_VERSION_KEY in Redis whenever a page is
+created, edited or deleted; see get_versioned() for how workers pick that up.
+"""
+import hashlib
+from dataclasses import dataclass
+
+from app.models.quest_page import QuestPage
+from app.utils.redis_cache import get_versioned
+
+QUEST_CATALOG_VERSION_KEY = "quest_pages:version"
+
+
+@dataclass(frozen=True)
+class CachedQuestPage:
+    """Read-only snapshot of an active QuestPage row"""
+    id: int
+    slug: str
+    order: int
+    title: str
+    fact_text: str | None
+    qr_token: str
+    points: int   # stored value, 0 if unset
+    data: dict    # to_dict() without the QR token
+
+    def to_dict(self, include_answer=False) -> dict:
+        data = dict(self.data)
+        if include_answer:
+            data['qr_token'] = self.qr_token
+        return data
+
+
+@dataclass(frozen=True)
+class QuestCatalog:
+    pages: tuple       # active pages in play order
+    by_id: dict
+    by_slug: dict
+    by_qr_token: dict
+    positions: dict    # page id -> index in pages (bit in a user's progress bitmap)
+    layout: bytes      # digest of the page order; progress bitmaps built for another order are stale
+
+
+def _snapshot(page: QuestPage) -> CachedQuestPage:
+    return CachedQuestPage(
+        id=page.id,
+        slug=page.slug,
+        order=page.order,
+        title=page.title,
+        fact_text=page.fact_text,
+        qr_token=page.qr_token,
+        points=page.points or 0,
+        data=page.to_dict(include_answer=False),
+    )
+
+
+def _load() -> QuestCatalog:
+    pages = tuple(
+        _snapshot(page)
+        for page in QuestPage.query.filter_by(is_active=True).order_by(QuestPage.order, QuestPage.id).all()
+    )
+    return QuestCatalog(
+        pages=pages,
+        by_id={page.id: page for page in pages},
+        by_slug={page.slug: page for page in pages},
+        by_qr_token={page.qr_token: page for page in pages},
+        positions={page.id: i for i, page in enumerate(pages)},
+        layout=hashlib.sha256(','.join(str(page.id) for page in pages).encode()).digest()[:8],
+    )
+
+
+def get_quest_catalog() -> QuestCatalog:
+    """The current worker's quest catalog, reloaded when the admin changed pages"""
+    return get_versioned('quest_catalog', QUEST_CATALOG_VERSION_KEY, _load)
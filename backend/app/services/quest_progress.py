@@ -0,0 +1,137 @@
+"""
+Per-user quest progress bitmaps.
+
+Which quest pages a user has answered is kept in Redis as a bitmap aligned to
+the quest catalog's play order (bit i = catalog.pages[i]), prefixed with the
+catalog layout it was built for. The current step is then the first zero bit,
+found with integer arithmetic instead of walking the pages against the user's
+QuestProgress rows.
+
+quest_progress rows stay the source of truth: a missing bitmap, one built for
+an older page order, or Redis being unavailable all mean one query to
+rebuild it. Writers set the bit after committing the row (only if the stored
+bitmap matches the layout) and drop the bitmap on bulk changes.
+"""
+from dataclasses import dataclass
+
+from app import db
+from app.models.quest_progress import QuestProgress
+from app.services.quest_catalog import CachedQuestPage, QuestCatalog
+from app.utils.redis_cache import get_redis
+
+QUEST_PROGRESS_PREFIX = "quest_progress:"
+QUEST_PROGRESS_TTL = 30 * 86400
+LAYOUT_BYTES = 8
+
+# Redis numbers bitmap bits from the most significant bit of each byte;
+# translating through this table gives little-endian bit order for int.from_bytes
+_REVERSED_BITS = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+# Set one page's bit, only if the stored bitmap was built for the same page layout
+MARK_ANSWERED_SCRIPT = """
+if redis.call('GETRANGE', KEYS[1], 0, 7) ~= ARGV[1] then
+    return 0
+end
+redis.call('SETBIT', KEYS[1], 64 + tonumber(ARGV[2]), 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+
+_mark_answered_script = None
+
+
+@dataclass(frozen=True)
+class QuestState:
+    """A user's answered pages as a bitmap over catalog.pages"""
+    catalog: QuestCatalog
+    mask: int
+
+    def is_answered(self, page: CachedQuestPage) -> bool:
+        return bool(self.mask >> self.catalog.positions[page.id] & 1)
+
+    def current_page(self, answered: CachedQuestPage = None) -> CachedQuestPage | None:
+        """First unanswered page in play order (treating `answered` as done), None when complete"""
+        mask = self.mask
+        if answered is not None:
+            mask |= 1 << self.catalog.positions[answered.id]
+        first_zero = (~mask & (mask + 1)).bit_length() - 1
+        return self.catalog.pages[first_zero] if first_zero < len(self.catalog.pages) else None
+
+
+def _key(user_id) -> str:
+    return f"{QUEST_PROGRESS_PREFIX}{user_id}"
+
+
+def _encode(catalog: QuestCatalog, mask: int) -> bytes:
+    size = max(1, (len(catalog.pages) + 7) // 8)
+    return catalog.layout + mask.to_bytes(size, 'little').translate(_REVERSED_BITS)
+
+
+def _decode(catalog: QuestCatalog, raw: bytes | None) -> int | None:
+    if not raw or len(raw) <= LAYOUT_BYTES or raw[:LAYOUT_BYTES] != catalog.layout:
+        return None
+    return int.from_bytes(raw[LAYOUT_BYTES:].translate(_REVERSED_BITS), 'little')
+
+
+def _rebuild_mask(user_id, catalog: QuestCatalog) -> int:
+    mask = 0
+    for page_id in db.session.scalars(
+        db.select(QuestProgress.quest_page_id).where(QuestProgress.user_id == user_id)
+    ):
+        position = catalog.positions.get(page_id)
+        if position is not None:
+            mask |= 1 << position
+    return mask
+
+
+def load_quest_state(user_id, catalog: QuestCatalog) -> QuestState:
+    """The user's progress bitmap: one Redis GET, or one query when it has to be rebuilt"""
+    redis_client = get_redis()
+    if redis_client:
+        try:
+            mask = _decode(catalog, redis_client.get(_key(user_id)))
+            if mask is not None:
+                return QuestState(catalog, mask)
+        except Exception as e:
+            print(f"Redis error reading quest progress: {e}")
+            redis_client = None
+
+    mask = _rebuild_mask(user_id, catalog)
+    if redis_client:
+        try:
+            redis_client.setex(_key(user_id), QUEST_PROGRESS_TTL, _encode(catalog, mask))
+        except Exception as e:
+            print(f"Redis error storing quest progress: {e}")
+    return QuestState(catalog, mask)
+
+
+def mark_answered(user_id, catalog: QuestCatalog, page: CachedQuestPage) -> bool:
+    """Set a page's bit after its QuestProgress row is committed"""
+    global _mark_answered_script
+    redis_client = get_redis()
+    if not redis_client:
+        return False
+    try:
+        if _mark_answered_script is None:
+            _mark_answered_script = redis_client.register_script(MARK_ANSWERED_SCRIPT)
+        return bool(_mark_answered_script(
+            keys=[_key(user_id)],
+            args=[catalog.layout, catalog.positions[page.id], QUEST_PROGRESS_TTL],
+            client=redis_client,
+        ))
+    except Exception as e:
+        print(f"Redis error marking quest progress: {e}")
+        return False
+
+
+def invalidate_quest_state(user_id) -> bool:
+    """Drop the bitmap (next read rebuilds it) after bulk progress changes"""
+    redis_client = get_redis()
+    if not redis_client:
+        return False
+    try:
+        redis_client.delete(_key(user_id))
+        return True
+    except Exception as e:
+        print(f"Redis error dropping quest progress: {e}")
+        return False
@@ -0,0 +1,135 @@
+"""
+Re-encryption of stored values after an ENCRYPTION_KEY rotation.
+
+Rotation: move the old key to ENCRYPTION_OLD_KEYS, set a new ENCRYPTION_KEY,
+restart, then run `flask reencrypt`. Each table is walked by id in batches;
+values not yet under the current key are rewritten with a compare-and-set
+UPDATE, so rows changed by the app in the meantime are left to the app.
+
+Progress per table is checkpointed in Redis under the current key's
+fingerprint, so an interrupted run resumes where it stopped; without Redis it
+starts over, skipping rows that are already done.
+"""
+import hashlib
+import os
+import time
+
+from prometheus_client import Counter
+from sqlalchemy import Text, bindparam, type_coerce
+
+from app import db
+from app.utils.encryption import EncryptedString, reencrypt
+from app.utils.redis_cache import get_redis
+
+REENCRYPT_BATCH_SIZE = 1000
+REENCRYPT_CHECKPOINT_TTL = 30 * 86400
+
+REENCRYPT_ROWS = Counter('reencrypt_rows_total', 'Rows scanned by the re-encryption job', ['table'])
+REENCRYPT_VALUES = Counter('reencrypt_values_total', 'Values rewritten under the current key', ['table'])
+
+
+def _encrypted_tables() -> dict:
+    """Table name -> (table, encrypted column names)"""
+    from app.models.user import User
+    from app.models.promo_code import PromoCode
+    from app.models.user_activity import UserActivity
+    from app.models.landing_visit import LandingVisit
+    from app.models.match3_prize import Match3Prize
+
+    tables = {}
+    for model in (User, PromoCode, UserActivity, LandingVisit, Match3Prize):
+        table = model.__table__
+        columns = [c.name for c in table.columns if isinstance(c.type, EncryptedString)]
+        tables[table.name] = (table, columns)
+    return tables
+
+
+def _checkpoint_key(table_name: str) -> str:
+    fingerprint = hashlib.sha256(os.environ.get('ENCRYPTION_KEY', '').encode()).hexdigest()[:12]
+    return f"reencrypt:{fingerprint}:{table_name}"
+
+
+def _read_checkpoint(table_name: str) -> int:
+    client = get_redis()
+    if not client:
+        return 0
+    try:
+        return int(client.get(_checkpoint_key(table_name)) or 0)
+    except Exception as e:
+        print(f"Redis error reading re-encryption checkpoint: {e}")
+        return 0
+
+
+def _write_checkpoint(table_name: str, last_id: int) -> None:
+    client = get_redis()
+    if not client:
+        return
+    try:
+        client.setex(_checkpoint_key(table_name), REENCRYPT_CHECKPOINT_TTL, last_id)
+    except Exception as e:
+        print(f"Redis error writing re-encryption checkpoint: {e}")
+
+
+def reencrypt_table(table_name: str, batch_size: int = REENCRYPT_BATCH_SIZE, restart: bool = False) -> dict:
+    """Re-encrypt one table's EncryptedString columns; needs an app context."""
+    table, columns = _encrypted_tables()[table_name]
+    # Raw column values: type_coerce to Text skips EncryptedString's encrypt/decrypt
+    raw = {name: type_coerce(table.c[name], Text) for name in columns}
+
+    update = db.update(table).where(
+        table.c.id == bindparam('_id'),
+        *(raw[name].is_not_distinct_from(bindparam(f'_old_{name}', type_=Text)) for name in columns)
+    ).values({name: bindparam(f'_new_{name}', type_=Text) for name in columns})
+
+    last_id = 0 if restart else _read_checkpoint(table_name)
+    stats = {'table': table_name, 'rows': 0, 'rewritten': 0, 'seconds': 0.0, 'rows_per_second': 0}
+    started = time.monotonic()
+
+    while True:
+        rows = db.session.execute(
+            db.select(table.c.id, *(raw[name].label(name) for name in columns))
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+
+        params = []
+        for row in rows:
+            values = row._mapping
+            rotated = {name: reencrypt(values[name]) for name in columns}
+            if not any(rotated.values()):
+                continue
+            param = {'_id': row.id}
+            for name in columns:
+                param[f'_old_{name}'] = values[name]
+                param[f'_new_{name}'] = rotated[name] or values[name]
+            params.append(param)
+
+        if params:
+            db.session.execute(update, params)
+        db.session.commit()
+
+        last_id = rows[-1].id
+        _write_checkpoint(table_name, last_id)
+        stats['rows'] += len(rows)
+        stats['rewritten'] += len(params)
+        REENCRYPT_ROWS.labels(table=table_name).inc(len(rows))
+        REENCRYPT_VALUES.labels(table=table_name).inc(len(params))
+
+    elapsed = time.monotonic() - started
+    stats['seconds'] = round(elapsed, 2)
+    stats['rows_per_second'] = round(stats['rows'] / elapsed) if elapsed else 0
+    return stats
+
+
+def reencrypt_all(batch_size: int = REENCRYPT_BATCH_SIZE, restart: bool = False, report=print) -> list:
+    """Re-encrypt every table with encrypted columns, reporting throughput per table."""
+    results = []
+    for table_name in _encrypted_tables():
+        stats = reencrypt_table(table_name, batch_size=batch_size, restart=restart)
+        report(f"{table_name}: {stats['rows']} rows scanned, {stats['rewritten']} rewritten "
+               f"in {stats['seconds']}s ({stats['rows_per_second']} rows/s)")
+        results.append(stats)
+    return results
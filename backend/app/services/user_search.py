@@ -0,0 +1,33 @@
+"""
+Backfill of the user_search_tokens blind index.
+
+New and edited users are indexed by the User model hooks; this fills in
+users that have no tokens yet (rows from before the index existed) or, with
+rebuild, re-indexes everyone — needed after HASH_PEPPER changes.
+"""
+from app import db
+from app.models.user import User
+from app.models.user_search_token import UserSearchToken, index_user_search
+
+SEARCH_BACKFILL_BATCH = 1000
+
+
+def backfill_user_search(batch_size: int = SEARCH_BACKFILL_BATCH, rebuild: bool = False) -> int:
+    """Index users in id batches; needs an app context. Returns users indexed."""
+    indexed = 0
+    last_id = 0
+    while True:
+        query = db.select(User.id, User.email, User.username).where(User.id > last_id)
+        if not rebuild:
+            query = query.where(~db.exists().where(UserSearchToken.user_id == User.id))
+        rows = db.session.execute(query.order_by(User.id).limit(batch_size)).all()
+        if not rows:
+            return indexed
+
+        connection = db.session.connection()
+        for row in rows:
+            index_user_search(connection, row.id, row.email, row.username)
+        db.session.commit()
+
+        indexed += len(rows)
+        last_id = rows[-1].id
@@ -2,23 +2,33 @@
 Field-level encryption for sensitive data (ФЗ-152, п.6.3).
 
 Uses Fernet (AES-128-CBC + HMAC-SHA256) for symmetric encryption.
-Key is loaded from ENCRYPTION_KEY environment variable.
+Key is loaded from ENCRYPTION_KEY environment variable; retired keys listed in
+ENCRYPTION_OLD_KEYS (comma-separated) still decrypt until
+app.services.reencryption has moved every value to the current key.
 Provides EncryptedString SQLAlchemy TypeDecorator for transparent encrypt/decrypt.
 """
 import hashlib
 import os
+from functools import lru_cache
 
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
 from sqlalchemy import Text
 from sqlalchemy.types import TypeDecorator
 
 
+@lru_cache(maxsize=8)
+def _build_fernet(key: str, old_keys: str = ''):
+    """Fernet for key, or MultiFernet (encrypts with key, decrypts with any) if old keys are set."""
+    fernets = [Fernet(k.strip().encode()) for k in [key, *old_keys.split(',')] if k.strip()]
+    return MultiFernet(fernets) if len(fernets) > 1 else fernets[0]
+
+
 def _get_fernet():
-    """Get Fernet instance from environment key."""
+    """Get the process-wide cipher for the configured keys (built once per key set)."""
     key = os.environ.get('ENCRYPTION_KEY')
     if not key:
         return None
-    return Fernet(key.encode() if isinstance(key, str) else key)
+    return _build_fernet(key, os.environ.get('ENCRYPTION_OLD_KEYS', ''))
 
 
 def encrypt(value: str) -> str:
@@ -45,6 +55,31 @@ def decrypt(value: str) -> str:
         return value
 
 
+def reencrypt(value: str) -> str | None:
+    """Re-encrypt a stored value under the current key.
+
+    Returns None when there is nothing to do: empty value, no key configured,
+    already encrypted with the current key, or a token no configured key can
+    read. Legacy plaintext gets encrypted.
+    """
+    key = os.environ.get('ENCRYPTION_KEY')
+    if not value or not key:
+        return None
+    token = value.encode('utf-8')
+    try:
+        _build_fernet(key).decrypt(token)
+        return None
+    except InvalidToken:
+        pass
+    try:
+        plaintext = _get_fernet().decrypt(token)
+    except InvalidToken:
+        if value.startswith('gAAAA'):
+            return None  # encrypted with a key we no longer have — leave it alone
+        plaintext = token
+    return _build_fernet(key).encrypt(plaintext).decode('utf-8')
+
+
 def compute_hash(value: str) -> str:
     """Compute SHA-256 hash for blind index lookups."""
     if not value:
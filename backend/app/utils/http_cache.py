@@ -0,0 +1,25 @@
+"""
+HTTP caching helpers for public, rarely changing resources.
+
+Bodies are serialized once by the caller's cache; responses carry a strong
+ETag and Cache-Control so browsers and nginx can revalidate with
+If-None-Match and get a bodyless 304.
+"""
+import hashlib
+
+from flask import Response, request
+
+PUBLIC_MAX_AGE = 60  # seconds browsers/nginx may reuse a response unrevalidated
+
+
+def etag_for(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def cached_json_response(body: bytes, etag: str, max_age: int = PUBLIC_MAX_AGE) -> Response:
+    """Pre-serialized JSON body as a conditional response (304 on a matching If-None-Match)"""
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response.make_conditional(request)
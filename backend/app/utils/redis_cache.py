@@ -4,8 +4,16 @@ Provides graceful fallback when Redis is unavailable.
 """
 import json
 import functools
-from flask import request, jsonify
-from datetime import datetime
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, make_response, request, jsonify
+from datetime import datetime, timedelta
+from prometheus_client import Counter, Gauge
+from app.utils.timezone import now_moscow
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 
 # Will be set by app initialization
 redis_client = None
@@ -14,12 +22,116 @@ redis_client = None
 def init_redis(client):
     """Initialize Redis client from app"""
     global redis_client
-    redis_client = client
+    redis_client = _track_outcomes(client)
 
 
 def get_redis():
-    """Get Redis client (may be None if unavailable)"""
-    return redis_client
+    """Get Redis client (None if unavailable or the circuit breaker is open)"""
+    return redis_client if redis_available() else None
+
+
+# ==================== CIRCUIT BREAKER ====================
+
+# After REDIS_BREAKER_FAILURES consecutive connection errors/timeouts the
+# worker stops calling Redis for REDIS_BREAKER_COOLDOWN seconds; then one
+# probe call is let through (half-open) and its outcome closes or re-opens it.
+# Every command reports its outcome from the client itself (_track_outcomes);
+# a probe taken by a caller that never sends one is given up on after
+# REDIS_BREAKER_PROBE_TIMEOUT and the breaker goes back to open.
+REDIS_BREAKER_FAILURES = 5
+REDIS_BREAKER_COOLDOWN = 10
+REDIS_BREAKER_PROBE_TIMEOUT = 5
+
+BREAKER_CLOSED, BREAKER_OPEN, BREAKER_HALF_OPEN = 0, 1, 2
+
+REDIS_BREAKER_STATE = Gauge(
+    'redis_circuit_breaker_state', 'Redis circuit breaker state (0 closed, 1 open, 2 half-open)'
+)
+REDIS_BREAKER_OPENED = Counter(
+    'redis_circuit_breaker_opened_total', 'Times the Redis circuit breaker opened'
+)
+RATE_LIMIT_CHECKS = Counter(
+    'rate_limit_checks_total', 'Rate limit checks by backend (local = in-process fallback)', ['backend']
+)
+
+_breaker_lock = threading.Lock()
+_breaker = {'state': BREAKER_CLOSED, 'failures': 0, 'opened_at': 0.0}
+
+
+def _set_breaker_state(state: int) -> None:
+    _breaker['state'] = state
+    REDIS_BREAKER_STATE.set(state)
+
+
+def redis_available() -> bool:
+    """True if Redis is configured and the circuit breaker lets calls through"""
+    if not redis_client:
+        return False
+    if _breaker['state'] == BREAKER_CLOSED:
+        return True
+
+    with _breaker_lock:
+        now = time.monotonic()
+        if _breaker['state'] == BREAKER_HALF_OPEN and now - _breaker['opened_at'] >= REDIS_BREAKER_PROBE_TIMEOUT:
+            # The probe never reported back: open again, cooldown counted from the probe
+            _set_breaker_state(BREAKER_OPEN)
+        if _breaker['state'] == BREAKER_OPEN and now - _breaker['opened_at'] >= REDIS_BREAKER_COOLDOWN:
+            # Let this caller probe; others keep skipping Redis until it reports back
+            _breaker['opened_at'] = now
+            _set_breaker_state(BREAKER_HALF_OPEN)
+            return True
+    return False
+
+
+def _record_redis_success() -> None:
+    if _breaker['state'] != BREAKER_CLOSED or _breaker['failures']:
+        with _breaker_lock:
+            _breaker['failures'] = 0
+            _set_breaker_state(BREAKER_CLOSED)
+
+
+def _record_redis_error(error: Exception) -> None:
+    """Count connection errors/timeouts towards opening the breaker"""
+    if not isinstance(error, (RedisConnectionError, RedisTimeoutError)):
+        return
+    with _breaker_lock:
+        _breaker['failures'] += 1
+        if _breaker['state'] == BREAKER_HALF_OPEN or (
+            _breaker['state'] == BREAKER_CLOSED and _breaker['failures'] >= REDIS_BREAKER_FAILURES
+        ):
+            _breaker['opened_at'] = time.monotonic()
+            _set_breaker_state(BREAKER_OPEN)
+            REDIS_BREAKER_OPENED.inc()
+
+
+def _tracked(call):
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        try:
+            result = call(*args, **kwargs)
+        except Exception as e:
+            _record_redis_error(e)
+            raise
+        _record_redis_success()
+        return result
+    return wrapper
+
+
+def _track_outcomes(client):
+    """Report every command and pipeline round trip of `client` to the breaker"""
+    if client is None:
+        return None
+    pipeline = client.pipeline
+
+    def tracked_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        pipe.execute = _tracked(pipe.execute)
+        return pipe
+
+    # Scripts go through evalsha -> execute_command too
+    client.execute_command = _tracked(client.execute_command)
+    client.pipeline = tracked_pipeline
+    return client
 
 
 # ==================== VERIFICATION CODES ====================
@@ -33,7 +145,7 @@ def store_verification_code(email: str, code: str) -> bool:
     Store verification code in Redis with TTL.
     Returns True if stored successfully, False if Redis unavailable.
     """
-    if not redis_client:
+    if not redis_available():
         return False
 
     key = f"{VERIFICATION_CODE_PREFIX}{email.lower()}"
@@ -50,7 +162,7 @@ def get_verification_code(email: str) -> str | None:
     Get verification code from Redis.
     Returns None if not found or Redis unavailable.
     """
-    if not redis_client:
+    if not redis_available():
         return None
 
     key = f"{VERIFICATION_CODE_PREFIX}{email.lower()}"
@@ -64,7 +176,7 @@ def get_verification_code(email: str) -> str | None:
 
 def delete_verification_code(email: str) -> bool:
     """Delete verification code after successful verification"""
-    if not redis_client:
+    if not redis_available():
         return False
 
     key = f"{VERIFICATION_CODE_PREFIX}{email.lower()}"
@@ -81,60 +193,193 @@ RATE_LIMIT_PREFIX = "ratelimit:"
 JWT_BLOCKLIST_PREFIX = "jwt_blocklist:"
 
 
-def blocklist_token(jti: str, ttl_seconds: int = 86400 * 7) -> bool:
+# Every revocation is also logged in a sorted set scored by revocation time.
+# Each worker keeps the revoked JTIs in memory and pulls the log's tail at
+# most every JWT_BLOCKLIST_SYNC_INTERVAL seconds, so the common "not revoked"
+# answer needs no round trip and is at most that many seconds stale.
+JWT_BLOCKLIST_LOG_KEY = f"{JWT_BLOCKLIST_PREFIX}log"
+JWT_BLOCKLIST_TTL = 86400 * 7  # access token lifetime
+JWT_BLOCKLIST_SYNC_INTERVAL = 1
+# Each pull re-reads this many seconds of log to absorb clock skew between workers
+JWT_BLOCKLIST_SYNC_OVERLAP = 5
+
+
+def _blocklist_filter() -> dict:
+    """This worker's revoked-JTI filter: {jti: revoked_at}, plus sync state.
+
+    Request threads add to and replace 'revoked' under 'lock'; membership
+    checks read it without locking.
+    """
+    return current_app.extensions.setdefault(
+        'jwt_blocklist', {'revoked': {}, 'pulled_until': None, 'synced_at': None, 'lock': threading.Lock()}
+    )
+
+
+def _sync_blocklist(blocklist: dict) -> None:
+    """Pull revocations newer than the last sync (all live ones on first sync)"""
+    now = time.time()
+    since = (blocklist['pulled_until'] - JWT_BLOCKLIST_SYNC_OVERLAP
+             if blocklist['pulled_until'] else now - JWT_BLOCKLIST_TTL)
+    entries = redis_client.zrangebyscore(JWT_BLOCKLIST_LOG_KEY, since, '+inf', withscores=True)
+
+    with blocklist['lock']:
+        revoked = blocklist['revoked']
+        for jti, revoked_at in entries:
+            revoked[jti.decode() if isinstance(jti, bytes) else jti] = revoked_at
+        if entries:
+            cutoff = now - JWT_BLOCKLIST_TTL
+            blocklist['revoked'] = {jti: at for jti, at in revoked.items() if at > cutoff}
+
+        blocklist['pulled_until'] = now
+        blocklist['synced_at'] = time.monotonic()
+
+
+def blocklist_token(jti: str, ttl_seconds: int = JWT_BLOCKLIST_TTL) -> bool:
     """Add a JWT token ID to the blocklist. TTL matches token expiry (7 days)."""
-    if not redis_client:
+    now = time.time()
+    blocklist = _blocklist_filter()
+    with blocklist['lock']:
+        blocklist['revoked'][jti] = now  # effective on this worker right away
+    if not redis_available():
         return False
     try:
-        redis_client.setex(f"{JWT_BLOCKLIST_PREFIX}{jti}", ttl_seconds, "1")
+        pipe = redis_client.pipeline()
+        pipe.setex(f"{JWT_BLOCKLIST_PREFIX}{jti}", ttl_seconds, "1")
+        pipe.zadd(JWT_BLOCKLIST_LOG_KEY, {jti: now})
+        pipe.zremrangebyscore(JWT_BLOCKLIST_LOG_KEY, '-inf', now - JWT_BLOCKLIST_TTL)
+        pipe.execute()
         return True
     except Exception:
         return False
 
 
 def is_token_blocklisted(jti: str) -> bool:
-    """Check if a JWT token ID has been revoked."""
-    if not redis_client:
+    """Check if a JWT token ID has been revoked (local filter, Redis when it is not warm)."""
+    blocklist = _blocklist_filter()
+    if jti in blocklist['revoked']:
+        return True
+
+    synced_at = blocklist['synced_at']
+    if synced_at is not None and time.monotonic() - synced_at < JWT_BLOCKLIST_SYNC_INTERVAL:
+        return False
+
+    if not redis_available():
         return False  # Fail open: don't lock out users if Redis is down
     try:
-        return redis_client.exists(f"{JWT_BLOCKLIST_PREFIX}{jti}") > 0
-    except Exception:
+        _sync_blocklist(blocklist)
+    except Exception as e:
+        print(f"Redis error syncing JWT blocklist: {e}")
+        blocklist['synced_at'] = None  # cold again: next request retries
         return False
+    return jti in blocklist['revoked']
 
 
-def check_rate_limit(key: str, limit: int, window_seconds: int) -> tuple[bool, int]:
-    """
-    Check if rate limit exceeded using sliding window.
-    Returns (is_allowed, remaining_requests).
+def backfill_blocklist_log() -> int:
+    """Log revocations that only exist as jwt_blocklist:<jti> keys.
+
+    Tokens revoked before the log existed were stored as per-JTI keys only;
+    their revocation time is recovered from the key's remaining TTL.
+    Returns the number of JTIs added to the log.
     """
-    if not redis_client:
-        # Fail open for non-game endpoints (login, register) to avoid lockout
-        # Game endpoints use validate_game_session which fails closed
-        return True, limit
+    if not redis_available():
+        return 0
+
+    now = time.time()
+    added = 0
+    for key in redis_client.scan_iter(match=f"{JWT_BLOCKLIST_PREFIX}*", count=1000):
+        name = key.decode() if isinstance(key, bytes) else key
+        if name == JWT_BLOCKLIST_LOG_KEY:
+            continue
+        ttl = redis_client.ttl(name)
+        if ttl == -2:
+            continue  # expired since the scan
+        if ttl < 0:
+            ttl = JWT_BLOCKLIST_TTL  # no expiry: treat as just revoked
+        revoked_at = now - max(0, JWT_BLOCKLIST_TTL - ttl)
+        added += redis_client.zadd(JWT_BLOCKLIST_LOG_KEY, {name[len(JWT_BLOCKLIST_PREFIX):]: revoked_at}, nx=True)
+    return added
+
+
+# KEYS: limiter key
+# ARGV: emission interval (ms), limit
+# GCRA: the key holds the theoretical arrival time (TAT) of the next request.
+# A request is admitted while TAT stays within limit * interval of now, which
+# allows bursts of `limit` and then one request per interval. Returns
+# {allowed, remaining, ms until fully reset, ms until next admission}.
+RATE_LIMIT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - interval * limit
+if allow_at > now then
+    return {0, 0, tat - now, allow_at - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return {1, math.floor((now - allow_at) / interval), new_tat - now, 0}
+"""
 
-    full_key = f"{RATE_LIMIT_PREFIX}{key}"
+_rate_limit_script = None
+
+# In-process fallback: one token bucket per key, least recently used evicted
+LOCAL_RATE_LIMIT_MAX_KEYS = 10000
+_local_buckets_lock = threading.Lock()
 
-    try:
-        current = redis_client.get(full_key)
 
-        if current is None:
-            # First request in window
-            redis_client.setex(full_key, window_seconds, 1)
-            return True, limit - 1
+def _check_local_rate_limit(key: str, limit: int, window_seconds: int) -> tuple[bool, int, int, int]:
+    """Token bucket per worker, used while Redis is down (limits are per worker then)"""
+    rate = limit / window_seconds  # tokens per second
+    now = time.monotonic()
+    with _local_buckets_lock:
+        buckets = current_app.extensions.setdefault('local_rate_limits', OrderedDict())
+        tokens, updated_at = buckets.pop(key, (limit, now))
+        tokens = min(limit, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        buckets[key] = (tokens, now)
+        if len(buckets) > LOCAL_RATE_LIMIT_MAX_KEYS:
+            buckets.popitem(last=False)
 
-        count = int(current)
-        if count >= limit:
-            # Rate limit exceeded
-            ttl = redis_client.ttl(full_key)
-            return False, 0
+    retry_after = 0 if allowed else math.ceil((1 - tokens) / rate)
+    return allowed, int(tokens), math.ceil((limit - tokens) / rate), retry_after
 
-        # Increment counter
-        redis_client.incr(full_key)
-        return True, limit - count - 1
 
+def check_rate_limit(key: str, limit: int, window_seconds: int) -> tuple[bool, int, int, int]:
+    """
+    Check and count one request against a GCRA limiter ("limit per window",
+    smoothed: a full burst, then one request per window/limit).
+    One EVALSHA, atomic under concurrency. Falls back to an in-process token
+    bucket when Redis is unavailable.
+    Returns (is_allowed, remaining_requests, reset_seconds, retry_after_seconds).
+    """
+    global _rate_limit_script
+    full_key = f"{RATE_LIMIT_PREFIX}{key}"
+    if not redis_available():
+        RATE_LIMIT_CHECKS.labels('local').inc()
+        return _check_local_rate_limit(full_key, limit, window_seconds)
+
+    interval_ms = max(1, window_seconds * 1000 // limit)
+
+    try:
+        if _rate_limit_script is None:
+            _rate_limit_script = redis_client.register_script(RATE_LIMIT_SCRIPT)
+        allowed, remaining, reset_ms, retry_ms = _rate_limit_script(
+            keys=[full_key], args=[interval_ms, limit], client=redis_client
+        )
     except Exception as e:
         print(f"Redis rate limit error: {e}")
-        return True, limit
+        RATE_LIMIT_CHECKS.labels('local').inc()
+        return _check_local_rate_limit(full_key, limit, window_seconds)
+
+    RATE_LIMIT_CHECKS.labels('redis').inc()
+    return bool(allowed), int(remaining), -(-int(reset_ms) // 1000), -(-int(retry_ms) // 1000)
 
 
 def rate_limit(limit: int, window_seconds: int, key_func=None):
@@ -147,6 +392,9 @@ def rate_limit(limit: int, window_seconds: int, key_func=None):
         key_func: Optional function to generate key (receives request)
                   Default: uses IP + endpoint
 
+    Responses carry X-RateLimit-Limit / -Remaining / -Reset (seconds until
+    the full quota is back); 429s also carry Retry-After.
+
     Usage:
         @rate_limit(5, 60)  # 5 requests per minute
         def my_endpoint():
@@ -163,18 +411,24 @@ def rate_limit(limit: int, window_seconds: int, key_func=None):
                 endpoint = request.endpoint or 'unknown'
                 key = f"{ip}:{endpoint}"
 
-            is_allowed, remaining = check_rate_limit(key, limit, window_seconds)
+            is_allowed, remaining, reset_after, retry_after = check_rate_limit(key, limit, window_seconds)
+            headers = {
+                'X-RateLimit-Limit': str(limit),
+                'X-RateLimit-Remaining': str(remaining),
+                'X-RateLimit-Reset': str(reset_after),
+            }
 
             if not is_allowed:
-                return jsonify({
+                response = make_response(jsonify({
                     'error': 'Too many requests. Please try again later.',
-                    'retry_after': window_seconds
-                }), 429
-
-            response = f(*args, **kwargs)
-
-            # Add rate limit headers if response is a tuple (response, status_code)
-            # or a Response object
+                    'retry_after': retry_after
+                }), 429)
+                response.headers.update(headers)
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            response.headers.update(headers)
             return response
 
         return wrapped
@@ -206,16 +460,57 @@ def rate_limit_resend_code():
 
 LEADERBOARD_PREFIX = "leaderboard:"
 LEADERBOARD_TTL = 60  # Cache for 1 minute
+# Cache keys embed a generation number; bumping it retires every cached board
+# at once without walking the keyspace. Old generations simply expire.
+LEADERBOARD_VERSION_KEY = f"{LEADERBOARD_PREFIX}version"
+LEADERBOARD_BUMP_LOCK_KEY = f"{LEADERBOARD_PREFIX}version_bump"
+LEADERBOARD_BUMP_PENDING_KEY = f"{LEADERBOARD_PREFIX}version_pending"
+# Score changes are coalesced: the generation moves at most once per interval,
+# and a change held back by the interval moves it on the first read after
+LEADERBOARD_REFRESH_INTERVAL = int(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', 10))
+
+
+# Single-flight rebuilds: one worker recomputes an expired board while the
+# others keep serving the previous value (stale-while-revalidate)
+LEADERBOARD_LOCK_TTL = 30
+LEADERBOARD_LOCK_WAIT = 2.0  # How long a cold reader waits for the lock holder
+LEADERBOARD_STALE_FACTOR = 10  # Hard TTL = soft TTL * factor
+
+
+def _leaderboard_key(key: str, version: int = None) -> str:
+    """Full cache key for a leaderboard generation (current by default)"""
+    if version is None:
+        version = _current_leaderboard_version()
+    return f"{LEADERBOARD_PREFIX}v{version}:{key}"
+
+
+def _current_leaderboard_version() -> int:
+    """The cache generation, applying a bump held back by the coalescing interval"""
+    version, pending = redis_client.mget(LEADERBOARD_VERSION_KEY, LEADERBOARD_BUMP_PENDING_KEY)
+    if pending and redis_client.set(LEADERBOARD_BUMP_LOCK_KEY, 1, nx=True, ex=LEADERBOARD_REFRESH_INTERVAL):
+        # Cleared before the INCR: a change that sets it again in between is covered by the INCR
+        redis_client.delete(LEADERBOARD_BUMP_PENDING_KEY)
+        return redis_client.incr(LEADERBOARD_VERSION_KEY)
+    return int(version or 0)
+
+
+def _read_envelope(full_key: str) -> dict | None:
+    data = redis_client.get(full_key)
+    return json.loads(data) if data else None
+
+
+def _write_envelope(full_key: str, data: list, ttl: int):
+    envelope = {'built_at': time.time(), 'data': data}
+    redis_client.setex(full_key, ttl, json.dumps(envelope))
 
 
 def cache_leaderboard(key: str, data: list, ttl: int = LEADERBOARD_TTL) -> bool:
     """Cache leaderboard data"""
-    if not redis_client:
+    if not redis_available():
         return False
 
-    full_key = f"{LEADERBOARD_PREFIX}{key}"
     try:
-        redis_client.setex(full_key, ttl, json.dumps(data))
+        _write_envelope(_leaderboard_key(key), data, ttl)
         return True
     except Exception as e:
         print(f"Redis error caching leaderboard: {e}")
@@ -224,38 +519,150 @@ def cache_leaderboard(key: str, data: list, ttl: int = LEADERBOARD_TTL) -> bool:
 
 def get_cached_leaderboard(key: str) -> list | None:
     """Get cached leaderboard data"""
-    if not redis_client:
+    if not redis_available():
         return None
 
-    full_key = f"{LEADERBOARD_PREFIX}{key}"
     try:
-        data = redis_client.get(full_key)
-        return json.loads(data) if data else None
+        envelope = _read_envelope(_leaderboard_key(key))
+        return envelope['data'] if envelope else None
     except Exception as e:
         print(f"Redis error getting leaderboard: {e}")
         return None
 
 
-def invalidate_leaderboard(key: str = None):
-    """Invalidate leaderboard cache (all or specific)"""
-    if not redis_client:
-        return
+def get_or_build_leaderboard(key: str, builder, soft_ttl: int = LEADERBOARD_TTL,
+                             hard_ttl: int = None) -> tuple[list, bool]:
+    """
+    Cached leaderboard read with stampede protection.
+
+    Values younger than soft_ttl are served as-is. Past that (or after a
+    generation bump) one worker takes a Redis lock and calls builder() while
+    everyone else keeps serving the previous value, which lives until
+    hard_ttl. If builder() raises, the previous value is served instead
+    (stale-if-error). Returns (data, from_cache).
+    """
+    if not redis_available():
+        return builder(), False
+
+    hard_ttl = hard_ttl or soft_ttl * LEADERBOARD_STALE_FACTOR
+    try:
+        version = _current_leaderboard_version()
+        full_key = _leaderboard_key(key, version)
+        envelope = _read_envelope(full_key)
+        if envelope and time.time() - envelope['built_at'] < soft_ttl:
+            return envelope['data'], True
+
+        # Previous value: this generation's expired entry, else the last generation's
+        stale = envelope or (_read_envelope(_leaderboard_key(key, version - 1)) if version else None)
+        lock_key = f"{LEADERBOARD_PREFIX}lock:{full_key}"
+        have_lock = redis_client.set(lock_key, 1, nx=True, ex=LEADERBOARD_LOCK_TTL)
+    except Exception as e:
+        print(f"Redis error getting leaderboard: {e}")
+        return builder(), False
+
+    if not have_lock:
+        if stale:
+            return stale['data'], True
+        # Cold key: give the lock holder a moment before building ourselves
+        deadline = time.time() + LEADERBOARD_LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(0.05)
+            try:
+                envelope = _read_envelope(full_key)
+            except Exception:
+                break
+            if envelope:
+                return envelope['data'], True
+        return builder(), False
+
+    try:
+        data = builder()
+    except Exception as e:
+        if stale:
+            print(f"Leaderboard rebuild failed, serving stale value: {e}")
+            return stale['data'], True
+        raise
+    finally:
+        try:
+            redis_client.delete(lock_key)
+        except Exception:
+            pass
 
     try:
-        if key:
-            redis_client.delete(f"{LEADERBOARD_PREFIX}{key}")
-        else:
-            # Delete all leaderboard keys
-            for k in redis_client.scan_iter(f"{LEADERBOARD_PREFIX}*"):
-                redis_client.delete(k)
+        _write_envelope(full_key, data, hard_ttl)
     except Exception as e:
-        print(f"Redis error invalidating leaderboard: {e}")
+        print(f"Redis error caching leaderboard: {e}")
+    return data, False
+
+
+def bump_leaderboard_version() -> bool:
+    """Start a new cache generation.
+
+    Coalesced: if the generation already moved within
+    LEADERBOARD_REFRESH_INTERVAL, the bump is only marked pending and returns
+    False; the first leaderboard read after the interval applies it. So a
+    burst of changes is visible at most one interval late.
+    """
+    if not redis_available():
+        return False
+
+    try:
+        if not redis_client.set(LEADERBOARD_BUMP_LOCK_KEY, 1, nx=True, ex=LEADERBOARD_REFRESH_INTERVAL):
+            redis_client.set(LEADERBOARD_BUMP_PENDING_KEY, 1)
+            return False
+        redis_client.delete(LEADERBOARD_BUMP_PENDING_KEY)
+        redis_client.incr(LEADERBOARD_VERSION_KEY)
+        return True
+    except Exception as e:
+        print(f"Redis error bumping leaderboard version: {e}")
+        return False
 
 
 # ==================== GAME SESSION STATE ====================
 
 GAME_SESSION_PREFIX = "game_session:"
 GAME_SESSION_TTL = 3600  # 1 hour (games shouldn't take longer)
+# Per-user index of active sessions: ZSET of session_id scored by expiry time
+GAME_SESSION_USER_PREFIX = "game_sessions:user:"
+# A consumed session stays behind this long so a resubmit reads "already completed"
+GAME_SESSION_CONSUMED_TTL = 300
+
+# KEYS: session key, user's session index
+# ARGV: user_id, now (unix seconds), max age, session_id, consumed ttl
+# Checks ownership and age, then marks the session consumed — all or nothing,
+# so of two concurrent completes exactly one gets the session back.
+CONSUME_GAME_SESSION_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return {0, 'missing'}
+end
+local session = cjson.decode(raw)
+if session.consumed then
+    return {0, 'consumed'}
+end
+if tostring(session.user_id) ~= ARGV[1] then
+    return {0, 'forbidden'}
+end
+if session.started_ts and tonumber(ARGV[2]) - session.started_ts > tonumber(ARGV[3]) then
+    return {0, 'expired'}
+end
+redis.call('SET', KEYS[1], cjson.encode({consumed = true, user_id = session.user_id}), 'EX', ARGV[5])
+redis.call('ZREM', KEYS[2], ARGV[4])
+return {1, raw}
+"""
+
+_consume_game_session = None
+
+
+def _user_sessions_key(user_id) -> str:
+    return f"{GAME_SESSION_USER_PREFIX}{user_id}"
+
+
+def _index_game_session(pipe, session_id: int, user_id) -> None:
+    """Queue (re)indexing of a session under its user, expiring with the session"""
+    index_key = _user_sessions_key(user_id)
+    pipe.zadd(index_key, {str(session_id): time.time() + GAME_SESSION_TTL})
+    pipe.expire(index_key, GAME_SESSION_TTL)
 
 
 def store_game_session(session_id: int, user_id: int, level_id: int, data: dict = None) -> bool:
@@ -263,7 +670,7 @@ def store_game_session(session_id: int, user_id: int, level_id: int, data: dict
     Store active game session state in Redis.
     Used for anti-cheat validation and session recovery.
     """
-    if not redis_client:
+    if not redis_available():
         return False
 
     key = f"{GAME_SESSION_PREFIX}{session_id}"
@@ -271,11 +678,15 @@ def store_game_session(session_id: int, user_id: int, level_id: int, data: dict
         'user_id': user_id,
         'level_id': level_id,
         'started_at': datetime.utcnow().isoformat(),
+        'started_ts': time.time(),
         'data': data or {}
     }
 
     try:
-        redis_client.setex(key, GAME_SESSION_TTL, json.dumps(session_data))
+        pipe = redis_client.pipeline()
+        pipe.setex(key, GAME_SESSION_TTL, json.dumps(session_data))
+        _index_game_session(pipe, session_id, user_id)
+        pipe.execute()
         return True
     except Exception as e:
         print(f"Redis error storing game session: {e}")
@@ -284,7 +695,7 @@ def store_game_session(session_id: int, user_id: int, level_id: int, data: dict
 
 def get_game_session(session_id: int) -> dict | None:
     """Get game session state from Redis"""
-    if not redis_client:
+    if not redis_available():
         return None
 
     key = f"{GAME_SESSION_PREFIX}{session_id}"
@@ -298,7 +709,7 @@ def get_game_session(session_id: int) -> dict | None:
 
 def update_game_session(session_id: int, data: dict) -> bool:
     """Update game session state (e.g., current score, moves)"""
-    if not redis_client:
+    if not redis_available():
         return False
 
     key = f"{GAME_SESSION_PREFIX}{session_id}"
@@ -311,65 +722,192 @@ def update_game_session(session_id: int, data: dict) -> bool:
         session_data['data'].update(data)
         session_data['updated_at'] = datetime.utcnow().isoformat()
 
-        # Refresh TTL
-        redis_client.setex(key, GAME_SESSION_TTL, json.dumps(session_data))
+        # Refresh TTL (and the session's expiry in the user index)
+        pipe = redis_client.pipeline()
+        pipe.setex(key, GAME_SESSION_TTL, json.dumps(session_data))
+        _index_game_session(pipe, session_id, session_data['user_id'])
+        pipe.execute()
         return True
     except Exception as e:
         print(f"Redis error updating game session: {e}")
         return False
 
 
-def delete_game_session(session_id: int) -> bool:
-    """Delete game session after completion"""
-    if not redis_client:
+def delete_game_session(session_id: int, user_id: int = None) -> bool:
+    """Delete game session after completion
+
+    Pass user_id when known to save a read; otherwise it is taken from the
+    stored session so the per-user index can be cleaned up.
+    """
+    if not redis_available():
         return False
 
     key = f"{GAME_SESSION_PREFIX}{session_id}"
     try:
-        redis_client.delete(key)
+        if user_id is None:
+            session = get_game_session(session_id)
+            user_id = session['user_id'] if session else None
+
+        pipe = redis_client.pipeline()
+        pipe.delete(key)
+        if user_id is not None:
+            pipe.zrem(_user_sessions_key(user_id), str(session_id))
+        pipe.execute()
         return True
     except Exception:
         return False
 
 
-def validate_game_session(session_id: int, user_id: int) -> tuple[bool, str]:
+def consume_game_session(session_id: int, user_id: int) -> tuple[dict | None, str]:
     """
-    Validate game session for anti-cheat.
-    Returns (is_valid, error_message).
-    SECURITY: Fails CLOSED — if Redis is unavailable or session not found, reject.
+    Validate a game session for anti-cheat and mark it consumed, atomically.
+    Returns (session, error_message); session is the stored state (level_id,
+    data) on success, None otherwise.
+    Without Redis (or for a session Redis never got) the game_sessions row is
+    checked instead; the caller's is_completed guard then does the consuming.
     """
-    if not redis_client:
-        return False, "Game service temporarily unavailable. Please try again."
+    global _consume_game_session
+    if not redis_available():
+        return _check_game_session_row(session_id, user_id)
+
+    try:
+        if _consume_game_session is None:
+            _consume_game_session = redis_client.register_script(CONSUME_GAME_SESSION_SCRIPT)
+        ok, payload = _consume_game_session(
+            keys=[f"{GAME_SESSION_PREFIX}{session_id}", _user_sessions_key(user_id)],
+            args=[str(user_id), time.time(), GAME_SESSION_TTL, str(session_id), GAME_SESSION_CONSUMED_TTL],
+            client=redis_client,
+        )
+    except Exception as e:
+        print(f"Redis error consuming game session: {e}")
+        return _check_game_session_row(session_id, user_id)
+
+    if ok:
+        return json.loads(payload), ""
+
+    reason = payload.decode() if isinstance(payload, bytes) else payload
+    if reason == 'missing':
+        # Started while Redis was unavailable, or its consumed marker expired
+        return _check_game_session_row(session_id, user_id)
+    return None, _GAME_SESSION_ERRORS[reason]
+
+
+def get_active_sessions_count(user_id: int) -> int:
+    """Count active game sessions for a user (anti-cheat: detect multi-session abuse)
+
+    Reads the user's session index: expired entries are trimmed and the rest
+    counted in one round trip, independent of how many players are online.
+    Without Redis the user's open game_sessions rows are counted instead.
+    """
+    if not redis_available():
+        return _count_open_game_sessions(user_id)
+
+    index_key = _user_sessions_key(user_id)
+    try:
+        pipe = redis_client.pipeline()
+        pipe.zremrangebyscore(index_key, '-inf', time.time())
+        pipe.zcard(index_key)
+        return pipe.execute()[1]
+    except Exception as e:
+        print(f"Redis error counting game sessions: {e}")
+        return _count_open_game_sessions(user_id)
+
+
+# Degraded mode: the game_sessions rows hold everything the anti-cheat checks
+# need (owner, completion, start time), so a Redis outage slows games down
+# instead of blocking them.
+_GAME_SESSION_ERRORS = {
+    'consumed': "Session already completed",
+    'forbidden': "Session does not belong to this user",
+    'expired': "Session expired",
+    'missing': "Session expired or invalid. Please start a new game.",
+}
 
-    session = get_game_session(session_id)
+
+def _open_sessions_since():
+    return now_moscow() - timedelta(seconds=GAME_SESSION_TTL)
+
+
+def _check_game_session_row(session_id: int, user_id: int) -> tuple[dict | None, str]:
+    """consume_game_session() against the database (the row is not changed here)"""
+    from app import db
+    from app.models.game_session import GameSession
+
+    session = db.session.get(GameSession, session_id)
     if not session:
-        return False, "Session expired or invalid. Please start a new game."
+        return None, _GAME_SESSION_ERRORS['missing']
+    if session.is_completed:
+        return None, _GAME_SESSION_ERRORS['consumed']
+    if str(session.user_id) != str(user_id):
+        return None, _GAME_SESSION_ERRORS['forbidden']
+    if session.created_at and session.created_at < _open_sessions_since():
+        return None, _GAME_SESSION_ERRORS['expired']
+    return {'user_id': session.user_id, 'level_id': session.level_id, 'data': {}}, ""
 
-    if session['user_id'] != user_id:
-        return False, "Session does not belong to this user"
 
-    # Check if session is too old (more than 1 hour)
-    started_at = datetime.fromisoformat(session['started_at'])
-    elapsed = (datetime.utcnow() - started_at).total_seconds()
-    if elapsed > 3600:
-        return False, "Session expired"
+def _count_open_game_sessions(user_id: int) -> int:
+    """get_active_sessions_count() against the database"""
+    from app.models.game_session import GameSession
 
-    return True, ""
+    return GameSession.query.filter(
+        GameSession.user_id == user_id,
+        GameSession.is_completed == False,
+        GameSession.created_at >= _open_sessions_since()
+    ).count()
 
 
-def get_active_sessions_count(user_id: int) -> int:
-    """Count active game sessions for a user (anti-cheat: detect multi-session abuse)"""
-    if not redis_client:
-        return 999  # Fail closed: block new sessions if Redis unavailable
+# ==================== VERSIONED LOCAL CACHES ====================
+
+# Rarely changing data (level catalog, UI texts) is held in each worker's
+# memory. Writers INCR a version key in Redis; readers compare it at most every
+# LOCAL_CACHE_CHECK_INTERVAL seconds. Without Redis entries expire after
+# LOCAL_CACHE_MAX_AGE seconds instead.
+LOCAL_CACHE_CHECK_INTERVAL = 2
+LOCAL_CACHE_MAX_AGE = 60
+
+_local_cache_lock = threading.Lock()
+
 
-    count = 0
+def _read_version(version_key: str) -> int | None:
+    if not redis_available():
+        return None
     try:
-        for key in redis_client.scan_iter(f"{GAME_SESSION_PREFIX}*"):
-            data = redis_client.get(key)
-            if data:
-                session = json.loads(data)
-                if session.get('user_id') == user_id:
-                    count += 1
-    except Exception:
-        pass
-    return count
+        return int(redis_client.get(version_key) or 0)
+    except Exception as e:
+        print(f"Redis error reading {version_key}: {e}")
+        return None
+
+
+def get_versioned(name: str, version_key: str, loader):
+    """This worker's copy of `loader()`, rebuilt when `version_key` moves.
+
+    Entries live in app.extensions, so each app instance has its own.
+    """
+    extensions = current_app.extensions
+    entry = extensions.get(name)
+    now = time.monotonic()
+
+    if entry and now - entry['checked_at'] < LOCAL_CACHE_CHECK_INTERVAL:
+        return entry['value']
+
+    version = _read_version(version_key)
+    if entry:
+        fresh = (
+            version == entry['version'] if version is not None
+            else entry['version'] is None and now - entry['loaded_at'] < LOCAL_CACHE_MAX_AGE
+        )
+        if fresh:
+            entry['checked_at'] = now
+            return entry['value']
+
+    with _local_cache_lock:
+        current = extensions.get(name)
+        if current is not entry and current is not None:
+            return current['value']  # another thread reloaded meanwhile
+        extensions[name] = {
+            'value': loader(),
+            'version': version,
+            'loaded_at': now,
+            'checked_at': now,
+        }
+    return extensions[name]['value']
@@ -0,0 +1,33 @@
+"""
+Blind search index tokens (user_search_tokens): hashed prefixes and trigrams
+of encrypted fields, so they can be searched without decrypting them.
+"""
+import hashlib
+import os
+
+SEARCH_NGRAM = 3
+
+
+def _search_token(kind: str, text: str) -> int:
+    digest = hashlib.sha256(f"{os.environ.get('HASH_PEPPER', '')}:search:{kind}:{text}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def search_tokens(*values: str) -> set:
+    """Peppered hashes of each value's 1-2 char prefixes and trigrams (user_search_tokens)."""
+    tokens = set()
+    for value in values:
+        text = (value or '').lower().strip()
+        for size in range(1, min(len(text), SEARCH_NGRAM - 1) + 1):
+            tokens.add(_search_token('p', text[:size]))
+        for i in range(len(text) - SEARCH_NGRAM + 1):
+            tokens.add(_search_token('g', text[i:i + SEARCH_NGRAM]))
+    return tokens
+
+
+def query_tokens(query: str) -> set:
+    """Tokens a value must have to contain query (or start with it, for 1-2 chars)."""
+    text = (query or '').lower().strip()
+    if len(text) < SEARCH_NGRAM:
+        return {_search_token('p', text)} if text else set()
+    return {_search_token('g', text[i:i + SEARCH_NGRAM]) for i in range(len(text) - SEARCH_NGRAM + 1)}
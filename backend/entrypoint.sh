@@ -25,6 +25,18 @@ with app.app_context():
     print("Tables ready!")
 EOF
 
+# Keep monthly user_activities partitions ahead of time and drop expired ones
+flask activity-partitions
+
+# Index users missing from the admin user search index
+flask search-index
+
+# Log token revocations stored only as per-token keys (from before the blocklist log)
+flask jwt-blocklist-backfill
+
+# Recount promo pool usage (claims update it lazily)
+flask promo-reconcile
+
 # Start the application
 echo "Starting Flask application..."
 exec gunicorn --bind 0.0.0.0:5000 --workers 2 --threads 4 --timeout 60 "app:create_app()"
@@ -0,0 +1,42 @@
+"""Add denormalized completed_levels / total_stars counters to users.
+
+The global leaderboard used to run a COUNT and a SUM over user_level_progress
+for every row it rendered. The counters are now kept on users by
+complete_game, so a leaderboard build is a single query.
+
+Revision ID: 014_user_progress_counters
+Revises: 013_add_ip_hash_to_landing_visits
+Create Date: 2026-10-16
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '014_user_progress_counters'
+down_revision = '013_add_ip_hash_to_landing_visits'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS completed_levels INTEGER NOT NULL DEFAULT 0"))
+    op.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS total_stars INTEGER NOT NULL DEFAULT 0"))
+
+    # Backfill from existing progress in one pass
+    op.execute(text("""
+        UPDATE users u
+        SET completed_levels = s.completed_levels,
+            total_stars = s.total_stars
+        FROM (
+            SELECT user_id,
+                   COUNT(completed_at) AS completed_levels,
+                   COALESCE(SUM(stars), 0) AS total_stars
+            FROM user_level_progress
+            GROUP BY user_id
+        ) s
+        WHERE s.user_id = u.id
+    """))
+
+
+def downgrade():
+    op.execute(text("ALTER TABLE users DROP COLUMN IF EXISTS total_stars"))
+    op.execute(text("ALTER TABLE users DROP COLUMN IF EXISTS completed_levels"))
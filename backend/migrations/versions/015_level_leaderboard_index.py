@@ -0,0 +1,24 @@
+"""Add (level_id, best_score DESC) index for per-level leaderboards.
+
+Revision ID: 015_level_leaderboard_index
+Revises: 014_user_progress_counters
+Create Date: 2026-10-16
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '015_level_leaderboard_index'
+down_revision = '014_user_progress_counters'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_user_level_progress_level_best_score
+        ON user_level_progress (level_id, best_score DESC)
+    """))
+
+
+def downgrade():
+    op.execute(text("DROP INDEX IF EXISTS ix_user_level_progress_level_best_score"))
@@ -0,0 +1,33 @@
+"""Add covering (total_score, id) indexes for keyset-paginated leaderboards.
+
+Revision ID: 016_users_leaderboard_index
+Revises: 015_level_leaderboard_index
+Create Date: 2026-10-16
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '016_users_leaderboard_index'
+down_revision = '015_level_leaderboard_index'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_users_leaderboard
+        ON users (total_score, id)
+        INCLUDE (username, city, completed_levels, total_stars)
+        WHERE is_verified AND total_score > 0
+    """))
+    op.execute(text("""
+        CREATE INDEX IF NOT EXISTS ix_users_city_leaderboard
+        ON users (city, total_score, id)
+        INCLUDE (username, completed_levels, total_stars)
+        WHERE is_verified AND total_score > 0
+    """))
+
+
+def downgrade():
+    op.execute(text("DROP INDEX IF EXISTS ix_users_city_leaderboard"))
+    op.execute(text("DROP INDEX IF EXISTS ix_users_leaderboard"))
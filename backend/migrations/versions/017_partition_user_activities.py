@@ -0,0 +1,135 @@
+"""Partition user_activities by month on created_at.
+
+Turns user_activities into a RANGE-partitioned table with one partition per
+month (plus a DEFAULT partition as a safety net), so retention can drop whole
+months and time-window queries only touch the matching partitions. The
+primary key becomes (id, created_at), as Postgres requires the partition key
+in it; ids keep coming from the same sequence. On a fresh database the table
+is created partitioned, with partitions from this month on.
+
+Later months are created ahead of time by
+app.services.activity_log.maintain_activity_partitions().
+
+Revision ID: 017_partition_user_activities
+Revises: 016_users_leaderboard_index
+Create Date: 2026-10-16
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '017_partition_user_activities'
+down_revision = '016_users_leaderboard_index'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def _is_partitioned(conn) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT FROM pg_partitioned_table WHERE partrelid = 'user_activities'::regclass)"
+    )).scalar()
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        return
+
+    # A fresh database has no user_activities yet: create it partitioned
+    # right away, or db.create_all() would make a plain one later
+    fresh = not conn.execute(text("SELECT to_regclass('user_activities')")).scalar()
+    if not fresh and _is_partitioned(conn):
+        return
+
+    if fresh:
+        op.execute(text("CREATE SEQUENCE IF NOT EXISTS user_activities_id_seq AS INTEGER"))
+        oldest = "NULL"
+    else:
+        op.execute(text("LOCK TABLE user_activities IN ACCESS EXCLUSIVE MODE"))
+        op.execute(text("ALTER TABLE user_activities RENAME TO user_activities_legacy"))
+        op.execute(text("ALTER TABLE user_activities_legacy RENAME CONSTRAINT user_activities_pkey TO user_activities_legacy_pkey"))
+        oldest = "(SELECT MIN(created_at) FROM user_activities_legacy)"
+
+    # users comes from db.create_all() on a fresh database; the foreign key is
+    # then added by maintain_activity_partitions() (flask activity-partitions)
+    users_fk = ""
+    if conn.execute(text("SELECT to_regclass('users')")).scalar():
+        users_fk = "REFERENCES users(id) ON DELETE CASCADE"
+
+    op.execute(text(f"""
+        CREATE TABLE user_activities (
+            id INTEGER NOT NULL DEFAULT nextval('user_activities_id_seq'::regclass),
+            user_id INTEGER {users_fk},
+            action VARCHAR(50) NOT NULL,
+            metadata JSON,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+
+    # One partition per month from the oldest row to MONTHS_AHEAD months from now
+    months = conn.execute(text(f"""
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE({oldest}, now()), now())),
+            date_trunc('month', now()) + interval '{MONTHS_AHEAD} months',
+            interval '1 month'
+        )::date
+    """)).scalars().all()
+    for month in months:
+        op.execute(text(f"""
+            CREATE TABLE user_activities_p{month:%Y%m} PARTITION OF user_activities
+            FOR VALUES FROM ('{month}') TO ('{month}'::date + interval '1 month')
+        """))
+    op.execute(text("CREATE TABLE user_activities_default PARTITION OF user_activities DEFAULT"))
+
+    if not fresh:
+        op.execute(text("""
+            INSERT INTO user_activities (id, user_id, action, metadata, ip_address, user_agent, created_at)
+            SELECT id, user_id, action, metadata, ip_address, user_agent, COALESCE(created_at, now())
+            FROM user_activities_legacy
+        """))
+
+    # Keep the id sequence alive when the old table goes
+    op.execute(text("ALTER SEQUENCE user_activities_id_seq OWNED BY user_activities.id"))
+    if not fresh:
+        op.execute(text("DROP TABLE user_activities_legacy"))
+
+    # Partitioned indexes: each month gets its own small index
+    op.execute(text("CREATE INDEX ix_user_activities_user_id ON user_activities (user_id)"))
+    op.execute(text("CREATE INDEX ix_user_activities_created_at ON user_activities (created_at)"))
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql' or not _is_partitioned(conn):
+        return
+
+    op.execute(text("ALTER TABLE user_activities RENAME TO user_activities_partitioned"))
+    op.execute(text("ALTER INDEX ix_user_activities_user_id RENAME TO ix_user_activities_partitioned_user_id"))
+    op.execute(text("ALTER INDEX ix_user_activities_created_at RENAME TO ix_user_activities_partitioned_created_at"))
+    op.execute(text("ALTER TABLE user_activities_partitioned RENAME CONSTRAINT user_activities_pkey TO user_activities_partitioned_pkey"))
+
+    op.execute(text("""
+        CREATE TABLE user_activities (
+            id INTEGER NOT NULL DEFAULT nextval('user_activities_id_seq'::regclass) PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+            action VARCHAR(50) NOT NULL,
+            metadata JSON,
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    op.execute(text("""
+        INSERT INTO user_activities (id, user_id, action, metadata, ip_address, user_agent, created_at)
+        SELECT id, user_id, action, metadata, ip_address, user_agent, created_at
+        FROM user_activities_partitioned
+    """))
+    op.execute(text("ALTER SEQUENCE user_activities_id_seq OWNED BY user_activities.id"))
+    op.execute(text("DROP TABLE user_activities_partitioned"))
+
+    op.execute(text("CREATE INDEX ix_user_activities_user_id ON user_activities (user_id)"))
+    op.execute(text("CREATE INDEX ix_user_activities_created_at ON user_activities (created_at)"))
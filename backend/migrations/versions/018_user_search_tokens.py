@@ -0,0 +1,31 @@
+"""Add user_search_tokens, a blind search index over encrypted emails and usernames.
+
+Rows are filled by the app on every email/username change; existing users
+are backfilled by `flask search-index` (run from the entrypoint).
+
+Revision ID: 018_user_search_tokens
+Revises: 017_partition_user_activities
+Create Date: 2026-10-16
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '018_user_search_tokens'
+down_revision = '017_partition_user_activities'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(text("""
+        CREATE TABLE IF NOT EXISTS user_search_tokens (
+            token BIGINT NOT NULL,
+            user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            PRIMARY KEY (token, user_id)
+        )
+    """))
+    op.execute(text("CREATE INDEX IF NOT EXISTS ix_user_search_tokens_user_id ON user_search_tokens (user_id)"))
+
+
+def downgrade():
+    op.execute(text("DROP TABLE IF EXISTS user_search_tokens"))
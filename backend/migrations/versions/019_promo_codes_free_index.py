@@ -0,0 +1,26 @@
+"""Add ix_promo_codes_free, a partial index over unclaimed promo codes.
+
+Claims take the first free code of a pool with FOR UPDATE SKIP LOCKED; the
+index keeps that an index range scan however many codes are already used.
+
+Revision ID: 019_promo_codes_free_index
+Revises: 018_user_search_tokens
+Create Date: 2026-10-17
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = '019_promo_codes_free_index'
+down_revision = '018_user_search_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_promo_codes_free ON promo_codes (pool_id, id) WHERE is_used IS NOT TRUE"
+    ))
+
+
+def downgrade():
+    op.execute(text("DROP INDEX IF EXISTS ix_promo_codes_free"))
@@ -29,6 +29,7 @@ def app():
         'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
         'JWT_SECRET_KEY': 'test-secret-key',
         'WTF_CSRF_ENABLED': False,
+        'ACTIVITY_LOG_BUFFERED': False,
     })
 
     with app.app_context():
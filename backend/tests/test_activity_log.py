@@ -0,0 +1,100 @@
+import pytest
+from flask import request
+from sqlalchemy.exc import OperationalError
+from app.models.user_activity import UserActivity, log_activity
+from app.services import activity_log
+
+
+@pytest.fixture
+def buffered(app, monkeypatch):
+    """Buffered logging with the background flusher disabled (flushed by hand)"""
+    monkeypatch.setattr(activity_log, '_ensure_flusher', lambda app: None)
+    monkeypatch.setattr(activity_log, '_buffer', activity_log.deque())
+    app.config['ACTIVITY_LOG_BUFFERED'] = True
+    return app
+
+
+class TestBufferedActivityLog:
+    """Tests for the buffered activity log writer"""
+
+    def test_events_written_on_flush(self, buffered, verified_user):
+        """Test that queued events reach the table in one flush"""
+        with buffered.test_request_context(headers={'User-Agent': 'pytest'}):
+            for level_id in range(3):
+                log_activity(verified_user.id, 'start_game', {'level_id': level_id}, request)
+
+        assert UserActivity.query.count() == 0
+        assert activity_log.flush_activity_log() == 3
+
+        activities = UserActivity.query.order_by(UserActivity.id).all()
+        assert [a.activity_data['level_id'] for a in activities] == [0, 1, 2]
+        assert activities[0].user_agent == 'pytest'
+
+    def test_full_buffer_drops_events(self, buffered, verified_user, monkeypatch):
+        """Test that a full buffer drops new events instead of growing"""
+        monkeypatch.setattr(activity_log, 'ACTIVITY_BUFFER_MAX', 2)
+        for _ in range(3):
+            log_activity(verified_user.id, 'login')
+
+        assert activity_log.flush_activity_log() == 2
+
+    def test_transient_error_requeues_batch(self, buffered, verified_user, monkeypatch):
+        """Test that a batch refused by a lost connection is retried, not dropped"""
+        monkeypatch.setattr(activity_log, '_retry', {'attempts': 0, 'not_before': 0.0})
+        for _ in range(3):
+            log_activity(verified_user.id, 'login_failed')
+
+        write = activity_log._write
+
+        def connection_lost(model, batch):
+            raise OperationalError('INSERT', {}, Exception('server closed the connection'))
+
+        monkeypatch.setattr(activity_log, '_write', connection_lost)
+        assert activity_log.flush_activity_log() == 0
+        assert len(activity_log._buffer) == 3
+
+        monkeypatch.setattr(activity_log, '_write', write)
+        assert activity_log.flush_activity_log() == 0  # still backing off
+        activity_log._retry['not_before'] = 0.0
+        assert activity_log.flush_activity_log() == 3
+        assert activity_log._retry['attempts'] == 0
+
+    def test_bad_row_only_loses_itself(self, buffered, verified_user):
+        """Test that a batch with a row the database rejects is written row by row"""
+        log_activity(verified_user.id, 'login')
+        log_activity(verified_user.id, None)  # action is NOT NULL
+        log_activity(verified_user.id, 'login_failed')
+
+        assert activity_log.flush_activity_log() == 2
+        assert [a.action for a in UserActivity.query.order_by(UserActivity.id)] == ['login', 'login_failed']
+
+
+class TestActivityPartitions:
+    """Tests for monthly partition maintenance"""
+
+    def test_add_months_crosses_years(self):
+        """Test month arithmetic used for partition bounds"""
+        from datetime import date
+        assert activity_log._add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+        assert activity_log._add_months(date(2026, 1, 1), -12) == date(2025, 1, 1)
+
+    def test_maintenance_noop_without_partitions(self, app):
+        """Test that maintenance leaves a non-partitioned table alone"""
+        assert activity_log.maintain_activity_partitions() == {'created': [], 'dropped': []}
+
+
+class TestAccountDeletion:
+    """Tests for activity log anonymization on /api/auth/delete-account"""
+
+    def test_queued_events_scrubbed(self, buffered, client, verified_user, auth_header):
+        """Test that events still queued when the account is deleted are written without IP/UA"""
+        with buffered.test_request_context(headers={'User-Agent': 'pytest'}):
+            log_activity(verified_user.id, 'login', None, request)
+
+        response = client.post('/api/auth/delete-account', headers=auth_header)
+        assert response.status_code == 200
+        assert activity_log.flush_activity_log() >= 1
+
+        activities = UserActivity.query.filter_by(user_id=verified_user.id).all()
+        assert activities and all(a.ip_address is None and a.user_agent is None for a in activities)
+        assert verified_user.username == f'deleted_{verified_user.id}'
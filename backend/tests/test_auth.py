@@ -1,6 +1,9 @@
+import time
 import pytest
 from app import db
 from app.models.user import User
+from app.utils import redis_cache
+from flask_jwt_extended import decode_token
 
 
 class TestRegister:
@@ -110,6 +113,17 @@ class TestLogin:
         response = client.post('/api/auth/login', json={})
         assert response.status_code == 400
 
+    def test_login_rate_limit_headers(self, client):
+        """Test that login attempts past the limit get a 429 with Retry-After"""
+        for remaining in range(4, -1, -1):
+            response = client.post('/api/auth/login', json={})
+            assert response.headers['X-RateLimit-Limit'] == '5'
+            assert response.headers['X-RateLimit-Remaining'] == str(remaining)
+
+        response = client.post('/api/auth/login', json={})
+        assert response.status_code == 429
+        assert 0 < int(response.headers['Retry-After']) <= 12
+
 
 class TestVerify:
     """Tests for /api/auth/verify endpoint"""
@@ -181,3 +195,31 @@ class TestLogout:
         """Test logout without auth"""
         response = client.post('/api/auth/logout')
         assert response.status_code == 401
+
+    def test_logout_revokes_token(self, client, auth_header):
+        """Test that the token stops working after logout"""
+        client.post('/api/auth/logout', headers=auth_header)
+        response = client.get('/api/auth/me', headers=auth_header)
+        assert response.status_code == 401
+
+    def test_revocation_from_another_worker(self, client, app, auth_header, monkeypatch):
+        """Test that a revocation logged by another worker is picked up on the next sync"""
+        assert client.get('/api/auth/me', headers=auth_header).status_code == 200
+
+        # Another worker revokes: only Redis knows about it
+        jti = decode_token(auth_header['Authorization'].split()[1])['jti']
+        redis_cache.get_redis().zadd(redis_cache.JWT_BLOCKLIST_LOG_KEY, {jti: time.time()})
+
+        monkeypatch.setattr(redis_cache, 'JWT_BLOCKLIST_SYNC_INTERVAL', 0)
+        assert client.get('/api/auth/me', headers=auth_header).status_code == 401
+
+    def test_revocation_from_before_the_log(self, client, app, auth_header, monkeypatch):
+        """Test that tokens revoked as per-token keys only are blocked after the backfill"""
+        jti = decode_token(auth_header['Authorization'].split()[1])['jti']
+        redis_cache.get_redis().setex(f"{redis_cache.JWT_BLOCKLIST_PREFIX}{jti}", 3600, "1")
+
+        assert redis_cache.backfill_blocklist_log() == 1
+        assert redis_cache.backfill_blocklist_log() == 0
+
+        monkeypatch.setattr(redis_cache, 'JWT_BLOCKLIST_SYNC_INTERVAL', 0)
+        assert client.get('/api/auth/me', headers=auth_header).status_code == 401
@@ -3,6 +3,9 @@ from app import db
 from app.models.game_session import GameSession
 from app.models.user_progress import UserLevelProgress
 from app.models.user import User
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.utils import redis_cache
+from app.utils.redis_cache import store_game_session, get_game_session
 
 
 class TestStartGame:
@@ -24,6 +27,19 @@ class TestStartGame:
         assert 'level' in data
         assert data['level']['name'] == 'Test Level'
 
+    def test_start_game_session_limit(self, client, auth_header, sample_level):
+        """Test that a fourth concurrent session is refused"""
+        for _ in range(3):
+            response = client.post('/api/game/start',
+                                   json={'level_id': sample_level.id},
+                                   headers=auth_header)
+            assert response.status_code == 200
+
+        response = client.post('/api/game/start',
+                               json={'level_id': sample_level.id},
+                               headers=auth_header)
+        assert response.status_code == 429
+
     def test_start_game_missing_level_id(self, client, auth_header):
         """Test starting game without level_id"""
         response = client.post('/api/game/start', json={}, headers=auth_header)
@@ -94,6 +110,36 @@ class TestCompleteGame:
         assert data['is_won'] is False
         assert data['stars'] == 0
 
+    def test_complete_game_updates_user_totals(self, client, app, auth_header, sample_level, verified_user):
+        """Test that only improvements on the best score reach the user's totals"""
+        def play(score, drumsticks):
+            start_response = client.post('/api/game/start',
+                                         json={'level_id': sample_level.id},
+                                         headers=auth_header)
+            response = client.post('/api/game/complete', json={
+                'session_id': start_response.get_json()['session_id'],
+                'score': score,
+                'moves_used': 30,
+                'duration_seconds': 120,
+                'targets_met': {'collect': {'drumstick': drumsticks}}
+            }, headers=auth_header)
+            assert response.status_code == 200
+
+        play(150, 5)   # win
+        play(50, 0)    # loss — keeps the best
+        play(250, 5)   # better win
+
+        progress = UserLevelProgress.query.filter_by(
+            user_id=verified_user.id, level_id=sample_level.id
+        ).one()
+        assert progress.attempts_count == 3
+        assert progress.best_score == 250
+
+        user = db.session.get(User, verified_user.id)
+        assert user.total_score == 250
+        assert user.completed_levels == 1
+        assert user.total_stars == progress.stars
+
     def test_complete_game_missing_session(self, client, auth_header):
         """Test completing nonexistent session"""
         response = client.post('/api/game/complete', json={
@@ -125,6 +171,22 @@ class TestCompleteGame:
         assert response.status_code == 400
         assert 'already completed' in response.get_json()['error']
 
+    def test_complete_game_other_users_session(self, client, app, auth_header, sample_level, unverified_user):
+        """Test that another user's session is refused and left usable for its owner"""
+        session = GameSession(user_id=unverified_user.id, level_id=sample_level.id)
+        db.session.add(session)
+        db.session.commit()
+        store_game_session(session.id, unverified_user.id, sample_level.id)
+
+        response = client.post('/api/game/complete', json={
+            'session_id': session.id,
+            'score': 100
+        }, headers=auth_header)
+
+        assert response.status_code == 400
+        assert 'does not belong' in response.get_json()['error']
+        assert 'consumed' not in get_game_session(session.id)
+
     def test_complete_game_moves_bonus(self, client, auth_header, sample_level):
         """Test that remaining moves give bonus points"""
         start_response = client.post('/api/game/start',
@@ -145,6 +207,82 @@ class TestCompleteGame:
         assert data['moves_bonus'] == 20 * 50  # 1000 bonus
         assert data['score'] == 100 + 1000
 
+    def test_complete_game_deleted_user(self, client, auth_header, sample_level, verified_user):
+        """Test that a session whose user is gone gets a 404, not a server error"""
+        start_response = client.post('/api/game/start',
+                                     json={'level_id': sample_level.id},
+                                     headers=auth_header)
+        session_id = start_response.get_json()['session_id']
+        db.session.execute(db.delete(User).where(User.id == verified_user.id))
+        db.session.commit()
+
+        response = client.post('/api/game/complete', json={
+            'session_id': session_id,
+            'score': 100
+        }, headers=auth_header)
+
+        assert response.status_code == 404
+        assert response.get_json()['error'] == 'User not found'
+
+
+
+class TestGameWithoutRedis:
+    """Tests for game sessions checked against the database when Redis is down"""
+
+    @pytest.fixture(params=['unavailable', 'erroring'])
+    def no_redis(self, request, monkeypatch):
+        """Redis skipped by the circuit breaker, or failing on every command"""
+        class FailingClient:
+            def __getattr__(self, name):
+                def fail(*args, **kwargs):
+                    raise RedisConnectionError()
+                return fail
+
+        client = None if request.param == 'unavailable' else FailingClient()
+        monkeypatch.setattr(redis_cache, 'redis_client', client)
+        monkeypatch.setattr(redis_cache, '_consume_game_session', None)
+        monkeypatch.setattr(redis_cache, 'REDIS_BREAKER_FAILURES', 10 ** 6)
+
+    def test_play_without_redis(self, client, auth_header, sample_level, no_redis):
+        """Test that a game can be started and completed once without Redis"""
+        start_response = client.post('/api/game/start',
+                                     json={'level_id': sample_level.id},
+                                     headers=auth_header)
+        assert start_response.status_code == 200
+        session_id = start_response.get_json()['session_id']
+
+        payload = {'session_id': session_id, 'score': 100, 'moves_used': 10}
+        response = client.post('/api/game/complete', json=payload, headers=auth_header)
+        assert response.status_code == 200
+
+        response = client.post('/api/game/complete', json=payload, headers=auth_header)
+        assert response.status_code == 400
+        assert 'already completed' in response.get_json()['error']
+
+    def test_session_limit_without_redis(self, client, auth_header, sample_level, no_redis):
+        """Test that open sessions are counted from the database without Redis"""
+        for _ in range(3):
+            response = client.post('/api/game/start',
+                                   json={'level_id': sample_level.id},
+                                   headers=auth_header)
+            assert response.status_code == 200
+
+        response = client.post('/api/game/start',
+                               json={'level_id': sample_level.id},
+                               headers=auth_header)
+        assert response.status_code == 429
+
+    def test_other_users_session_without_redis(self, client, app, auth_header, sample_level,
+                                               unverified_user, no_redis):
+        """Test that another user's session is refused without Redis"""
+        session = GameSession(user_id=unverified_user.id, level_id=sample_level.id)
+        db.session.add(session)
+        db.session.commit()
+
+        response = client.post('/api/game/complete', json={'session_id': session.id}, headers=auth_header)
+        assert response.status_code == 400
+        assert 'does not belong' in response.get_json()['error']
+
 
 class TestCheckTargetsMet:
     """Test the check_targets_met helper function"""
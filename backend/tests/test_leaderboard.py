@@ -1,4 +1,5 @@
 import pytest
+from sqlalchemy import event
 from app import db
 from app.models.user import User
 from app.models.user_progress import UserLevelProgress
@@ -77,6 +78,188 @@ class TestGlobalLeaderboard:
         assert len(data['leaderboard']) == 3
         assert data['leaderboard'][0]['total_score'] == 500
 
+    def test_leaderboard_row_fields(self, client, app, verified_user):
+        """Test that completed levels and stars come from the user counters"""
+        verified_user.total_score = 900
+        verified_user.completed_levels = 3
+        verified_user.total_stars = 7
+        db.session.commit()
+
+        row = client.get('/api/leaderboard').get_json()['leaderboard'][0]
+        assert row['completed_levels'] == 3
+        assert row['total_stars'] == 7
+
+    def test_leaderboard_query_count_independent_of_limit(self, client, app):
+        """Test that building the leaderboard does not issue a query per row"""
+        for i in range(20):
+            user = User(
+                email=f'bulk{i}@example.com',
+                username=f'bulk{i}',
+                is_verified=True,
+                total_score=(i + 1) * 10
+            )
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+        client.get('/api/leaderboard')  # warm-up
+
+        statements = []
+
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        try:
+            counts = []
+            for limit in (2, 20):
+                statements.clear()
+                response = client.get(f'/api/leaderboard?limit={limit}')
+                assert len(response.get_json()['leaderboard']) == limit
+                counts.append(len(statements))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+        assert counts[0] == counts[1]
+        assert counts[1] <= 2
+
+    def test_leaderboard_cursor_pages(self, client, app):
+        """Test walking the board with next_cursor, including tied scores"""
+        for i in range(7):
+            user = User(
+                email=f'page{i}@example.com',
+                username=f'page{i}',
+                is_verified=True,
+                total_score=300 if i < 4 else 100 * (i - 3)
+            )
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+
+        rows, cursor = [], None
+        while True:
+            url = '/api/leaderboard?limit=3' + (f'&cursor={cursor}' if cursor else '')
+            data = client.get(url).get_json()
+            rows.extend(data['leaderboard'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        assert [row['rank'] for row in rows] == list(range(1, 8))
+        assert len({row['user_id'] for row in rows}) == 7
+        keys = [(row['total_score'], row['user_id']) for row in rows]
+        assert keys == sorted(keys, reverse=True)
+
+    def test_leaderboard_tied_scores_match_sql_order(self, client, app, monkeypatch):
+        """Test that ties are listed by id descending, so a cursor stays valid on the SQL fallback"""
+        from app.services import leaderboard as live_leaderboard
+
+        for i in range(12):  # ids past 9, where string order would differ
+            user = User(
+                email=f'tie{i}@example.com',
+                username=f'tie{i}',
+                is_verified=True,
+                total_score=300
+            )
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+
+        first = client.get('/api/leaderboard?limit=5').get_json()
+        monkeypatch.setattr(live_leaderboard, 'get_top', lambda *args: None)
+        rows, cursor = first['leaderboard'], first['next_cursor']
+        while cursor:
+            data = client.get(f'/api/leaderboard?limit=5&cursor={cursor}').get_json()
+            rows.extend(data['leaderboard'])
+            cursor = data['next_cursor']
+
+        assert [row['user_id'] for row in rows] == list(range(12, 0, -1))
+        assert [row['rank'] for row in rows] == list(range(1, 13))
+
+    def test_leaderboard_skips_stale_members(self, client, app, monkeypatch):
+        """Test that pages stay full and densely ranked past members that can't be shown"""
+        from app.services import leaderboard as live_leaderboard
+        from app.utils.redis_cache import get_redis
+
+        for i in range(6):
+            user = User(
+                email=f'page{i}@example.com',
+                username=f'page{i}',
+                is_verified=True,
+                total_score=(i + 1) * 100
+            )
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+        client.get('/api/leaderboard')  # builds the boards
+
+        # A member with no meta and no ranked user behind it, at the end of the first page
+        get_redis().zadd(live_leaderboard._board_key('global'), {live_leaderboard._member(999): 450})
+
+        def all_pages():
+            rows, cursor = [], ''
+            while cursor is not None:
+                data = client.get(f'/api/leaderboard?limit=3&cursor={cursor}').get_json()
+                assert data['next_cursor'] is None or len(data['leaderboard']) == 3
+                rows.extend(data['leaderboard'])
+                cursor = data['next_cursor']
+            return rows
+
+        live_rows = all_pages()
+        monkeypatch.setattr(live_leaderboard, 'get_top', lambda *args: None)
+        assert live_rows == all_pages()
+        assert [row['rank'] for row in live_rows] == list(range(1, 7))
+
+    def test_leaderboard_invalid_cursor(self, client):
+        """Test that a malformed cursor is rejected"""
+        response = client.get('/api/leaderboard?cursor=abc')
+        assert response.status_code == 400
+
+
+class TestLiveBoardRebuild:
+    """Tests for rebuilding the Redis boards from Postgres"""
+
+    def test_evicted_board_rebuilt(self, client, app, verified_user):
+        """Test that a board evicted while the ready flag survives is rebuilt, not served empty"""
+        from app.services import leaderboard as live_leaderboard
+        from app.utils.redis_cache import get_redis
+
+        verified_user.total_score = 500
+        db.session.commit()
+        assert len(client.get('/api/leaderboard').get_json()['leaderboard']) == 1
+
+        get_redis().delete(live_leaderboard._board_key('global'))
+        assert len(client.get('/api/leaderboard').get_json()['leaderboard']) == 1
+
+    def test_update_during_rebuild_kept(self, app, verified_user, monkeypatch):
+        """Test that a score pushed between the rebuild's snapshot and its swap survives"""
+        from types import SimpleNamespace
+        from app.services import leaderboard as live_leaderboard
+
+        verified_user.total_score = 100
+        db.session.commit()
+
+        class Snapshot(list):
+            def order_by(self, *args):
+                return self
+
+            def yield_per(self, count):
+                return iter(self)
+
+        def stale_snapshot():
+            rows = Snapshot(
+                SimpleNamespace(id=u.id, total_score=u.total_score, city=u.city, username=u.username,
+                                completed_levels=u.completed_levels, total_stars=u.total_stars)
+                for u in User.query.filter(User.is_verified == True, User.total_score > 0)
+            )
+            verified_user.total_score = 900
+            db.session.commit()
+            live_leaderboard.update_user_score(verified_user)
+            return rows
+
+        monkeypatch.setattr(live_leaderboard, '_ranked_users_query', stale_snapshot)
+        assert live_leaderboard.rebuild_leaderboards() == 1
+        assert [row['total_score'] for row in live_leaderboard.get_top('global', 10)] == [900]
+
 
 class TestWeeklyLeaderboard:
     """Tests for /api/leaderboard/weekly endpoint"""
@@ -106,6 +289,121 @@ class TestWeeklyLeaderboard:
         assert len(data['leaderboard']) == 1
         assert data['leaderboard'][0]['weekly_score'] == 500
 
+    def test_weekly_leaderboard_cursor_pages(self, client, app, sample_level):
+        """Test paging the weekly board with next_cursor"""
+        for i in range(5):
+            user = User(
+                email=f'weekly{i}@example.com',
+                username=f'weekly{i}',
+                is_verified=True
+            )
+            user.set_password('password')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(GameSession(
+                user_id=user.id,
+                level_id=sample_level.id,
+                score=(i + 1) * 100,
+                is_completed=True,
+                is_won=True,
+                created_at=now_moscow()
+            ))
+        db.session.commit()
+
+        first = client.get('/api/leaderboard/weekly?limit=3').get_json()
+        assert [row['weekly_score'] for row in first['leaderboard']] == [500, 400, 300]
+
+        second = client.get(
+            f"/api/leaderboard/weekly?limit=3&cursor={first['next_cursor']}"
+        ).get_json()
+        assert [row['weekly_score'] for row in second['leaderboard']] == [200, 100]
+        assert [row['rank'] for row in second['leaderboard']] == [4, 5]
+        assert second['next_cursor'] is None
+
+
+    def test_weekly_leaderboard_ranks_match_sql(self, client, app, sample_level, monkeypatch):
+        """Test that unverified players on the weekly set leave no gaps in the ranks"""
+        from app.services import leaderboard as live_leaderboard
+
+        for i in range(5):
+            user = User(
+                email=f'dense{i}@example.com',
+                username=f'dense{i}',
+                is_verified=i != 2
+            )
+            user.set_password('password')
+            db.session.add(user)
+            db.session.flush()
+            db.session.add(GameSession(
+                user_id=user.id,
+                level_id=sample_level.id,
+                score=(i + 1) * 100,
+                is_completed=True,
+                is_won=True,
+                created_at=now_moscow()
+            ))
+        db.session.commit()
+
+        def all_pages():
+            rows, cursor = [], ''
+            while cursor is not None:
+                data = client.get(f'/api/leaderboard/weekly?limit=2&cursor={cursor}').get_json()
+                rows.extend(data['leaderboard'])
+                cursor = data['next_cursor']
+            return rows
+
+        live_rows = all_pages()
+        monkeypatch.setattr(live_leaderboard, 'get_weekly_top', lambda *args: None)
+        assert live_rows == all_pages()
+        assert [(row['rank'], row['weekly_score']) for row in live_rows] == [(1, 500), (2, 400), (3, 200), (4, 100)]
+
+class TestWeeklyBoardRebuild:
+    """Tests for rebuilding a week's Redis board from game_sessions"""
+
+    @pytest.fixture
+    def won_session(self, app, verified_user, sample_level):
+        session = GameSession(
+            user_id=verified_user.id,
+            level_id=sample_level.id,
+            score=300,
+            is_completed=True,
+            is_won=True,
+            created_at=now_moscow()
+        )
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    def test_evicted_weekly_board_rebuilt(self, client, won_session):
+        """Test that a weekly board evicted while its ready flag survives is rebuilt"""
+        from app.services import leaderboard as live_leaderboard
+        from app.utils.redis_cache import get_redis
+
+        assert len(client.get('/api/leaderboard/weekly').get_json()['leaderboard']) == 1
+
+        get_redis().delete(live_leaderboard._weekly_keys(live_leaderboard.week_start())[0])
+        assert len(client.get('/api/leaderboard/weekly').get_json()['leaderboard']) == 1
+
+    def test_session_during_rebuild_kept(self, app, verified_user, sample_level, won_session, monkeypatch):
+        """Test that a session recorded while the week is being rebuilt survives the swap"""
+        from app.services import leaderboard as live_leaderboard
+        from app.utils.redis_cache import get_redis
+
+        redis_client = get_redis()
+        write_batch = redis_client.register_script(live_leaderboard.WEEKLY_REBUILD_BATCH_SCRIPT)
+
+        def batch_after_new_session(**kwargs):
+            # Committed after the snapshot query: only the live update carries it
+            live_leaderboard.record_weekly_score(verified_user.id, sample_level.id, 700)
+            return write_batch(**kwargs)
+
+        monkeypatch.setattr(live_leaderboard, '_weekly_rebuild_batch', batch_after_new_session)
+        monkeypatch.setattr(live_leaderboard, '_weekly_swap',
+                            redis_client.register_script(live_leaderboard.WEEKLY_SWAP_SCRIPT))
+
+        assert live_leaderboard.rebuild_weekly() == 1
+        assert [row['weekly_score'] for row in live_leaderboard.get_weekly_top(10)] == [700]
+
 
 class TestMyRank:
     """Tests for /api/leaderboard/my-rank endpoint"""
@@ -148,3 +446,94 @@ class TestMyRank:
         data = response.get_json()
         assert data['rank'] == 4
         assert data['total_players'] == 4
+
+    def test_my_rank_for_requested_city(self, client, auth_header, app, verified_user):
+        """Test rank among another city's players in the same call"""
+        verified_user.total_score = 500
+        verified_user.city = 'region'
+        db.session.commit()
+
+        for i, score in enumerate((400, 600, 700)):
+            u = User(
+                email=f'msk{i}@example.com',
+                username=f'msk{i}',
+                is_verified=True,
+                city='moscow',
+                total_score=score
+            )
+            u.set_password('password')
+            db.session.add(u)
+        db.session.commit()
+
+        response = client.get('/api/leaderboard/my-rank?city=moscow', headers=auth_header)
+        data = response.get_json()
+        assert data['rank'] == 3
+        assert data['regional_rank'] == 1
+        assert data['regional_total_players'] == 1
+        assert data['city_rank'] == {'city': 'moscow', 'rank': 3, 'total_players': 3}
+
+
+class TestAroundMe:
+    """Tests for /api/leaderboard/around-me endpoint"""
+
+    def test_around_me_no_auth(self, client):
+        """Test getting neighbours without auth"""
+        response = client.get('/api/leaderboard/around-me')
+        assert response.status_code == 401
+
+    def test_around_me_window(self, client, auth_header, app, verified_user):
+        """Test that the window holds the players right above and below"""
+        verified_user.total_score = 500
+        verified_user.city = 'moscow'
+        db.session.commit()
+
+        for i, (score, city) in enumerate([(900, 'region'), (800, 'moscow'), (700, 'moscow'),
+                                           (400, 'region'), (300, 'moscow'), (200, 'moscow')]):
+            u = User(
+                email=f'near{i}@example.com',
+                username=f'near{i}',
+                is_verified=True,
+                city=city,
+                total_score=score
+            )
+            u.set_password('password')
+            db.session.add(u)
+        db.session.commit()
+
+        response = client.get('/api/leaderboard/around-me?radius=1', headers=auth_header)
+        assert response.status_code == 200
+        data = response.get_json()
+
+        assert data['global']['rank'] == 4
+        assert [r['total_score'] for r in data['global']['leaderboard']] == [700, 500, 400]
+        assert [r['rank'] for r in data['global']['leaderboard']] == [3, 4, 5]
+
+        assert data['regional']['city'] == 'moscow'
+        assert data['regional']['rank'] == 3
+        assert [r['total_score'] for r in data['regional']['leaderboard']] == [700, 500, 300]
+
+    def test_around_me_unranked(self, client, auth_header, app, verified_user):
+        """Test that a player without points gets an empty window"""
+        response = client.get('/api/leaderboard/around-me', headers=auth_header)
+        data = response.get_json()
+        assert data['global'] == {'rank': None, 'leaderboard': []}
+
+    def test_tied_rank_matches_around_me(self, client, auth_header, app, verified_user):
+        """Test that a tied player gets the same rank from /my-rank and /around-me"""
+        verified_user.total_score = 500
+        db.session.commit()
+
+        for i in range(2):
+            u = User(
+                email=f'tied{i}@example.com',
+                username=f'tied{i}',
+                is_verified=True,
+                total_score=500
+            )
+            u.set_password('password')
+            db.session.add(u)
+        db.session.commit()
+
+        my_rank = client.get('/api/leaderboard/my-rank', headers=auth_header).get_json()
+        around = client.get('/api/leaderboard/around-me?radius=0', headers=auth_header).get_json()
+        assert my_rank['rank'] == around['global']['rank'] == 3
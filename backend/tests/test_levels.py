@@ -2,6 +2,9 @@ import pytest
 from app import db
 from app.models.level import Level
 from app.models.user_progress import UserLevelProgress
+from app.services import level_catalog
+from app.utils import redis_cache
+from app.utils.redis_cache import get_redis
 
 
 class TestGetLevels:
@@ -39,6 +42,28 @@ class TestGetLevels:
         assert len(data['levels']) == 1
         assert data['levels'][0]['name'] == 'Test Level'
 
+    def test_get_levels_reloads_after_version_bump(self, client, app, sample_level, monkeypatch):
+        """Test that the level catalog picks up admin edits once the version key moves"""
+        monkeypatch.setattr(redis_cache, 'LOCAL_CACHE_CHECK_INTERVAL', 0)
+        assert client.get('/api/levels').get_json()['levels'][0]['name'] == 'Test Level'
+
+        sample_level.name = 'Renamed Level'
+        db.session.commit()
+        assert client.get('/api/levels').get_json()['levels'][0]['name'] == 'Test Level'
+
+        get_redis().incr(level_catalog.LEVEL_CATALOG_VERSION_KEY)
+        assert client.get('/api/levels').get_json()['levels'][0]['name'] == 'Renamed Level'
+
+    def test_get_levels_etag_not_modified(self, client, sample_level):
+        """Test that a matching If-None-Match gets a bodyless 304"""
+        response = client.get('/api/levels')
+        etag = response.headers['ETag']
+        assert 'public' in response.headers['Cache-Control']
+
+        response = client.get('/api/levels', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+
 
 class TestGetLevel:
     """Tests for /api/levels/<id> endpoint"""
@@ -86,6 +111,23 @@ class TestLevelLeaderboard:
         assert data['leaderboard'][0]['score'] == 500
         assert data['leaderboard'][0]['stars'] == 3
 
+    def test_level_leaderboard_ranks_skip_unverified(self, client, app, sample_level,
+                                                     verified_user, unverified_user):
+        """Test that unverified players are dropped without leaving rank gaps"""
+        db.session.add_all([
+            UserLevelProgress(user_id=unverified_user.id, level_id=sample_level.id,
+                              best_score=900, stars=3),
+            UserLevelProgress(user_id=verified_user.id, level_id=sample_level.id,
+                              best_score=400, stars=1),
+        ])
+        db.session.commit()
+
+        response = client.get(f'/api/levels/{sample_level.id}/leaderboard')
+        data = response.get_json()
+        assert len(data['leaderboard']) == 1
+        assert data['leaderboard'][0]['rank'] == 1
+        assert data['leaderboard'][0]['username'] == 'testuser'
+
 
 class TestUserProgress:
     """Tests for /api/levels/user/progress endpoint"""
@@ -0,0 +1,174 @@
+import pytest
+from app import db
+from app.models.quest_page import QuestPage
+from app.services import quest_catalog
+from app.utils import redis_cache
+from app.utils.redis_cache import get_redis
+
+
+@pytest.fixture
+def quest_pages(app):
+    """Create three active quest pages and one inactive"""
+    pages = [
+        QuestPage(slug=f'page-{i}', order=i, title=f'Page {i}', riddle_text='?',
+                  qr_token=f'token-{i}', points=40, is_active=i < 3)
+        for i in range(4)
+    ]
+    db.session.add_all(pages)
+    db.session.commit()
+    return pages
+
+
+class TestQuestScan:
+    """Tests for /api/quest/scan"""
+
+    def test_guest_scan(self, client, quest_pages):
+        """Test that a guest scan validates the token without saving"""
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-1'})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['page_slug'] == 'page-1'
+        assert 'qr_token' not in data['page']
+
+    def test_inactive_page_rejected(self, client, quest_pages):
+        """Test that an inactive page's token is not accepted"""
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-3'})
+        assert response.status_code == 400
+
+    def test_scan_in_order(self, client, auth_header, quest_pages):
+        """Test that scans must follow page order and advance the current step"""
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-1'}, headers=auth_header)
+        assert response.status_code == 400
+        assert response.get_json()['expected_order'] == 0
+
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-0'}, headers=auth_header)
+        assert response.status_code == 200
+        assert response.get_json()['next_page_slug'] == 'page-1'
+
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-0'}, headers=auth_header)
+        assert response.get_json()['already_completed'] is True
+
+
+class TestQuestCatalog:
+    """Tests for the in-process quest page catalog"""
+
+    def test_reloads_after_version_bump(self, app, quest_pages, monkeypatch):
+        """Test that page edits show up once the admin bumps the version"""
+        monkeypatch.setattr(redis_cache, 'LOCAL_CACHE_CHECK_INTERVAL', 0)
+
+        assert len(quest_catalog.get_quest_catalog().pages) == 3
+        quest_pages[3].is_active = True
+        db.session.commit()
+        assert len(quest_catalog.get_quest_catalog().pages) == 3
+
+        get_redis().incr(quest_catalog.QUEST_CATALOG_VERSION_KEY)
+        catalog = quest_catalog.get_quest_catalog()
+        assert [p.slug for p in catalog.pages] == ['page-0', 'page-1', 'page-2', 'page-3']
+        assert catalog.by_qr_token['token-3'].slug == 'page-3'
+
+
+class TestQuestProgressBitmap:
+    """Tests for the per-user quest progress bitmap"""
+
+    def test_skip_then_scan_next(self, client, auth_header, quest_pages):
+        """Test that skipping and scanning move the current step through the bitmap"""
+        response = client.post('/api/quest/skip', headers=auth_header)
+        assert response.get_json()['next_page_slug'] == 'page-1'
+
+        response = client.post('/api/quest/scan', json={'qr_token': 'token-1'}, headers=auth_header)
+        assert response.status_code == 200
+        assert response.get_json()['next_page_slug'] == 'page-2'
+
+    def test_rebuilt_from_quest_progress(self, app, verified_user, quest_pages):
+        """Test that a missing or stale bitmap is rebuilt from quest_progress rows"""
+        from app.models.quest_progress import QuestProgress
+        from app.services.quest_progress import load_quest_state, invalidate_quest_state
+
+        db.session.add(QuestProgress(user_id=verified_user.id, quest_page_id=quest_pages[0].id))
+        db.session.commit()
+        invalidate_quest_state(verified_user.id)
+
+        catalog = quest_catalog.get_quest_catalog()
+        state = load_quest_state(verified_user.id, catalog)
+        assert state.is_answered(catalog.by_slug['page-0'])
+        assert state.current_page().slug == 'page-1'
+        assert state.current_page(answered=catalog.by_slug['page-1']).slug == 'page-2'
+        assert load_quest_state(verified_user.id, catalog).mask == state.mask
+
+
+class TestPromoDispenser:
+    """Tests for promo code claims and pool counters"""
+
+    @pytest.fixture
+    def promo_pool(self, app):
+        from app.models.promo_code import PromoCodePool, PromoCode
+
+        pool = PromoCodePool(name='Gold', tier='gold', min_score=0, total_codes=3, used_codes=0)
+        db.session.add(pool)
+        db.session.flush()
+        db.session.add_all([
+            PromoCode(pool_id=pool.id, code=f'CODE{i}', code_hash=f'hash-{i}',
+                      is_used=None if i == 1 else False)
+            for i in range(3)
+        ])
+        db.session.commit()
+        return pool
+
+    def test_claims_each_code_once(self, app, verified_user, promo_pool):
+        """Test that codes are dispensed in order, NULL counting as free, until the pool is empty"""
+        from app.services.promo_dispenser import take_promo_code
+
+        claimed = []
+        for _ in range(4):
+            code = take_promo_code(promo_pool, verified_user.id)
+            db.session.commit()
+            claimed.append(code and code.code)
+        assert claimed == ['CODE0', 'CODE1', 'CODE2', None]
+
+    def test_reconcile_counts_used_codes(self, app, verified_user, promo_pool):
+        """Test that used_codes is recounted from the codes, not incremented"""
+        from app.services.promo_dispenser import take_promo_code, reconcile_pool_counters
+
+        take_promo_code(promo_pool, verified_user.id)
+        take_promo_code(promo_pool)
+        db.session.commit()
+        assert promo_pool.used_codes == 0
+
+        reconcile_pool_counters([promo_pool.id])
+        assert promo_pool.used_codes == 2
+        assert promo_pool.remaining_codes == 1
+
+    def test_claims_recounted_in_background(self, app, verified_user, promo_pool, monkeypatch):
+        """Test that a claim only marks its pool dirty and the reconciler recounts it"""
+        from app.services import promo_dispenser
+
+        monkeypatch.setattr(promo_dispenser, '_ensure_reconciler', lambda app: None)
+        promo_dispenser.take_promo_code(promo_pool, verified_user.id)
+        db.session.commit()
+        promo_dispenser.record_claim(promo_pool.id)
+        assert promo_pool.used_codes == 0
+
+        assert promo_dispenser.reconcile_dirty_pools() == 1
+        assert promo_pool.used_codes == 1
+        assert promo_dispenser.reconcile_dirty_pools() == 0
+
+    def test_failed_recount_retried(self, app, verified_user, promo_pool, monkeypatch):
+        """Test that pools whose recount fails stay dirty for the next run"""
+        from app.services import promo_dispenser
+
+        monkeypatch.setattr(promo_dispenser, '_ensure_reconciler', lambda app: None)
+        promo_dispenser.take_promo_code(promo_pool, verified_user.id)
+        db.session.commit()
+        promo_dispenser.record_claim(promo_pool.id)
+
+        def fail(pool_ids):
+            raise RuntimeError('database down')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(promo_dispenser, 'reconcile_pool_counters', fail)
+            assert promo_dispenser.reconcile_dirty_pools() == 0
+
+        if get_redis():
+            get_redis().delete(promo_dispenser.PROMO_RECONCILE_LOCK_KEY)  # the failed run's
+        assert promo_dispenser.reconcile_dirty_pools() == 1
+        assert promo_pool.used_codes == 1
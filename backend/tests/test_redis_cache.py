@@ -0,0 +1,267 @@
+import json
+import threading
+import time
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+from app.utils import redis_cache
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """Fresh circuit breaker state with a stand-in client"""
+    monkeypatch.setattr(redis_cache, '_breaker', {'state': redis_cache.BREAKER_CLOSED, 'failures': 0, 'opened_at': 0.0})
+    monkeypatch.setattr(redis_cache, 'redis_client', object())
+    return redis_cache._breaker
+
+
+class TestLocalRateLimit:
+    """Tests for the in-process fallback limiter"""
+
+    def test_local_limit_without_redis(self, app, monkeypatch):
+        """Test that limits still apply per worker when Redis is unavailable"""
+        monkeypatch.setattr(redis_cache, 'redis_client', None)
+
+        results = [redis_cache.check_rate_limit('local-test', 3, 60) for _ in range(4)]
+        assert [allowed for allowed, *_ in results] == [True, True, True, False]
+        assert results[3][3] > 0  # retry_after
+
+    def test_local_buckets_bounded(self, app, monkeypatch):
+        """Test that the least recently used buckets are evicted"""
+        monkeypatch.setattr(redis_cache, 'redis_client', None)
+        monkeypatch.setattr(redis_cache, 'LOCAL_RATE_LIMIT_MAX_KEYS', 5)
+
+        for i in range(10):
+            redis_cache.check_rate_limit(f'ip-{i}', 3, 60)
+        assert len(app.extensions['local_rate_limits']) == 5
+
+
+class TestCircuitBreaker:
+    """Tests for the Redis circuit breaker"""
+
+    def test_opens_after_consecutive_failures(self, breaker):
+        """Test that Redis is skipped once the failure threshold is reached"""
+        for _ in range(redis_cache.REDIS_BREAKER_FAILURES):
+            assert redis_cache.redis_available()
+            redis_cache._record_redis_error(RedisConnectionError())
+
+        assert breaker['state'] == redis_cache.BREAKER_OPEN
+        assert not redis_cache.redis_available()
+        assert redis_cache.get_redis() is None
+
+    def test_ignores_command_errors(self, breaker):
+        """Test that non-connection errors do not count as failures"""
+        for _ in range(redis_cache.REDIS_BREAKER_FAILURES):
+            redis_cache._record_redis_error(ValueError())
+        assert redis_cache.redis_available()
+
+    def test_half_open_probe_closes_on_success(self, breaker, monkeypatch):
+        """Test that one probe is let through after the cooldown"""
+        for _ in range(redis_cache.REDIS_BREAKER_FAILURES):
+            redis_cache._record_redis_error(RedisConnectionError())
+        monkeypatch.setattr(redis_cache, 'REDIS_BREAKER_COOLDOWN', 0)
+
+        assert redis_cache.redis_available()  # the probe
+        assert breaker['state'] == redis_cache.BREAKER_HALF_OPEN
+        redis_cache._record_redis_success()
+        assert breaker['state'] == redis_cache.BREAKER_CLOSED
+
+    def test_lost_probe_reopens(self, breaker, monkeypatch):
+        """Test that a probe nobody reports back on is given up after the probe timeout"""
+        for _ in range(redis_cache.REDIS_BREAKER_FAILURES):
+            redis_cache._record_redis_error(RedisConnectionError())
+        monkeypatch.setattr(redis_cache, 'REDIS_BREAKER_COOLDOWN', 0)
+        assert redis_cache.redis_available()  # the probe, never reported
+        assert not redis_cache.redis_available()
+
+        monkeypatch.setattr(redis_cache, 'REDIS_BREAKER_PROBE_TIMEOUT', 0)
+        assert redis_cache.redis_available()  # a new probe
+        assert breaker['state'] == redis_cache.BREAKER_HALF_OPEN
+
+    def test_client_reports_outcomes(self, breaker):
+        """Test that commands sent through the client itself close or open the breaker"""
+        class StubClient:
+            fail = True
+
+            def execute_command(self, *args, **options):
+                if self.fail:
+                    raise RedisConnectionError()
+                return b'PONG'
+
+            def pipeline(self, *args, **kwargs):
+                return self
+
+            def execute(self):
+                return [self.execute_command()]
+
+        client = redis_cache._track_outcomes(StubClient())
+        for _ in range(redis_cache.REDIS_BREAKER_FAILURES):
+            with pytest.raises(RedisConnectionError):
+                client.execute_command('PING')
+        assert breaker['state'] == redis_cache.BREAKER_OPEN
+
+        client.fail = False
+        assert client.pipeline().execute() == [b'PONG']
+        assert breaker['state'] == redis_cache.BREAKER_CLOSED
+
+
+class MemoryRedis:
+    """Thread-safe stand-in for the few commands the leaderboard cache uses"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and time.monotonic() >= expires:
+            del self.data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self.lock:
+            return self._live(key)
+
+    def mget(self, *keys):
+        with self.lock:
+            return [self._live(key) for key in keys]
+
+    def incr(self, key):
+        with self.lock:
+            value = int(self._live(key) or 0) + 1
+            self.data[key] = (value, None)
+            return value
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            if nx and self._live(key) is not None:
+                return None
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value, ex=ttl)
+
+    def delete(self, key):
+        with self.lock:
+            return int(self.data.pop(key, None) is not None)
+
+
+@pytest.fixture
+def cache(breaker, monkeypatch):
+    """Leaderboard cache backed by a MemoryRedis"""
+    client = MemoryRedis()
+    monkeypatch.setattr(redis_cache, 'redis_client', client)
+    return client
+
+
+def _store(client, full_key, data, age):
+    client.set(full_key, json.dumps({'built_at': time.time() - age, 'data': data}))
+
+
+class TestLeaderboardCache:
+    """Tests for get_or_build_leaderboard single-flight and stale serving"""
+
+    def test_concurrent_cold_misses_build_once(self, cache):
+        """Test that readers of a cold key wait for one build instead of all building"""
+        builds = []
+        start = threading.Barrier(8)
+        results = []
+
+        def builder():
+            builds.append(1)
+            time.sleep(0.2)
+            return ['fresh']
+
+        def reader():
+            start.wait()
+            results.append(redis_cache.get_or_build_leaderboard('global', builder))
+
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(builds) == 1
+        assert sorted(results) == [(['fresh'], False)] + [(['fresh'], True)] * 7
+        assert cache.get(f"{redis_cache.LEADERBOARD_PREFIX}lock:{redis_cache.LEADERBOARD_PREFIX}v0:global") is None
+
+    def test_serves_stale_while_rebuilding(self, cache):
+        """Test that an expired value is served while another worker holds the lock"""
+        full_key = f"{redis_cache.LEADERBOARD_PREFIX}v0:global"
+        _store(cache, full_key, ['old'], age=120)
+        cache.set(f"{redis_cache.LEADERBOARD_PREFIX}lock:{full_key}", 1)
+
+        def builder():
+            raise AssertionError('only the lock holder rebuilds')
+
+        assert redis_cache.get_or_build_leaderboard('global', builder, soft_ttl=60) == (['old'], True)
+
+    def test_serves_previous_generation_while_rebuilding(self, cache):
+        """Test that after a generation bump the last generation's value is served meanwhile"""
+        _store(cache, f"{redis_cache.LEADERBOARD_PREFIX}v0:global", ['old'], age=0)
+        cache.set(redis_cache.LEADERBOARD_VERSION_KEY, 1)
+        cache.set(f"{redis_cache.LEADERBOARD_PREFIX}lock:{redis_cache.LEADERBOARD_PREFIX}v1:global", 1)
+
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['new']) == (['old'], True)
+
+    def test_serves_stale_if_rebuild_fails(self, cache):
+        """Test that the previous value is served and the lock released when builder() raises"""
+        full_key = f"{redis_cache.LEADERBOARD_PREFIX}v0:global"
+        _store(cache, full_key, ['old'], age=120)
+
+        def builder():
+            raise RuntimeError('database down')
+
+        assert redis_cache.get_or_build_leaderboard('global', builder, soft_ttl=60) == (['old'], True)
+        assert cache.get(f"{redis_cache.LEADERBOARD_PREFIX}lock:{full_key}") is None
+
+    def test_expired_lock_lets_next_reader_rebuild(self, cache, monkeypatch):
+        """Test that a lock left by a crashed worker only holds rebuilds off until it expires"""
+        monkeypatch.setattr(redis_cache, 'LEADERBOARD_LOCK_TTL', 0.1)
+        full_key = f"{redis_cache.LEADERBOARD_PREFIX}v0:global"
+        _store(cache, full_key, ['old'], age=120)
+        cache.set(f"{redis_cache.LEADERBOARD_PREFIX}lock:{full_key}", 1, ex=redis_cache.LEADERBOARD_LOCK_TTL)
+
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['new'], soft_ttl=60) == (['old'], True)
+        time.sleep(0.15)
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['new'], soft_ttl=60) == (['new'], False)
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['newer'], soft_ttl=60) == (['new'], True)
+
+    def test_cold_reader_builds_after_lock_wait(self, cache, monkeypatch):
+        """Test that a cold reader stops waiting on a lock holder after LEADERBOARD_LOCK_WAIT"""
+        monkeypatch.setattr(redis_cache, 'LEADERBOARD_LOCK_WAIT', 0.2)
+        cache.set(f"{redis_cache.LEADERBOARD_PREFIX}lock:{redis_cache.LEADERBOARD_PREFIX}v0:global", 1)
+
+        started = time.monotonic()
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['own']) == (['own'], False)
+        assert 0.2 <= time.monotonic() - started < 1
+
+
+class TestLeaderboardVersion:
+    """Tests for the coalesced cache generation bumps"""
+
+    def test_burst_bumps_once_then_trails(self, cache, monkeypatch):
+        """Test that bumps held back by the interval are applied once on a read after it"""
+        monkeypatch.setattr(redis_cache, 'LEADERBOARD_REFRESH_INTERVAL', 0.1)
+
+        assert redis_cache.bump_leaderboard_version()
+        assert not redis_cache.bump_leaderboard_version()
+        assert not redis_cache.bump_leaderboard_version()
+        assert redis_cache._current_leaderboard_version() == 1
+
+        time.sleep(0.15)
+        assert redis_cache._current_leaderboard_version() == 2
+        assert redis_cache._current_leaderboard_version() == 2
+
+    def test_trailing_bump_rebuilds_board(self, cache, monkeypatch):
+        """Test that a change suppressed by the interval reaches the cached board"""
+        monkeypatch.setattr(redis_cache, 'LEADERBOARD_REFRESH_INTERVAL', 0.1)
+        redis_cache.bump_leaderboard_version()
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['old']) == (['old'], False)
+
+        assert not redis_cache.bump_leaderboard_version()
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['new']) == (['old'], True)
+        time.sleep(0.15)
+        assert redis_cache.get_or_build_leaderboard('global', lambda: ['new']) == (['new'], False)
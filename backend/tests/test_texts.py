@@ -0,0 +1,39 @@
+import pytest
+from app import db
+from app.models.game_text import GameText
+
+
+@pytest.fixture
+def sample_texts(app):
+    """Create texts in two sections"""
+    db.session.add_all([
+        GameText(key='game_title', section='game', label='Title', value='Легенды'),
+        GameText(key='quest_intro', section='quest', label='Intro', value='Привет'),
+    ])
+    db.session.commit()
+
+
+class TestGetTexts:
+    """Tests for /api/texts endpoint"""
+
+    def test_get_texts_all(self, client, sample_texts):
+        """Test getting texts of every section"""
+        response = client.get('/api/texts')
+        assert response.status_code == 200
+        assert response.get_json() == {'game_title': 'Легенды', 'quest_intro': 'Привет'}
+
+    def test_get_texts_by_section(self, client, sample_texts):
+        """Test filtering texts by section"""
+        response = client.get('/api/texts?section=quest')
+        assert response.get_json() == {'quest_intro': 'Привет'}
+
+        response = client.get('/api/texts?section=unknown')
+        assert response.get_json() == {}
+
+    def test_get_texts_etag_not_modified(self, client, sample_texts):
+        """Test that a matching If-None-Match gets a 304"""
+        etag = client.get('/api/texts?section=game').headers['ETag']
+
+        response = client.get('/api/texts?section=game', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert client.get('/api/texts?section=quest').headers['ETag'] != etag
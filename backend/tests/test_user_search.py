@@ -0,0 +1,38 @@
+from app import db
+from app.models.user_search_token import UserSearchToken
+from app.services.user_search import backfill_user_search
+from app.utils.search_index import query_tokens
+
+
+def _tokens(user_id):
+    return set(db.session.scalars(db.select(UserSearchToken.token).where(UserSearchToken.user_id == user_id)))
+
+
+class TestUserSearchIndex:
+    """Tests for the user_search_tokens blind index"""
+
+    def test_new_user_indexed(self, app, verified_user):
+        """Test that email and username substrings and prefixes are indexed"""
+        tokens = _tokens(verified_user.id)
+        assert query_tokens('EXAMPLE.com') <= tokens
+        assert query_tokens('stuse') <= tokens
+        assert query_tokens('te') <= tokens
+        assert not query_tokens('nobody') <= tokens
+
+    def test_reindexed_on_change(self, app, verified_user):
+        """Test that changing the email replaces the old tokens"""
+        verified_user.set_email('renamed@mail.ru')
+        db.session.commit()
+
+        tokens = _tokens(verified_user.id)
+        assert query_tokens('mail.ru') <= tokens
+        assert not query_tokens('example') <= tokens
+
+    def test_backfill_missing_users(self, app, verified_user):
+        """Test that the backfill indexes users that have no tokens"""
+        db.session.execute(db.delete(UserSearchToken))
+        db.session.commit()
+
+        assert backfill_user_search() == 1
+        assert query_tokens('example') <= _tokens(verified_user.id)
+        assert backfill_user_search() == 0